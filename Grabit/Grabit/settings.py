@@ -44,21 +44,52 @@ INSTALLED_APPS = [
 
 AUTH_USER_MODEL = 'grabit_app.CustomUser'
 
+AUTHENTICATION_BACKENDS = ['grabit_app.backends.RateLimitedModelBackend']
+
+# Reverse proxies in front of the app (addresses or networks, e.g. the nginx front end). A request
+# arriving from one of them is attributed to the client it names in X-Forwarded-For, so the login
+# throttle (grabit_app/ratelimit.py) counts real clients rather than the proxy.
+TRUSTED_PROXIES = [proxy.strip() for proxy in os.environ.get('TRUSTED_PROXIES', '').split(',') if proxy.strip()]
+
+# New passwords are hashed with PASSWORD_HASHER (scrypt, or argon2 with argon2-cffi installed);
+# the others stay listed so older hashes still verify and are upgraded at their next login.
+# Tune with ARGON2_PARAMS / SCRYPT_PARAMS, see grabit_app/hashers.py.
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'scrypt')
+_PASSWORD_HASHERS = {
+    'argon2': 'grabit_app.hashers.Argon2PasswordHasher',
+    'scrypt': 'grabit_app.hashers.ScryptPasswordHasher',
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+}
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASHER]] + [
+    hasher for name, hasher in _PASSWORD_HASHERS.items() if name != PASSWORD_HASHER
+] + ['django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher']
+
 MIDDLEWARE = [
+    'grabit_app.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'grabit_app.replicas.PinToPrimaryMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
 ROOT_URLCONF = 'Grabit.urls'
 
+# Request metrics (grabit_app/metrics.py): a Server-Timing header on every response, Prometheus
+# summaries per view at /metrics/ for METRICS_ALLOWED_IPS and staff, and a warning on the
+# grabit_app.slow_queries logger, with SQL and stack, for each query over SLOW_QUERY_MS.
+# Client addresses are resolved through TRUSTED_PROXIES: behind a local reverse proxy, list it
+# there, or every request would arrive from 127.0.0.1 and be allowed.
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '1') == '1'
+METRICS_ALLOWED_IPS = os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+SLOW_QUERY_MS = int(os.environ.get('SLOW_QUERY_MS', 200))
+
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'grabit_app.metrics.TimedDjangoTemplates',
         'DIRS': [
             BASE_DIR/ 'templates'
         ],
@@ -76,17 +107,116 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'Grabit.wsgi.application'
+ASGI_APPLICATION = 'Grabit.asgi.application'
+
+# Route home, product and productList to grabit_app.async_views (asgi.py turns this on).
+ASYNC_CATALOG_VIEWS = os.environ.get('ASYNC_CATALOG_VIEWS', '0') == '1'
 
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE=postgres for production (POSTGRES_* variables). Connections are pooled with
+# DB_POOL=1 (psycopg 3 pool, DB_POOL_MIN/DB_POOL_MAX) or kept open for CONN_MAX_AGE seconds.
+# SQLite otherwise: WAL, a busy timeout and synchronous=NORMAL on every new connection so
+# concurrent writers queue instead of failing with "database is locked"; SQLITE_TUNING=0
+# restores SQLite's defaults (e.g. to benchmark the difference).
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgres':
+    DB_POOL = os.environ.get('DB_POOL', '1') == '1'
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'grabit'),
+            'USER': os.environ.get('POSTGRES_USER', 'grabit'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            # Persistent connections and the pool are mutually exclusive in Django.
+            'CONN_MAX_AGE': 0 if DB_POOL else int(os.environ.get('CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.environ.get('DB_POOL_MIN', 2)),
+                    'max_size': int(os.environ.get('DB_POOL_MAX', 10)),
+                    'timeout': 10,
+                },
+            } if DB_POOL else {},
+        }
     }
-}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                # Seconds a writer waits for the lock before giving up.
+                'timeout': 20,
+                # Take the write lock at BEGIN, so a read transaction never has to upgrade and deadlock.
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    'PRAGMA busy_timeout=20000;'
+                    'PRAGMA temp_store=MEMORY;'
+                ),
+            } if os.environ.get('SQLITE_TUNING', '1') == '1' else {},
+        }
+    }
+
+# Read replicas for catalog browsing (see grabit_app/replicas.py): REPLICA_SQLITE_PATHS, a
+# comma-separated list of SQLite files refreshed with `manage.py sync_sqlite_replicas`, or
+# POSTGRES_REPLICA_HOSTS for streaming replicas of the primary.
+REPLICA_LOCATIONS = [
+    location for location in os.environ.get(
+        'POSTGRES_REPLICA_HOSTS' if DB_ENGINE == 'postgres' else 'REPLICA_SQLITE_PATHS', ''
+    ).split(',') if location
+]
+DATABASE_REPLICAS = []
+for number, location in enumerate(REPLICA_LOCATIONS, 1):
+    alias = f'replica_{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST' if DB_ENGINE == 'postgres' else 'NAME': location,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['grabit_app.replicas.ReplicaRouter']
+
+# Cache
+# Local memory by default; set REDIS_URL to share the cache between processes.
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'grabit',
+        }
+    }
+
+# Product search backend: SQLite FTS5 locally, swap for another BaseSearchBackend in production.
+SEARCH_BACKEND = (
+    'grabit_app.search.SQLiteFTSBackend' if DB_ENGINE == 'sqlite' else 'grabit_app.search.DatabaseSearchBackend'
+)
+
+# Product image pipeline: resized renditions are generated by background worker threads in the
+# web process, or by `manage.py process_image_jobs` when IMAGE_PIPELINE_IN_PROCESS is off.
+IMAGE_PIPELINE_IN_PROCESS = os.environ.get('IMAGE_PIPELINE_IN_PROCESS', '1') == '1'
+IMAGE_PIPELINE_WORKERS = int(os.environ.get('IMAGE_PIPELINE_WORKERS', 2))
+
+# Units given to each product that predates stock tracking when migration 0020 creates its Stock
+# row; without one a product can't be ordered. Sellers correct the figure in the admin.
+STOCK_BACKFILL = int(os.environ.get('STOCK_BACKFILL', 100))
 
 
 # Password validation
@@ -129,6 +259,28 @@ MEDIA_URL = 'media/'
 STATICFILES_DIRS = [
     BASE_DIR / 'static/'
 ]
+
+# `manage.py collectstatic` is the asset build: content-hashed names, .br/.gz copies of text
+# files and .avif/.webp versions of PNGs (grabit_app/assets.py). With SERVE_STATIC on, Django
+# serves them itself from STATIC_ROOT; hashed names are immutable for a year, other names are
+# cached for STATIC_MAX_AGE seconds.
+STATIC_ROOT = os.environ.get('STATIC_ROOT', BASE_DIR / 'staticfiles')
+STORAGES = {
+    'default': {'BACKEND': 'grabit_app.media.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'grabit_app.assets.CompressedManifestStorage'},
+}
+SERVE_STATIC = os.environ.get('SERVE_STATIC', '0' if DEBUG else '1') == '1'
+STATIC_MAX_AGE = int(os.environ.get('STATIC_MAX_AGE', 60))
+
+# Uploads are stored once per distinct content (grabit_app/media.py) and served by Django from
+# MEDIA_ROOT, with sendfile where the server offers it and Range support. Set MEDIA_ACCEL to
+# 'x-accel-redirect' (nginx, an internal location at MEDIA_ACCEL_PREFIX aliased to MEDIA_ROOT)
+# or 'x-sendfile' (Apache/lighttpd) to have the front end send the bytes. Directories outside
+# MEDIA_PUBLIC_DIRS, such as store verification documents, are only served to staff.
+MEDIA_ACCEL = os.environ.get('MEDIA_ACCEL', '')
+MEDIA_ACCEL_PREFIX = os.environ.get('MEDIA_ACCEL_PREFIX', '/protected-media/')
+MEDIA_PUBLIC_DIRS = ('Product_images', 'Store_logo', 'renditions')
+MEDIA_MAX_AGE = int(os.environ.get('MEDIA_MAX_AGE', 60 * 60))
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 # Default primary key field type
@@ -1,12 +1,15 @@
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
+from grabit_app import assets, media
 
 urlpatterns = [
     path('jet/', include('jet.urls', 'jet')),
     path('admin/', admin.site.urls),
+    # assets.serve answers 404 unless SERVE_STATIC is on (runserver serves static files itself in DEBUG).
+    re_path(rf'^{re.escape(settings.STATIC_URL.lstrip("/"))}(?P<path>.*)$', assets.serve, name='static'),
+    re_path(rf'^{re.escape(settings.MEDIA_URL.lstrip("/"))}(?P<path>.*)$', media.serve, name='media'),
     path('', include('grabit_app.urls'))
-]
-
-urlpatterns += static(settings.MEDIA_URL,  document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+]
\ No newline at end of file
@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from .models import *
+from .catalog import set_attributes
 
 class CustomUserAdmin(UserAdmin):
     model = CustomUser
@@ -22,11 +23,40 @@ class CustomUserAdmin(UserAdmin):
         ),
     )
 
+class ProductAttributeInline(admin.TabularInline):
+    model = ProductAttribute
+    extra = 1
+
+class StockInline(admin.StackedInline):
+    model = Stock
+
+class ProductAdmin(admin.ModelAdmin):
+    inlines = [StockInline, ProductAttributeInline]
+    readonly_fields = ('description',)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # The description is a copy of the attribute rows just saved.
+        product = form.instance
+        set_attributes(product, dict(product.attributes.values_list('key', 'value')))
+
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    extra = 0
+
+class OrderAdmin(admin.ModelAdmin):
+    inlines = [OrderItemInline]
+    list_display = ('id', 'user', 'status', 'total', 'created_at')
+    list_filter = ('status',)
+
 admin.site.register(CustomUser, CustomUserAdmin)
-admin.site.register(Product)
+admin.site.register(Product, ProductAdmin)
 admin.site.register(ProductQuestion)
 admin.site.register(ProductRating)
 admin.site.register(Category)
 admin.site.register(StoreAccount)
 admin.site.register(Cart)
-admin.site.register(ProductImage)
\ No newline at end of file
+admin.site.register(CartItem)
+admin.site.register(ProductImage)
+admin.site.register(ImageJob)
+admin.site.register(Order, OrderAdmin)
\ No newline at end of file
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class GrabitAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'grabit_app'
+
+    def ready(self):
+        from . import signals  # noqa: F401
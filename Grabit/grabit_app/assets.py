@@ -0,0 +1,181 @@
+"""
+Static asset pipeline. `collectstatic` with CompressedManifestStorage writes content-hashed
+copies of every file plus, next to each hashed file, `.br`/`.gz` encodings of text assets and
+`.avif`/`.webp` conversions of PNGs, each kept only when smaller than the original. `serve`
+sends those files from STATIC_ROOT without a front-end web server: hashed names are cached for
+a year as immutable, the smallest variant the client accepts is chosen, and ETag/Last-Modified
+revalidation answers 304.
+"""
+import gzip
+import logging
+import mimetypes
+import os
+import posixpath
+from functools import lru_cache
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.http import FileResponse, Http404
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from PIL import Image
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'application/xml', 'image/svg+xml')
+MIN_COMPRESS_SIZE = 256
+# Most preferred first; each is served only to clients that accept it.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+IMAGE_FORMATS = (
+    ('image/avif', '.avif', 'AVIF', {'quality': 60, 'speed': 6}),
+    ('image/webp', '.webp', 'WEBP', {'quality': 82, 'method': 6}),
+)
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def _content_type(name):
+    return mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+
+def _compressible(name):
+    return _content_type(name).startswith(COMPRESSIBLE_TYPES)
+
+
+def _encode(content, encoding):
+    if encoding == 'br':
+        return brotli.compress(content, quality=11)
+    return gzip.compress(content, compresslevel=9, mtime=0)
+
+
+def _convert(content, pil_format, options):
+    image = Image.open(BytesIO(content))
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or 'A' in image.mode else 'RGB')
+    buffer = BytesIO()
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def variants(name, content):
+    """(suffix, bytes) for each pre-built alternative of `name` that comes out smaller than `content`."""
+    if _compressible(name) and len(content) >= MIN_COMPRESS_SIZE:
+        built = [(suffix, _encode(content, encoding)) for encoding, suffix in ENCODINGS
+                 if encoding != 'br' or brotli is not None]
+    elif name.lower().endswith('.png'):
+        built = []
+        for _, suffix, pil_format, options in IMAGE_FORMATS:
+            try:
+                built.append((suffix, _convert(content, pil_format, options)))
+            except (KeyError, OSError, ImportError) as e:
+                # This Pillow build has no encoder for the format (AVIF needs Pillow 11.3+).
+                logger.info("Skipping %s for %s: %s", pil_format, name, e)
+    else:
+        built = []
+    return [(suffix, data) for suffix, data in built if len(data) < len(content)]
+
+
+class CompressedManifestStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage that also writes the compressed and converted variants `serve` picks from."""
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name, hashed_name in self.hashed_files.items():
+            if name not in paths:
+                continue
+            with self.open(hashed_name) as f:
+                content = f.read()
+            for suffix, data in variants(hashed_name, content):
+                variant = hashed_name + suffix
+                if self.exists(variant):
+                    self.delete(variant)
+                self._save(variant, ContentFile(data))
+                yield name, variant, True
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # collectstatic hasn't run (development, tests): link the source name, served uncached.
+            return name
+
+
+@lru_cache(maxsize=4)
+def _hashed_names(manifest_hash):
+    return frozenset(getattr(staticfiles_storage, 'hashed_files', {}).values())
+
+
+def is_hashed(name):
+    return name in _hashed_names(getattr(staticfiles_storage, 'manifest_hash', ''))
+
+
+def _accepts(header, token):
+    for item in header.split(','):
+        value, _, params = item.strip().partition(';')
+        if value.strip().lower() == token:
+            return params.replace(' ', '').lower() not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+    return False
+
+
+def _pick(request, path, name):
+    """
+    The file to send for `path` as (path, content type, Content-Encoding), and the request
+    header that chose it, for Vary.
+    """
+    content_type = _content_type(name)
+    if _compressible(name):
+        accept_encoding = request.headers.get('Accept-Encoding', '')
+        for encoding, suffix in ENCODINGS:
+            if _accepts(accept_encoding, encoding) and os.path.isfile(path + suffix):
+                return (path + suffix, content_type, encoding), 'Accept-Encoding'
+        return (path, content_type, None), 'Accept-Encoding'
+    if name.lower().endswith('.png'):
+        accept = request.headers.get('Accept', '')
+        for image_type, suffix, _, _ in IMAGE_FORMATS:
+            if _accepts(accept, image_type) and os.path.isfile(path + suffix):
+                return (path + suffix, image_type, None), 'Accept'
+        return (path, content_type, None), 'Accept'
+    return (path, content_type, None), None
+
+
+def serve(request, path):
+    """Send `path` from STATIC_ROOT, in the smallest variant the client accepts."""
+    if not settings.SERVE_STATIC:
+        raise Http404("Static files are served by the front end")
+    name = posixpath.normpath(path).lstrip('/')
+    try:
+        full_path = safe_join(settings.STATIC_ROOT, name)
+    except SuspiciousFileOperation:
+        raise Http404("Invalid path")
+    if not os.path.isfile(full_path):
+        raise Http404(f"{name} not found")
+
+    (chosen, content_type, encoding), vary = _pick(request, full_path, name)
+    stat = os.stat(chosen)
+    etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+    headers = {
+        'Cache-Control': IMMUTABLE if is_hashed(name) else f'public, max-age={settings.STATIC_MAX_AGE}',
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+    }
+
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        response = FileResponse(open(chosen, 'rb'), content_type=content_type, filename=os.path.basename(name))
+        if encoding:
+            response['Content-Encoding'] = encoding
+    for header, value in headers.items():
+        response[header] = value
+    if vary:
+        patch_vary_headers(response, [vary])
+    return response
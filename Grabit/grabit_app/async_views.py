@@ -0,0 +1,91 @@
+"""
+Async versions of the catalog pages, routed instead of the sync ones when ASYNC_CATALOG_VIEWS
+is on (the default under asgi.py). Their independent queries are awaited together through the
+async ORM; anything that reads the session, the user or the cache helpers runs in sync_to_async.
+Writes (e.g. asking a question) are left to the sync views.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.http import Http404
+from django.shortcuts import render
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from . import caching, categories, facets, queries, replicas, views
+from .pagination import akeyset_page, page_size
+
+_render = sync_to_async(render)
+_get_or_build = sync_to_async(caching.get_or_build)
+
+
+@replicas.read_only
+@caching.anonymous_page((caching.CATEGORY_TREE,) + caching.HOME_DEAL_RAILS)
+async def home(request):
+    category, discount_deals, latest_deals = await asyncio.gather(
+        sync_to_async(categories.tree)(),
+        _get_or_build(caching.HOME_DISCOUNT_DEALS, lambda: list(queries.home_discount_deals())),
+        _get_or_build(caching.HOME_LATEST_DEALS, lambda: list(queries.home_latest_deals())),
+    )
+    context = {'discount_deals': discount_deals, 'latest_deals': latest_deals, 'category': category}
+    return await _render(request, "main/home.html", context)
+
+
+def _product_validators(request, pk):
+    etag = views._product_etag(request, pk)
+    last_modified = views._product_last_modified(request, pk)
+    return (
+        quote_etag(etag) if etag else None,
+        int(last_modified.timestamp()) if last_modified else None,
+    )
+
+
+@caching.anonymous_page(lambda request, pk: (caching.product_page(pk),))
+async def _product_page(request, pk):
+    product, (questions, next_questions) = await asyncio.gather(
+        queries.product_detail(pk).afirst(),
+        akeyset_page(queries.product_questions(pk), queries.NEWEST_FIRST, None, page_size(request)),
+    )
+    if product is None:
+        raise Http404("Product not found")
+    context = {
+        'product': product,
+        'product_imgs': product.productimage_set.all(),
+        'store': product.user.storeaccount,
+        'questions': questions,
+        'next_questions': next_questions,
+    }
+    return await _render(request, "main/product.html", context)
+
+
+@replicas.read_only
+async def product(request, pk):
+    """views.product with the same ETag/Last-Modified handling (what @condition does there)."""
+    if request.method not in ('GET', 'HEAD'):
+        return await sync_to_async(views.product)(request, pk)
+
+    etag, last_modified = await sync_to_async(_product_validators)(request, pk)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = await _product_page(request, pk)
+    if last_modified and not response.has_header('Last-Modified'):
+        response.headers['Last-Modified'] = http_date(last_modified)
+    if etag:
+        response.headers.setdefault('ETag', etag)
+    return response
+
+
+@replicas.read_only
+@caching.anonymous_page((caching.CATALOG,))
+async def productList(request):
+    q, sort, size, after, filters = views._listing_params(request)
+    listing = facets.apply(queries.product_listing(), filters)
+
+    if q:
+        page = sync_to_async(views._search_results)(listing, q, after, size)
+    else:
+        page = akeyset_page(listing, queries.LISTING_ORDERINGS[sort], after, size)
+    (products, next_cursor), facet_counts = await asyncio.gather(page, sync_to_async(facets.counts)(filters))
+
+    context = views._listing_context(request, q, sort, size, filters, products, next_cursor, facet_counts)
+    return await _render(request, "main/product-list.html", context)
@@ -0,0 +1,23 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.exceptions import PermissionDenied
+
+from . import ratelimit
+
+UserModel = get_user_model()
+
+
+class RateLimitedModelBackend(ModelBackend):
+    """
+    ModelBackend that refuses a throttled IP or email before checking the password, so a
+    credential-stuffing burst never reaches the hasher. On a successful login Django rehashes
+    the password with PASSWORD_HASHERS[0] if it was stored with another hasher or other parameters.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        email = username or kwargs.get(UserModel.USERNAME_FIELD)
+        if ratelimit.login_blocked(request, email):
+            if request is not None:
+                request.login_throttled = True
+            raise PermissionDenied
+        return super().authenticate(request, username, password, **kwargs)
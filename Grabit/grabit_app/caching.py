@@ -0,0 +1,233 @@
+import re
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.contrib import messages
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import get_cache_key, learn_cache_key
+
+from . import replicas
+
+CATEGORY_TREE = 'categories:tree'
+HOME_DISCOUNT_DEALS = 'home:discount_deals'
+HOME_LATEST_DEALS = 'home:latest_deals'
+HOME_DEAL_RAILS = (HOME_DISCOUNT_DEALS, HOME_LATEST_DEALS)
+CATALOG = 'catalog'
+
+HOME_RAIL_TIMEOUT = 60 * 15
+CART_COUNT_TIMEOUT = 60 * 60 * 24
+PAGE_TIMEOUT = 60 * 5
+BUILD_LOCK_TIMEOUT = 10
+BUILD_WAIT = 2.0
+
+_local_locks = {}
+_local_locks_guard = threading.Lock()
+
+
+def _new_version():
+    # Time-based so a version key lost to eviction never restarts at a generation still in the cache.
+    return time.time_ns()
+
+
+def _key(name):
+    version = cache.get(f"{name}:version")
+    if version is None:
+        cache.add(f"{name}:version", _new_version(), None)
+        version = cache.get(f"{name}:version")
+    return f"{name}:{version}"
+
+
+def version(*names):
+    """The current generation of `names` as one string, for keys that must change when any of them does."""
+    return '.'.join(_key(name).rsplit(':', 1)[1] for name in names)
+
+
+def product_page(product_id):
+    return f"product:{product_id}"
+
+
+def invalidate(name):
+    """Bump the generation of `name`; entries built for the old generation are never read again."""
+    try:
+        cache.incr(f"{name}:version")
+    except ValueError:
+        cache.add(f"{name}:version", _new_version(), None)
+
+
+def peek(name):
+    """The cached value of `name`, or None, without ever building it."""
+    return cache.get(_key(name))
+
+
+def cached_ids(name):
+    return {obj.pk for obj in peek(name) or ()}
+
+
+@contextmanager
+def _local_lock(key):
+    # One lock per cache key, so unrelated variants build in parallel. Keys change with every
+    # generation, so a lock is dropped once no thread holds or waits for it.
+    with _local_locks_guard:
+        entry = _local_locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _local_locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _local_locks[key]
+
+
+def get_or_build(name, builder, timeout=HOME_RAIL_TIMEOUT, variant=None):
+    """
+    Return the cached value of `name`, building it with `builder()` on a miss. `variant` keeps
+    several values (e.g. one per filter combination) under the generation of a single name.
+
+    Only one caller rebuilds a cold entry: threads of this process queue on a local lock and
+    other processes wait on a short-lived `cache.add` lock, polling for the value instead of
+    all running the same queries. The builder reads from the primary (see replicas.use_primary).
+    """
+    key = _key(name) if variant is None else f"{_key(name)}:{variant}"
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    with _local_lock(key):
+        value = cache.get(key)
+        if value is not None:
+            return value
+
+        lock_key = f"{key}:lock"
+        acquired = cache.add(lock_key, 1, BUILD_LOCK_TIMEOUT)
+        if not acquired:
+            deadline = time.monotonic() + BUILD_WAIT
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                value = cache.get(key)
+                if value is not None:
+                    return value
+            # The builder elsewhere is stuck or gone; build it ourselves rather than fail the request.
+
+        try:
+            with replicas.use_primary():
+                value = builder()
+            cache.set(key, value, timeout)
+        finally:
+            if acquired:
+                cache.delete(lock_key)
+    return value
+
+
+def _cart_count_key(user_id):
+    return f"cart_count:{user_id}"
+
+
+def cart_count(user_id):
+    """Number of products in the user's cart, read from the cache and only counted in the database on a miss."""
+    from .models import CartItem
+
+    key = _cart_count_key(user_id)
+    count = cache.get(key)
+    if count is None:
+        count = CartItem.objects.filter(cart__user_id=user_id).count()
+        cache.set(key, count, CART_COUNT_TIMEOUT)
+    return count
+
+
+def invalidate_cart_count(user_id):
+    cache.delete(_cart_count_key(user_id))
+
+
+CSRF_INPUT = re.compile(rb'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+
+
+def _is_anonymous_page_request(request):
+    from .cart import SESSION_KEY
+
+    # Flash messages and a guest cart badge are the only per-visitor parts of an anonymous page.
+    return (
+        request.method in ('GET', 'HEAD')
+        and not request.user.is_authenticated
+        and not messages.get_messages(request)
+        and not request.session.get(SESSION_KEY)
+    )
+
+
+def _is_shareable(response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and 'private' not in response.get('Cache-Control', '')
+    )
+
+
+def _with_csrf_token(request, content):
+    # A cached page carries no token of its own; each visitor gets theirs (and its cookie).
+    return CSRF_INPUT.sub(lambda m: m.group(1) + get_token(request).encode() + m.group(2), content)
+
+
+def anonymous_page(names, timeout=PAGE_TIMEOUT):
+    """
+    Serve the decorated view to anonymous GET/HEAD requests from the shared cache.
+
+    `names` (or `names(request, *args, **kwargs)`) are the generations the page is built from;
+    they prefix the key, so invalidating any of them retires every cached copy. Keys are
+    Django's per-URL keys, so they also vary on whatever headers the response lists in Vary.
+    Async views are supported; the session, user and cache are then read in a worker thread.
+    A page that will be cached is rendered from the primary: it is stored under the current
+    generation, which a lagging replica may not have caught up with yet.
+    """
+    def lookup(request, args, kwargs):
+        # Returns (cached response or None, key prefix or None when the page can't be cached).
+        if not _is_anonymous_page_request(request):
+            return None, None
+        page_names = names(request, *args, **kwargs) if callable(names) else names
+        prefix = f"page:{version(*page_names)}"
+        key = get_cache_key(request, prefix, 'GET', cache)
+        cached = cache.get(key) if key else None
+        if cached is None:
+            return None, prefix
+        content, status, headers = cached
+        response = HttpResponse(_with_csrf_token(request, content), status=status)
+        for header, value in headers:
+            response[header] = value
+        return response, prefix
+
+    def store(request, response, prefix):
+        if prefix and request.method == 'GET' and _is_shareable(response):
+            key = learn_cache_key(request, response, timeout, prefix, cache)
+            content = CSRF_INPUT.sub(rb'\1\2', response.content)
+            cache.set(key, (content, response.status_code, list(response.items())), timeout)
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                cached, prefix = await sync_to_async(lookup)(request, args, kwargs)
+                if cached is not None:
+                    return cached
+                with replicas.use_primary() if prefix else nullcontext():
+                    response = await view(request, *args, **kwargs)
+                await sync_to_async(store)(request, response, prefix)
+                return response
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            cached, prefix = lookup(request, args, kwargs)
+            if cached is not None:
+                return cached
+            with replicas.use_primary() if prefix else nullcontext():
+                response = view(request, *args, **kwargs)
+            store(request, response, prefix)
+            return response
+        return wrapper
+    return decorator
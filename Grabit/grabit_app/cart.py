@@ -0,0 +1,139 @@
+import json
+
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Least
+
+from .models import Cart, CartItem, Product
+from . import caching
+
+SESSION_KEY = 'cart'
+MAX_ITEMS_PER_REQUEST = 100
+# Quantities above this are capped; much larger ones would overflow the integer column.
+MAX_QUANTITY = 1000
+
+
+def parse_items(request):
+    """
+    Read {product_id: quantity} from a JSON body ({"items": [{"product": 1, "quantity": 2}, ...]})
+    or from the `product[]`/`quantity[]` form lists. Duplicate products are summed.
+    """
+    if request.content_type == 'application/json':
+        try:
+            rows = json.loads(request.body or b'{}').get('items', [])
+            pairs = [(row.get('product'), row.get('quantity', 1)) for row in rows]
+        except (ValueError, AttributeError):
+            raise ValueError("Malformed cart payload.")
+    else:
+        products = request.POST.getlist('product[]')
+        quantities = request.POST.getlist('quantity[]')
+        pairs = [(p, quantities[i] if i < len(quantities) else 1) for i, p in enumerate(products)]
+
+    if len(pairs) > MAX_ITEMS_PER_REQUEST:
+        raise ValueError(f"At most {MAX_ITEMS_PER_REQUEST} items per request.")
+
+    items = {}
+    for product_id, quantity in pairs:
+        try:
+            product_id, quantity = int(product_id), int(quantity)
+        except (TypeError, ValueError):
+            raise ValueError("Product and quantity must be whole numbers.")
+        items[product_id] = min(items.get(product_id, 0) + quantity, MAX_QUANTITY)
+    return items
+
+
+def _existing(product_ids):
+    return set(Product.objects.filter(id__in=product_ids).values_list('id', flat=True))
+
+
+def _quantity_case(items):
+    return Case(*[When(product_id=pid, then=Value(qty)) for pid, qty in items.items()], default=Value(0))
+
+
+def _after_change(user_id):
+    transaction.on_commit(lambda: caching.invalidate_cart_count(user_id))
+
+
+def add_items(user, items):
+    """Increment quantities for many products in a fixed number of queries, whatever the cart size."""
+    items = {pid: qty for pid, qty in items.items() if qty > 0}
+    items = {pid: items[pid] for pid in _existing(items)}
+    if not items:
+        return
+    cart, _ = Cart.objects.get_or_create(user=user)
+    with transaction.atomic():
+        # Make sure a row exists for every product, then add to all of them in one UPDATE.
+        # Concurrent adds of the same product both land on the single row via F().
+        CartItem.objects.bulk_create(
+            [CartItem(cart=cart, product_id=pid, quantity=0) for pid in items], ignore_conflicts=True
+        )
+        CartItem.objects.filter(cart=cart, product_id__in=items).update(
+            quantity=Least(F('quantity') + _quantity_case(items), Value(MAX_QUANTITY))
+        )
+        _after_change(user.pk)
+
+
+def set_items(user, items):
+    """Set absolute quantities; a quantity of zero or less removes the product."""
+    remove = [pid for pid, qty in items.items() if qty <= 0]
+    keep = {pid: qty for pid, qty in items.items() if qty > 0}
+    keep = {pid: keep[pid] for pid in _existing(keep)}
+    cart, _ = Cart.objects.get_or_create(user=user)
+    with transaction.atomic():
+        if remove:
+            CartItem.objects.filter(cart=cart, product_id__in=remove).delete()
+        if keep:
+            CartItem.objects.bulk_create(
+                [CartItem(cart=cart, product_id=pid, quantity=qty) for pid, qty in keep.items()],
+                ignore_conflicts=True,
+            )
+            CartItem.objects.filter(cart=cart, product_id__in=keep).update(quantity=_quantity_case(keep))
+        _after_change(user.pk)
+
+
+def remove_items(user, product_ids):
+    with transaction.atomic():
+        CartItem.objects.filter(cart__user=user, product_id__in=product_ids).delete()
+        _after_change(user.pk)
+
+
+def session_items(session):
+    return {int(pid): qty for pid, qty in session.get(SESSION_KEY, {}).items()}
+
+
+def _save_session_items(session, items):
+    session[SESSION_KEY] = {str(pid): qty for pid, qty in items.items() if qty > 0}
+
+
+def add(request, items):
+    if request.user.is_authenticated:
+        return add_items(request.user, items)
+    current = session_items(request.session)
+    for pid in _existing(items):
+        if items[pid] > 0:
+            current[pid] = min(current.get(pid, 0) + items[pid], MAX_QUANTITY)
+    _save_session_items(request.session, current)
+
+
+def update(request, items):
+    if request.user.is_authenticated:
+        return set_items(request.user, items)
+    current = session_items(request.session)
+    for pid, qty in items.items():
+        current[pid] = qty
+    _save_session_items(request.session, {pid: current[pid] for pid in _existing(current)})
+
+
+def remove(request, product_ids):
+    if request.user.is_authenticated:
+        return remove_items(request.user, product_ids)
+    current = session_items(request.session)
+    _save_session_items(request.session, {pid: qty for pid, qty in current.items() if pid not in product_ids})
+
+
+def merge_session_cart(request, user):
+    """Move a guest cart kept in the session into the user's cart after login."""
+    items = session_items(request.session)
+    if items:
+        add_items(user, items)
+        del request.session[SESSION_KEY]
@@ -0,0 +1,207 @@
+import csv
+import io
+import json
+import os
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from .models import Product, ProductAttribute, ProductImage, Stock
+from .search import get_backend
+from . import caching, categories, images
+
+IMPORT_BATCH_SIZE = 500
+PRODUCT_COLUMNS = {'name', 'price', 'discount', 'brand', 'description', 'stock'}
+# Product.price and old_price: max_digits=10 with 2 decimal places.
+MAX_PRICE = Decimal(10) ** 8
+# Stock.available is a PositiveIntegerField.
+MAX_STOCK = 2 ** 31 - 1
+IMPORT_FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+
+
+def normalize_attributes(attributes):
+    """Clean {key: value} specifications to what ProductAttribute stores: trimmed, non-empty strings, in order."""
+    if not isinstance(attributes, dict):
+        return {}
+    cleaned = {}
+    for key, value in attributes.items():
+        key, value = str(key).strip()[:100], str(value if value is not None else '').strip()[:255]
+        if key and value:
+            cleaned[key] = value
+    return cleaned
+
+
+def attribute_rows(product, attributes):
+    return [
+        ProductAttribute(product=product, key=key, value=value, position=position)
+        for position, (key, value) in enumerate(attributes.items())
+    ]
+
+
+def set_attributes(product, attributes):
+    """Replace the product's specifications, then refresh the description copy (which reindexes it for search)."""
+    attributes = normalize_attributes(attributes)
+    with transaction.atomic():
+        ProductAttribute.objects.filter(product=product).delete()
+        ProductAttribute.objects.bulk_create(attribute_rows(product, attributes))
+        product.description = attributes or None
+        product.save(update_fields=['description', 'updated_at'])
+
+
+def new_product(user, name, price, discount=0, brand=None, description=None):
+    """
+    Build (without saving) a Product from raw form/import values. `price` is the list price;
+    with a discount it becomes old_price and price is the discounted amount.
+    """
+    # Import rows can carry any JSON type; only strings are stripped.
+    name = str(name if name is not None else '').strip()
+    if not name:
+        raise ValueError("Product name is required.")
+    try:
+        price = Decimal(str(price or 0))
+        discount_percent = Decimal(str(discount or 0))
+    except InvalidOperation:
+        raise ValueError("Price and discount must be numbers.")
+    if not (price.is_finite() and discount_percent.is_finite()):
+        raise ValueError("Price and discount must be numbers.")
+    if price < 0 or not 0 <= discount_percent <= 100:
+        raise ValueError("Price must be positive and discount between 0 and 100.")
+    if price >= MAX_PRICE:
+        raise ValueError(f"Price must be below {MAX_PRICE}.")
+
+    old_price = price
+    if discount_percent > 0:
+        price = old_price - (old_price * discount_percent) / Decimal(100)
+
+    return Product(
+        user=user,
+        name=name,
+        price=price,
+        old_price=old_price,
+        # The copy of the attribute rows the caller creates with attribute_rows().
+        description=normalize_attributes(description) or None,
+        discount_percent=discount_percent,
+        brand=str(brand if brand is not None else '').strip() or 'No Brand',
+    )
+
+
+def _invalidate_listings():
+    for name in caching.HOME_DEAL_RAILS + (caching.CATALOG,):
+        caching.invalidate(name)
+
+
+def parse_stock(value):
+    try:
+        stock = int(value or 0)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError("Stock must be a whole number.")
+    if stock < 0:
+        raise ValueError("Stock can't be negative.")
+    if stock > MAX_STOCK:
+        raise ValueError(f"Stock can be at most {MAX_STOCK}.")
+    return stock
+
+
+def create_product(user, files, category_ids=(), stock=0, **fields):
+    """Create a product and all of its images as one unit: either everything is stored or nothing is."""
+    if not files:
+        raise ValueError("Upload at least 1 image")
+    product = new_product(user, **fields)
+    stock = parse_stock(stock)
+    product_images = [
+        ProductImage(product=product, image=image, position=position, is_primary=position == 0)
+        for position, image in enumerate(files)
+    ]
+    try:
+        with transaction.atomic():
+            product.save()
+            ProductAttribute.objects.bulk_create(attribute_rows(product, product.description or {}))
+            ProductImage.objects.bulk_create(product_images)
+            Stock.objects.create(product=product, available=stock)
+            if category_ids:
+                categories.set_categories(product, category_ids)
+            # Renditions are generated in the background; the originals are served until they're ready.
+            images.enqueue(product_images)
+    except Exception:
+        # bulk_create writes the files to storage before inserting; don't leave them behind without rows.
+        # (A content-addressed storage keeps shared files here and leaves orphans to prune_media.)
+        for product_image in product_images:
+            if product_image.image._committed and product_image.image.name:
+                product_image.image.storage.delete(product_image.image.name)
+        raise
+    return product
+
+
+def import_format(filename):
+    return IMPORT_FORMATS.get(os.path.splitext(filename)[1].lower())
+
+
+def read_rows(fileobj, fmt):
+    """
+    Stream rows from an uploaded catalog file without loading it whole.
+
+    csv: columns name, price, discount, brand, stock; any other non-empty column becomes a
+    specification (feature = column header).
+    jsonl: one object per line with the same keys and an optional "description" object.
+    """
+    text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        for row in csv.DictReader(text):
+            description = {k: v for k, v in row.items() if k and k not in PRODUCT_COLUMNS and v}
+            yield {
+                'name': row.get('name'), 'price': row.get('price'), 'discount': row.get('discount'),
+                'brand': row.get('brand'), 'stock': row.get('stock'), 'description': description,
+            }
+    elif fmt == 'jsonl':
+        for line in text:
+            if line.strip():
+                row = json.loads(line)
+                if not isinstance(row, dict):
+                    raise ValueError("Each line must be a JSON object.")
+                yield {key: row.get(key) for key in PRODUCT_COLUMNS}
+    else:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+
+def import_products(user, rows, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Insert products from `rows` in batches of `batch_size`, one transaction and one INSERT
+    per batch. Invalid rows are skipped and reported as (row number, message). A row's `stock`
+    (default 0) becomes the product's Stock. Returns (number created, errors).
+    """
+    created, errors, batch, stock = 0, [], [], []
+
+    def flush():
+        with transaction.atomic():
+            saved = Product.objects.bulk_create(batch)
+            Stock.objects.bulk_create(
+                [Stock(product=product, available=available) for product, available in zip(saved, stock)]
+            )
+            get_backend().index_many(saved)
+            ProductAttribute.objects.bulk_create(
+                [row for product in saved for row in attribute_rows(product, product.description or {})]
+            )
+            # bulk_create sends no post_save, so do what the Product signals would have done.
+            transaction.on_commit(_invalidate_listings)
+        return len(saved)
+
+    line = 0
+    try:
+        for line, row in enumerate(rows, 1):
+            try:
+                row = dict(row)
+                available = parse_stock(row.pop('stock', None))
+                batch.append(new_product(user, **row))
+            except (ValueError, TypeError) as e:
+                errors.append((line, str(e)))
+                continue
+            stock.append(available)
+            if len(batch) >= batch_size:
+                created += flush()
+                batch, stock = [], []
+    except (ValueError, csv.Error) as e:
+        # The file itself is unreadable past this point; keep what was parsed so far.
+        errors.append((line + 1, str(e)))
+    if batch:
+        created += flush()
+    return created, errors
@@ -0,0 +1,151 @@
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Category, ProductCategory
+from . import caching, queries
+
+REBUILD_BATCH_SIZE = 1000
+
+
+def build_tree():
+    """All categories as a forest: the roots, each with `subcategories` filled in, sorted by name."""
+    nodes = list(queries.all_categories())
+    by_id = {node.pk: node for node in nodes}
+    roots = []
+    for node in nodes:
+        node.subcategories = []
+    for node in nodes:
+        parent = by_id.get(node.parent_id)
+        (parent.subcategories if parent else roots).append(node)
+    return roots
+
+
+def tree():
+    return caching.get_or_build(caching.CATEGORY_TREE, build_tree)
+
+
+def breadcrumbs(category_id):
+    """The path from the root down to `category_id`, from the cached tree."""
+    by_id = {}
+    stack = list(tree())
+    while stack:
+        node = stack.pop()
+        by_id[node.pk] = node
+        stack.extend(node.subcategories)
+    path = []
+    node = by_id.get(category_id)
+    while node is not None and node not in path:
+        path.insert(0, node)
+        node = by_id.get(node.parent_id)
+    return path
+
+
+def _parents():
+    # Read fresh rather than from the cached tree: writes must see categories created in their own transaction.
+    return dict(Category.objects.values_list('id', 'parent_id'))
+
+
+def ancestors(category_id, parents):
+    seen = set()
+    parent = parents.get(category_id)
+    while parent is not None and parent not in seen:
+        seen.add(parent)
+        yield parent
+        parent = parents.get(parent)
+
+
+def _adjust_counts(category_ids, delta):
+    if category_ids:
+        Category.objects.filter(id__in=category_ids).update(product_count=F('product_count') + delta)
+
+
+def set_categories(product, category_ids):
+    """
+    Make `category_ids` the product's categories. Every ancestor becomes an implied membership and
+    the product_count of each category whose membership changed is adjusted in place.
+    """
+    parents = _parents()
+    direct = {int(category_id) for category_id in category_ids if int(category_id) in parents}
+    wanted = {ancestor: False for category_id in direct for ancestor in ancestors(category_id, parents)}
+    wanted.update(dict.fromkeys(direct, True))
+
+    with transaction.atomic():
+        current = dict(ProductCategory.objects.filter(product=product).values_list('category_id', 'direct'))
+        removed = current.keys() - wanted.keys()
+        added = wanted.keys() - current.keys()
+        if removed:
+            ProductCategory.objects.filter(product=product, category_id__in=removed).delete()
+        ProductCategory.objects.bulk_create(
+            [ProductCategory(product=product, category_id=category_id, direct=wanted[category_id]) for category_id in added]
+        )
+        for flag in (True, False):
+            changed = [cid for cid in wanted.keys() & current.keys() if wanted[cid] == flag != current[cid]]
+            if changed:
+                ProductCategory.objects.filter(product=product, category_id__in=changed).update(direct=flag)
+        _adjust_counts(added, 1)
+        _adjust_counts(removed, -1)
+        if added or removed:
+            transaction.on_commit(lambda: caching.invalidate(caching.CATALOG))
+
+
+def remove_product(product):
+    """Take a product about to be deleted out of the counts; its membership rows go with it."""
+    _adjust_counts(list(ProductCategory.objects.filter(product=product).values_list('category_id', flat=True)), -1)
+
+
+def _implied(direct, parents):
+    return {
+        (product_id, ancestor)
+        for product_id, category_id in direct
+        for ancestor in ancestors(category_id, parents)
+    } - direct
+
+
+def _recount(categories):
+    counts = (
+        ProductCategory.objects.filter(category=OuterRef('pk')).order_by()
+        .values('category').annotate(n=Count('id')).values('n')
+    )
+    categories.update(product_count=Coalesce(Subquery(counts), Value(0)))
+
+
+def rebuild():
+    """Recompute every implied membership and product_count from the direct ones (`manage.py rebuild_category_tree`)."""
+    parents = _parents()
+    with transaction.atomic():
+        ProductCategory.objects.filter(direct=False).delete()
+        direct = set(ProductCategory.objects.values_list('product_id', 'category_id'))
+        ProductCategory.objects.bulk_create(
+            [ProductCategory(product_id=product_id, category_id=category_id, direct=False)
+             for product_id, category_id in _implied(direct, parents)],
+            batch_size=REBUILD_BATCH_SIZE,
+        )
+        _recount(Category.objects.all())
+
+
+def member_ids(category):
+    """Products in `category` or below it: the only ones whose memberships change when it moves or goes."""
+    return list(ProductCategory.objects.filter(category=category).values_list('product_id', flat=True))
+
+
+def rebuild_products(product_ids):
+    """
+    Recompute the implied memberships of just these products, and the product_count of every
+    category they enter or leave; after a move or delete this touches one subtree, not the catalog.
+    """
+    if not product_ids:
+        return
+    parents = _parents()
+    with transaction.atomic():
+        rows = ProductCategory.objects.filter(product_id__in=product_ids)
+        touched = set(rows.values_list('category_id', flat=True))
+        rows.filter(direct=False).delete()
+        implied = _implied(set(rows.values_list('product_id', 'category_id')), parents)
+        ProductCategory.objects.bulk_create(
+            [ProductCategory(product_id=product_id, category_id=category_id, direct=False)
+             for product_id, category_id in implied],
+            batch_size=REBUILD_BATCH_SIZE,
+        )
+        touched.update(category_id for _, category_id in implied)
+        _recount(Category.objects.filter(id__in=touched))
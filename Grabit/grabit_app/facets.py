@@ -0,0 +1,180 @@
+import hashlib
+import json
+import math
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Count, Q
+
+from .models import Product, ProductAttribute
+from . import caching, queries
+
+PRICE_BUCKETS = ((None, 500), (500, 1000), (1000, 5000), (5000, None))
+DISCOUNT_STEPS = (10, 25, 50)
+RATING_STEPS = (4, 3, 2, 1)
+MAX_BRANDS = 20
+MAX_ATTRIBUTE_KEYS = 8
+MAX_ATTRIBUTE_VALUES = 10
+FACET_TIMEOUT = 60 * 5
+NUMERIC_FACETS = ('price', 'discount', 'rating')
+
+
+def _decimal(value):
+    try:
+        number = Decimal(value) if value not in (None, '') else None
+    except InvalidOperation:
+        return None
+    # NaN and Infinity parse, but no DecimalField accepts them.
+    return number if number is None or number.is_finite() else None
+
+
+def parse_filters(params):
+    """Read the listing filters from a QueryDict; anything malformed is ignored rather than rejected."""
+    min_price, max_price = _decimal(params.get('min_price')), _decimal(params.get('max_price'))
+    if min_price is None and max_price is None and '-' in params.get('price_range', ''):
+        low, high = params['price_range'].split('-', 1)
+        min_price, max_price = _decimal(low), _decimal(high)
+
+    discount = params.get('discount')
+    discount = Decimal('0.1') if discount == 'true' else _decimal(discount)
+    try:
+        rating = float(params.get('rating') or 0) or None
+    except ValueError:
+        rating = None
+    if rating is not None and not math.isfinite(rating):
+        rating = None
+
+    attributes = {}
+    for pair in params.getlist('attr'):
+        key, sep, value = pair.partition(':')
+        if sep and key and value:
+            attributes.setdefault(key, []).append(value)
+
+    return {
+        'brand': [brand for brand in params.getlist('brand') if brand],
+        'min_price': min_price,
+        'max_price': max_price,
+        'discount': discount,
+        'rating': rating,
+        'attributes': attributes,
+    }
+
+
+def _numeric_q(filters, facet):
+    if facet == 'price':
+        q = Q()
+        if filters['min_price'] is not None:
+            q &= Q(price__gte=filters['min_price'])
+        if filters['max_price'] is not None:
+            q &= Q(price__lte=filters['max_price'])
+        return q
+    if facet == 'discount' and filters['discount'] is not None:
+        return Q(discount_percent__gte=filters['discount'])
+    if facet == 'rating' and filters['rating'] is not None:
+        return Q(rating_avg__gte=filters['rating'])
+    return Q()
+
+
+def apply(queryset, filters, without=()):
+    """Narrow a Product queryset to `filters`, leaving out the facets named in `without`."""
+    if filters['brand'] and 'brand' not in without:
+        queryset = queryset.filter(brand__in=filters['brand'])
+    for facet in NUMERIC_FACETS:
+        if facet not in without:
+            queryset = queryset.filter(_numeric_q(filters, facet))
+    for key, values in filters['attributes'].items():
+        if f"attr:{key}" not in without:
+            # Served by the (key, value, product) index, never by reading description JSON.
+            queryset = queryset.filter(
+                id__in=ProductAttribute.objects.filter(key=key, value__in=values).values('product_id')
+            )
+    return queryset
+
+
+def _bucket_q(low, high):
+    q = Q()
+    if low is not None:
+        q &= Q(price__gte=low)
+    if high is not None:
+        q &= Q(price__lt=high)
+    return q
+
+
+def _count_facets(filters):
+    products = Product.objects.order_by()
+
+    brands = queries.brand_counts(apply(products, filters, without=('brand',)))
+    brands = sorted(brands, key=lambda row: (-row['count'], row['brand']))[:MAX_BRANDS]
+
+    def others(facet):
+        q = Q()
+        for other in NUMERIC_FACETS:
+            if other != facet:
+                q &= _numeric_q(filters, other)
+        return q
+
+    # Each numeric facet counts against every filter but its own, all in one pass.
+    totals = apply(products, filters, without=NUMERIC_FACETS).aggregate(
+        **{f"price_{i}": Count('id', filter=_bucket_q(low, high) & others('price'))
+           for i, (low, high) in enumerate(PRICE_BUCKETS)},
+        **{f"discount_{step}": Count('id', filter=Q(discount_percent__gte=step) & others('discount'))
+           for step in DISCOUNT_STEPS},
+        **{f"rating_{step}": Count('id', filter=Q(rating_avg__gte=step) & others('rating'))
+           for step in RATING_STEPS},
+    )
+
+    # Unselected keys count against every filter; each selected key against all the others.
+    selected = filters['attributes']
+    rows = list(queries.attribute_counts(apply(products, filters)).exclude(key__in=selected))
+    for key in selected:
+        rows += list(queries.attribute_counts(apply(products, filters, without=(f"attr:{key}",))).filter(key=key))
+    by_key = {}
+    for row in rows:
+        by_key.setdefault(row['key'], []).append(row)
+    attributes = sorted(
+        by_key.items(), key=lambda item: (item[0] not in selected, -sum(r['count'] for r in item[1]), item[0])
+    )
+    price_range = f"{filters['min_price'] or ''}-{filters['max_price'] or ''}"
+
+    return {
+        'brands': [
+            {'value': row['brand'], 'count': row['count'], 'selected': row['brand'] in filters['brand']}
+            for row in brands
+        ],
+        'prices': [
+            {
+                'low': low, 'high': high, 'count': totals[f"price_{i}"],
+                'value': f"{low or ''}-{high or ''}",
+                'selected': f"{low or ''}-{high or ''}" == price_range,
+            }
+            for i, (low, high) in enumerate(PRICE_BUCKETS)
+        ],
+        'discounts': [
+            {'value': step, 'count': totals[f"discount_{step}"], 'selected': filters['discount'] == step}
+            for step in DISCOUNT_STEPS
+        ],
+        'ratings': [
+            {'value': step, 'count': totals[f"rating_{step}"], 'selected': filters['rating'] == step}
+            for step in RATING_STEPS
+        ],
+        'attributes': [
+            {
+                'key': key,
+                'values': [
+                    {
+                        'value': row['value'], 'count': row['count'],
+                        'selected': row['value'] in selected.get(key, ()),
+                    }
+                    for row in sorted(values, key=lambda r: (-r['count'], r['value']))[:MAX_ATTRIBUTE_VALUES]
+                ],
+            }
+            for key, values in attributes[:MAX_ATTRIBUTE_KEYS]
+        ],
+    }
+
+
+def counts(filters):
+    """Facet counts for `filters`, cached per filter combination until the catalog changes."""
+    digest = hashlib.md5(json.dumps(filters, sort_keys=True, default=str).encode()).hexdigest()
+    return caching.get_or_build(
+        caching.CATALOG, lambda: _count_facets(filters), FACET_TIMEOUT, variant=f"facets:{digest}"
+    )
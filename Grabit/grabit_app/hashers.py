@@ -0,0 +1,27 @@
+"""
+Password hashers tuned for login bursts. Both are memory-hard, so they cost an attacker's GPUs
+far more than they cost our CPUs, and each verifies in a fraction of the time of Django's
+default PBKDF2 (1,000,000 iterations). ARGON2_PARAMS and SCRYPT_PARAMS override the defaults;
+hashes made with other parameters are upgraded at the next login.
+"""
+from django.conf import settings
+from django.contrib.auth import hashers
+
+ARGON2_PARAMS = {'time_cost': 2, 'memory_cost': 19 * 1024, 'parallelism': 1, **getattr(settings, 'ARGON2_PARAMS', {})}
+SCRYPT_PARAMS = {'work_factor': 2 ** 15, 'block_size': 8, 'parallelism': 1, **getattr(settings, 'SCRYPT_PARAMS', {})}
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    """Argon2id at OWASP's baseline: 19 MiB, 2 passes. Needs argon2-cffi."""
+    time_cost = ARGON2_PARAMS['time_cost']
+    memory_cost = ARGON2_PARAMS['memory_cost']
+    parallelism = ARGON2_PARAMS['parallelism']
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    """scrypt at 32 MiB per hash (N=2**15, r=8, p=1), about half the CPU of Django's default."""
+    work_factor = SCRYPT_PARAMS['work_factor']
+    block_size = SCRYPT_PARAMS['block_size']
+    parallelism = SCRYPT_PARAMS['parallelism']
+    # hashlib refuses anything over maxmem; scrypt needs 128 * N * r bytes.
+    maxmem = 2 * 128 * work_factor * block_size
@@ -0,0 +1,134 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import ImageJob
+from . import queries
+
+logger = logging.getLogger(__name__)
+
+RENDITION_WIDTHS = (320, 640, 1280)
+RENDITION_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+MAX_ATTEMPTS = 3
+STALE_AFTER = timedelta(minutes=10)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def rendition_name(original_name, width, fmt):
+    root, _ = os.path.splitext(original_name)
+    return f"renditions/{root.split('/')[-1]}-{width}w.{'jpg' if fmt == 'jpeg' else fmt}"
+
+
+def process_image(product_image):
+    """
+    Write resized renditions of `product_image` and record them with the original dimensions.
+    Renditions are re-encoded from pixels only, so EXIF/GPS and other metadata are dropped.
+    """
+    with product_image.image.open('rb') as f:
+        original = Image.open(f)
+        original.load()
+    # Apply the EXIF orientation before the metadata that carries it is thrown away.
+    original = ImageOps.exif_transpose(original)
+    width, height = original.size
+    rgb = original.convert('RGB')
+
+    renditions = []
+    widths = [w for w in RENDITION_WIDTHS if w < width] or [width]
+    for target in widths:
+        resized = rgb if target == width else rgb.resize((target, round(height * target / width)), Image.LANCZOS)
+        for fmt, (pil_format, options) in RENDITION_FORMATS.items():
+            buffer = BytesIO()
+            resized.save(buffer, pil_format, **options)
+            name = rendition_name(product_image.image.name, target, fmt)
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            name = default_storage.save(name, ContentFile(buffer.getvalue()))
+            renditions.append({'name': name, 'width': resized.width, 'height': resized.height, 'format': fmt})
+
+    product_image.width, product_image.height, product_image.renditions = width, height, renditions
+    product_image.save(update_fields=['width', 'height', 'renditions', 'updated_at'])
+
+
+def enqueue(images):
+    """Queue renditions for `images`; workers pick them up after the surrounding transaction commits."""
+    ImageJob.objects.bulk_create([ImageJob(image=image) for image in images])
+    if getattr(settings, 'IMAGE_PIPELINE_IN_PROCESS', True):
+        transaction.on_commit(lambda: _get_executor().submit(drain_in_thread))
+
+
+def claim_job():
+    """
+    Atomically take the oldest runnable job. The conditional UPDATE is the lock: of several
+    workers racing for the same row only one sees a row count of 1, on SQLite as on PostgreSQL.
+    """
+    pending = queries.pending_image_jobs()
+    stale = queries.stale_image_jobs(timezone.now() - STALE_AFTER)
+    while True:
+        fields = ('id', 'status', 'updated_at')
+        job = pending.values(*fields).first() or stale.values(*fields).first()
+        if job is None:
+            return None
+        claimed = ImageJob.objects.filter(pk=job['id'], status=job['status'], updated_at=job['updated_at']).update(
+            status=ImageJob.RUNNING, updated_at=timezone.now()
+        )
+        if claimed:
+            return ImageJob.objects.select_related('image').get(pk=job['id'])
+
+
+def run_job(job):
+    job.attempts += 1
+    try:
+        process_image(job.image)
+    except Exception as e:
+        logger.exception("Image job %s failed", job.pk)
+        job.status = ImageJob.FAILED if job.attempts >= MAX_ATTEMPTS else ImageJob.PENDING
+        job.error = str(e)
+    else:
+        job.status = ImageJob.DONE
+        job.error = ''
+    job.save(update_fields=['status', 'attempts', 'error', 'updated_at'])
+
+
+def drain(limit=None):
+    """Process jobs until the queue is empty (or `limit` jobs ran). Returns how many ran."""
+    done = 0
+    while limit is None or done < limit:
+        job = claim_job()
+        if job is None:
+            break
+        run_job(job)
+        done += 1
+    return done
+
+
+def drain_in_thread():
+    try:
+        return drain()
+    finally:
+        # Worker threads own their connections; don't leave them open when the thread goes idle.
+        connections.close_all()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_PIPELINE_WORKERS', 2), thread_name_prefix='image-pipeline'
+            )
+    return _executor
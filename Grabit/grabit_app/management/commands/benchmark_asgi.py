@@ -0,0 +1,127 @@
+import asyncio
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+
+from grabit_app.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the catalog pages in-process through Django's WSGI or ASGI handler and report "
+        "throughput and tail latency. Compare `benchmark_asgi --server wsgi` (sync views, one thread "
+        "per request) with `ASYNC_CATALOG_VIEWS=1 manage.py benchmark_asgi --server asgi` (async views)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', choices=('wsgi', 'asgi'), default='wsgi')
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=32, help="Requests in flight at once.")
+        parser.add_argument('--threads', type=int, default=8, help="WSGI worker threads.")
+        parser.add_argument(
+            '--cold', action='store_true',
+            help="Make every URL unique so the page cache never answers and each request runs its view.",
+        )
+
+    def paths(self, count, cold):
+        product = Product.objects.order_by('-id').values_list('id', flat=True).first()
+        if product is None:
+            raise CommandError("No products to request; import or seed some first.")
+        paths = ['/', f'/product-{product}', '/product-list/', '/product-list/?sort=rating']
+        run = uuid.uuid4().hex[:8]
+        for i in range(count):
+            path = paths[i % len(paths)]
+            yield f"{path}{'&' if '?' in path else '?'}bench={run}-{i}" if cold else path
+
+    def run_wsgi(self, paths, threads):
+        handler = WSGIHandler()
+
+        def get(path):
+            path, _, query = path.partition('?')
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SERVER_NAME': 'localhost',
+                'SERVER_PORT': '80', 'HTTP_HOST': 'localhost', 'wsgi.url_scheme': 'http',
+                'wsgi.input': BytesIO(), 'wsgi.errors': BytesIO(),
+            }
+            status = []
+            started = time.perf_counter()
+            response = handler(environ, lambda s, headers, exc_info=None: status.append(s))
+            try:
+                b''.join(response)
+            finally:
+                response.close()
+            return status[0].startswith('200'), time.perf_counter() - started
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            return list(pool.map(get, paths))
+
+    def run_asgi(self, paths, concurrency):
+        handler = ASGIHandler()
+
+        async def get(path, slots):
+            path, _, query = path.partition('?')
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+                'root_path': '', 'headers': [(b'host', b'localhost')],
+                'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+            }
+            messages, requested = [], []
+
+            async def receive():
+                if requested:
+                    # Django keeps listening for a disconnect until the response is sent.
+                    await asyncio.Future()
+                requested.append(True)
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+            async def send(message):
+                messages.append(message)
+
+            async with slots:
+                started = time.perf_counter()
+                await handler(scope, receive, send)
+                return messages[0]['status'] == 200, time.perf_counter() - started
+
+        async def main():
+            slots = asyncio.Semaphore(concurrency)
+            return await asyncio.gather(*(get(path, slots) for path in paths))
+
+        # Run the loop off the main thread: Django refuses sync ORM calls from a thread with a running loop.
+        result = []
+        thread = threading.Thread(target=lambda: result.append(asyncio.run(main())))
+        thread.start()
+        thread.join()
+        return result[0]
+
+    def handle(self, *args, **options):
+        server = options['server']
+        if server == 'asgi' and not settings.ASYNC_CATALOG_VIEWS:
+            self.stdout.write(self.style.WARNING("ASYNC_CATALOG_VIEWS is off: ASGI will run the sync views in threads."))
+        paths = list(self.paths(options['requests'], options['cold']))
+
+        started = time.perf_counter()
+        if server == 'wsgi':
+            results = self.run_wsgi(paths, options['threads'])
+        else:
+            results = self.run_asgi(paths, options['concurrency'])
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for _, latency in results)
+        failed = sum(1 for ok, _ in results if not ok)
+        percentile = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+        views = 'async' if settings.ASYNC_CATALOG_VIEWS else 'sync'
+        self.stdout.write(f"{server} ({views} views): {len(results)} requests in {elapsed:.2f}s, {failed} failed")
+        self.stdout.write(f"throughput: {len(results) / elapsed:.0f} req/s")
+        self.stdout.write(
+            f"latency ms: p50={statistics.median(latencies) * 1000:.1f} p95={percentile(0.95):.1f} "
+            f"p99={percentile(0.99):.1f} max={latencies[-1] * 1000:.1f}"
+        )
@@ -0,0 +1,84 @@
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections, transaction
+
+from grabit_app.catalog import new_product
+from grabit_app.models import CustomUser, ProductQuestion
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure concurrent write throughput against the configured database: worker threads post "
+        "questions and create products at once, as sellers and shoppers do. Compare profiles by "
+        "running it under each, e.g. SQLITE_TUNING=0, the default SQLite profile and DB_ENGINE=postgres."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--writes', type=int, default=100, help="Writes per worker.")
+
+    def describe_database(self):
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                pragmas = {}
+                for pragma in ('journal_mode', 'synchronous', 'busy_timeout'):
+                    cursor.execute(f"PRAGMA {pragma}")
+                    pragmas[pragma] = cursor.fetchone()[0]
+            return "sqlite " + " ".join(f"{key}={value}" for key, value in pragmas.items())
+        settings = connection.settings_dict
+        pooled = bool(settings['OPTIONS'].get('pool'))
+        return f"{connection.vendor} pool={pooled} conn_max_age={settings['CONN_MAX_AGE']}"
+
+    def handle(self, *args, **options):
+        workers, writes = options['workers'], options['writes']
+        seller = CustomUser.objects.create_user(email=f"benchmark-{uuid.uuid4().hex[:8]}@grabit.invalid")
+        product = new_product(seller, "Benchmark product", 100)
+        product.save()
+
+        latencies, errors = [], []
+        lock = threading.Lock()
+
+        def work(worker):
+            try:
+                for i in range(writes):
+                    started = time.perf_counter()
+                    try:
+                        with transaction.atomic():
+                            if i % 4 == 0:
+                                new_product(seller, f"Benchmark {worker}-{i}", 100).save()
+                            else:
+                                ProductQuestion.objects.create(user=seller, product=product, question=f"Q {worker}-{i}")
+                    except OperationalError as e:
+                        with lock:
+                            errors.append(str(e))
+                    else:
+                        with lock:
+                            latencies.append(time.perf_counter() - started)
+            finally:
+                connections.close_all()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(work, range(workers)))
+        elapsed = time.perf_counter() - started
+
+        try:
+            self.stdout.write(self.describe_database())
+            self.stdout.write(f"{workers} workers x {writes} writes in {elapsed:.2f}s")
+            self.stdout.write(f"throughput: {len(latencies) / elapsed:.0f} writes/s, failed: {len(errors)}")
+            if latencies:
+                latencies.sort()
+                p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+                self.stdout.write(
+                    f"latency ms: p50={statistics.median(latencies) * 1000:.1f} "
+                    f"p95={p95 * 1000:.1f} max={latencies[-1] * 1000:.1f}"
+                )
+            for error in sorted(set(errors)):
+                self.stdout.write(self.style.WARNING(f"  {errors.count(error)} x {error}"))
+        finally:
+            seller.delete()
@@ -0,0 +1,244 @@
+import http.cookiejar
+import json
+import random
+import re
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from grabit_app.models import Product
+from .seed_catalog import BRANDS, SEED_PASSWORD, seed_email
+
+DEFAULT_BASELINE = settings.BASE_DIR / 'benchmarks' / 'baseline.json'
+QUERIES = re.compile(r'desc="(\d+) queries"')
+SCENARIOS = ('home', 'product', 'productList', 'search', 'login', 'productForm')
+
+
+class ClientSession:
+    """Requests through Django's test client, in this process."""
+
+    def __init__(self):
+        # A host the site accepts: its own when configured, else what DEBUG allows.
+        host = next((h for h in settings.ALLOWED_HOSTS if h[0] not in '.*'), 'localhost')
+        self.client = Client(HTTP_HOST=host)
+
+    def request(self, method, path, data=None):
+        response = self.client.get(path) if method == 'GET' else self.client.post(path, data)
+        return response.status_code, response.get('Server-Timing', '')
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpSession:
+    """Requests over HTTP to a running server, with cookies and the CSRF token of a browser."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies), _NoRedirect)
+
+    def request(self, method, path, data=None):
+        url = self.base_url + path
+        body = None
+        if method == 'POST':
+            token = next((c.value for c in self.cookies if c.name == settings.CSRF_COOKIE_NAME), '')
+            body = urllib.parse.urlencode({**data, 'csrfmiddlewaretoken': token}, doseq=True).encode()
+        request = urllib.request.Request(url, data=body, method=method, headers={'Referer': url})
+        try:
+            with self.opener.open(request, timeout=30) as response:
+                response.read()
+                return response.status, response.headers.get('Server-Timing', '')
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code, e.headers.get('Server-Timing', '')
+
+
+class Worker:
+    """One simulated visitor per thread: an anonymous session and, once needed, a logged-in seller."""
+
+    def __init__(self, new_session, product_ids, seed):
+        self.new_session = new_session
+        self.product_ids = product_ids
+        self.random = random.Random(seed)
+        self.anonymous = new_session()
+        self._seller = None
+
+    def login(self, session, email):
+        session.request('GET', '/login/')
+        return session.request('POST', '/login/', {'email': email, 'password': SEED_PASSWORD})
+
+    @property
+    def seller(self):
+        if self._seller is None:
+            self._seller = self.new_session()
+            self.login(self._seller, seed_email('seller', 1))
+        return self._seller
+
+    # Each scenario returns the (status, Server-Timing) of the request it measures and the statuses it expects.
+    def home(self):
+        return self.anonymous.request('GET', '/'), (200,)
+
+    def product(self):
+        return self.anonymous.request('GET', f"/product-{self.random.choice(self.product_ids)}"), (200,)
+
+    def productList(self):
+        params = {'sort': self.random.choice(['newest', 'rating'])}
+        if self.random.random() < 0.5:
+            params['brand'] = self.random.choice(BRANDS)
+        if self.random.random() < 0.3:
+            params['price_range'] = self.random.choice(['-500', '500-1000', '1000-5000'])
+        return self.anonymous.request('GET', f"/product-list/?{urllib.parse.urlencode(params)}"), (200,)
+
+    def search(self):
+        query = self.random.choice(['lamp', 'pro kettle', 'smart watch', 'acme', 'portable speaker'])
+        return self.anonymous.request('GET', f"/product-list/?q={urllib.parse.quote(query)}"), (200,)
+
+    def login_scenario(self):
+        email = seed_email('shopper', self.random.randint(1, 50))
+        return self.login(self.new_session(), email), (302,)
+
+    def productForm(self):
+        # The form a seller opens, not its submission: that needs image uploads and leaves products behind.
+        return self.seller.request('GET', '/add-new-product/'), (200,)
+
+    def run(self, scenario):
+        scenario = self.login_scenario if scenario == 'login' else getattr(self, scenario)
+        started = time.perf_counter()
+        (status, timing), expected = scenario()
+        elapsed = time.perf_counter() - started
+        queries = QUERIES.search(timing)
+        return elapsed, status in expected, int(queries.group(1)) if queries else None
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the storefront: home, product, productList, search, login and productForm, through "
+        "the test client or, with --url, over HTTP against a running server. Reports throughput, "
+        "p50/p95/p99 and queries per request (from Server-Timing). --save-baseline records the "
+        "result; --compare fails when p95 or queries per request regress past it. Seed data first "
+        "with `manage.py seed_catalog`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help="Base URL of a running server; the test client is used without it.")
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+        parser.add_argument('--requests', type=int, default=200, help="Requests per scenario.")
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--warmup', type=int, default=10, help="Unmeasured requests per scenario first.")
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--save-baseline', nargs='?', const=str(DEFAULT_BASELINE), metavar='PATH')
+        parser.add_argument('--compare', nargs='?', const=str(DEFAULT_BASELINE), metavar='PATH')
+        parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed p95 slowdown, as a fraction.")
+        parser.add_argument(
+            '--min-delta-ms', type=float, default=10.0,
+            help="Ignore p95 slowdowns smaller than this; millisecond pages are mostly scheduling noise.",
+        )
+
+    def handle(self, *args, **options):
+        scenarios = [name for name in options['scenarios'].split(',') if name]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        product_ids = list(Product.objects.order_by('-id').values_list('id', flat=True)[:1000])
+        if not product_ids or not Product.objects.filter(user__email=seed_email('seller', 1)).exists():
+            raise CommandError("Seed the database first with `manage.py seed_catalog`.")
+
+        url = options['url']
+        new_session = (lambda: HttpSession(url)) if url else ClientSession
+        concurrency = options['concurrency']
+        workers, seeds = threading.local(), iter(range(options['seed'], options['seed'] + 10 ** 6))
+
+        def run(scenario):
+            if not hasattr(workers, 'worker'):
+                workers.worker = Worker(new_session, product_ids, next(seeds))
+            return workers.worker.run(scenario)
+
+        results = {}
+        for scenario in scenarios:
+            if concurrency == 1:
+                # Stay on this thread (and its database connection), e.g. inside a test transaction.
+                for _ in range(options['warmup']):
+                    run(scenario)
+                started = time.perf_counter()
+                samples = [run(scenario) for _ in range(options['requests'])]
+            else:
+                with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                    list(pool.map(run, [scenario] * options['warmup']))
+                    started = time.perf_counter()
+                    samples = list(pool.map(run, [scenario] * options['requests']))
+            results[scenario] = self.summarize(samples, time.perf_counter() - started)
+            self.report(scenario, results[scenario])
+
+        meta = {'driver': url and 'http' or 'client', 'concurrency': concurrency, 'products': Product.objects.count()}
+        if options['save_baseline']:
+            self.save_baseline(options['save_baseline'], meta, results)
+        if options['compare']:
+            self.compare(options['compare'], meta, results, options['tolerance'], options['min_delta_ms'])
+
+    def summarize(self, samples, elapsed):
+        latencies = sorted(latency for latency, _, _ in samples)
+        queries = [count for _, _, count in samples if count is not None]
+        percentile = lambda p: round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2)
+        return {
+            'requests': len(samples),
+            'errors': sum(1 for _, ok, _ in samples if not ok),
+            'rps': round(len(samples) / elapsed, 1),
+            'p50_ms': round(statistics.median(latencies) * 1000, 2),
+            'p95_ms': percentile(0.95),
+            'p99_ms': percentile(0.99),
+            'queries': round(statistics.mean(queries), 2) if queries else None,
+        }
+
+    def report(self, scenario, result):
+        line = (
+            f"{scenario:<12} {result['rps']:>8.1f} req/s  p50 {result['p50_ms']:>8.1f} ms  "
+            f"p95 {result['p95_ms']:>8.1f} ms  p99 {result['p99_ms']:>8.1f} ms  "
+            f"queries/req {result['queries'] if result['queries'] is not None else '-'}"
+        )
+        if result['errors']:
+            line += f"  {result['errors']} unexpected responses"
+        self.stdout.write(self.style.WARNING(line) if result['errors'] else line)
+
+    def save_baseline(self, path, meta, results):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({'meta': meta, 'scenarios': results}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        self.stdout.write(f"Baseline saved to {path}")
+
+    def compare(self, path, meta, results, tolerance, min_delta_ms):
+        try:
+            with open(path) as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            raise CommandError(f"No baseline at {path}; record one with --save-baseline.")
+        if baseline['meta'] != meta:
+            self.stdout.write(self.style.WARNING(f"Baseline was recorded with {baseline['meta']}, this run is {meta}."))
+
+        regressions = []
+        for scenario, result in results.items():
+            base = baseline['scenarios'].get(scenario)
+            if base is None:
+                continue
+            slower = result['p95_ms'] - base['p95_ms']
+            if slower > base['p95_ms'] * tolerance and slower > min_delta_ms:
+                regressions.append(f"{scenario}: p95 {result['p95_ms']} ms, baseline {base['p95_ms']} ms")
+            if None not in (result['queries'], base['queries']) and result['queries'] > base['queries'] + 0.5:
+                regressions.append(f"{scenario}: {result['queries']} queries/request, baseline {base['queries']}")
+            if result['errors'] > base['errors']:
+                regressions.append(f"{scenario}: {result['errors']} unexpected responses, baseline {base['errors']}")
+        if regressions:
+            raise CommandError("Regressions against the baseline:\n  " + "\n  ".join(regressions))
+        self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
@@ -0,0 +1,80 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from grabit_app.pagination import DEFAULT_PAGE_SIZE, keyset_queryset
+from grabit_app.queries import REGISTRY
+
+SQLITE_SCAN = re.compile(r'\bSCAN (\w+)')
+SQLITE_INDEXED = re.compile(r'USING (COVERING )?INDEX|USING INTEGER PRIMARY KEY|VIRTUAL TABLE')
+
+
+def sample_key(model, ordering):
+    """A plausible cursor key so the audit also covers the plan of a second page."""
+    key = []
+    for name in ordering:
+        field = model._meta.get_field(name.lstrip('-'))
+        key.append(timezone.now().isoformat() if isinstance(field, models.DateTimeField) else '1')
+    return tuple(key)
+
+
+def plan_problems(plan, vendor):
+    problems = []
+    for line in plan.splitlines():
+        if vendor == 'sqlite':
+            if SQLITE_SCAN.search(line) and not SQLITE_INDEXED.search(line):
+                problems.append(f"full table scan: {line.strip()}")
+            if 'USE TEMP B-TREE' in line:
+                problems.append(f"sort without index: {line.strip()}")
+        elif vendor == 'postgresql':
+            if 'Seq Scan' in line:
+                problems.append(f"full table scan: {line.strip()}")
+            if re.search(r'^\s*(->\s*)?Sort\b', line):
+                problems.append(f"sort without index: {line.strip()}")
+    return problems
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN every registered view query (grabit_app.queries) and fail if any needs a full scan or sort."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help="Print every plan, not only failures.")
+
+    def explain(self, queryset):
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                # Tiny dev tables make sequential scans look cheapest; only a missing index should produce one.
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL enable_seqscan = off")
+            return queryset.explain()
+
+    def handle(self, *args, **options):
+        failures = 0
+        for name, (func, kwargs, ordering) in sorted(REGISTRY.items()):
+            queryset = func(**kwargs)
+            plans = [(name, queryset)]
+            if ordering:
+                plans = [
+                    (f"{name} (first page)", keyset_queryset(queryset, ordering, None, DEFAULT_PAGE_SIZE)),
+                    (f"{name} (next page)", keyset_queryset(
+                        queryset, ordering, sample_key(queryset.model, ordering), DEFAULT_PAGE_SIZE
+                    )),
+                ]
+
+            for label, query in plans:
+                plan = self.explain(query)
+                problems = plan_problems(plan, connection.vendor)
+                if problems:
+                    failures += 1
+                    self.stdout.write(self.style.ERROR(f"FAIL {label}"))
+                    for problem in problems:
+                        self.stdout.write(f"    {problem}")
+                else:
+                    self.stdout.write(self.style.SUCCESS(f"ok   {label}"))
+                if problems or options['verbose_plans']:
+                    self.stdout.write("    " + plan.replace("\n", "\n    "))
+
+        if failures:
+            raise CommandError(f"{failures} query plan(s) regressed to a full scan or unindexed sort.")
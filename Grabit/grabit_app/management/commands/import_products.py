@@ -0,0 +1,31 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from grabit_app.catalog import IMPORT_BATCH_SIZE, import_format, import_products, read_rows
+
+
+class Command(BaseCommand):
+    help = "Bulk-import products for a seller from a CSV or JSON Lines file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('seller', help="Email of the seller the products belong to.")
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            seller = User.objects.get(email=options['seller'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user with email {options['seller']}")
+
+        fmt = import_format(options['path'])
+        if fmt is None:
+            raise CommandError("Expected a .csv, .jsonl or .ndjson file.")
+
+        with open(options['path'], 'rb') as f:
+            created, errors = import_products(seller, read_rows(f, fmt), batch_size=options['batch_size'])
+
+        for row, error in errors:
+            self.stderr.write(f"row {row}: {error}")
+        self.stdout.write(self.style.SUCCESS(f"Imported {created} products, skipped {len(errors)} rows."))
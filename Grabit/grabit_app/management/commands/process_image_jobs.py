@@ -0,0 +1,26 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from grabit_app import images
+
+
+class Command(BaseCommand):
+    help = "Run the product image pipeline: generate renditions for queued ImageJobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--once', action='store_true', help="Drain the queue and exit instead of polling.")
+        parser.add_argument('--poll-interval', type=float, default=2.0)
+
+    def handle(self, *args, **options):
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            while True:
+                done = sum(pool.map(lambda _: images.drain_in_thread(), range(options['workers'])))
+                if done:
+                    self.stdout.write(f"Processed {done} image jobs.")
+                if options['once']:
+                    break
+                if not done:
+                    time.sleep(options['poll_interval'])
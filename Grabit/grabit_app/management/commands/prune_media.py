@@ -0,0 +1,46 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from grabit_app.models import ProductImage, StoreAccount
+
+MEDIA_DIRS = ('Product_images', 'renditions', 'Store_logo', 'Store')
+
+
+class Command(BaseCommand):
+    help = "Delete uploaded files that no ProductImage, rendition or StoreAccount refers to any more."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=24,
+                            help="Keep files younger than this; their rows may not be committed yet.")
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        referenced = set()
+        for name, renditions in ProductImage.objects.values_list('image', 'renditions').iterator(chunk_size=2000):
+            referenced.add(name)
+            referenced.update(r['name'] for r in renditions)
+        for logo, verification in StoreAccount.objects.values_list('store_logo', 'store_verification'):
+            referenced.update((logo, verification))
+
+        cutoff = time.time() - options['grace_hours'] * 3600
+        removed = freed = 0
+        for directory in MEDIA_DIRS:
+            for root, _, files in os.walk(os.path.join(settings.MEDIA_ROOT, directory)):
+                for filename in files:
+                    path = os.path.join(root, filename)
+                    name = os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, '/')
+                    stat = os.stat(path)
+                    if name in referenced or stat.st_mtime > cutoff:
+                        continue
+                    if not options['dry_run']:
+                        purge = getattr(default_storage, 'purge', default_storage.delete)
+                        purge(name)
+                    removed += 1
+                    freed += stat.st_size
+
+        verb = "Would remove" if options['dry_run'] else "Removed"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {removed} files ({freed / 1024 / 1024:.1f} MB)."))
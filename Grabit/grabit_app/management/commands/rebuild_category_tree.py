@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from grabit_app import caching, categories
+
+
+class Command(BaseCommand):
+    help = "Recompute implied category memberships and Category.product_count from the direct assignments."
+
+    def handle(self, *args, **options):
+        categories.rebuild()
+        caching.invalidate(caching.CATEGORY_TREE)
+        caching.invalidate(caching.CATALOG)
+        self.stdout.write(self.style.SUCCESS("Category tree rebuilt."))
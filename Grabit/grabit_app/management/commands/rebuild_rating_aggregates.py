@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from grabit_app.models import Product, ProductRating, RATING_AVG_EXPRESSION
+
+STAR_FIELDS = [f"rating_{star}" for star in range(1, 6)]
+
+
+class Command(BaseCommand):
+    help = "Recompute Product rating_count/rating_sum/rating_avg and the per-star histogram from ProductRating."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        totals = (
+            ProductRating.objects.values('product_id')
+            .annotate(
+                count=Count('id'),
+                total=Sum('rating'),
+                **{field: Count('id', filter=Q(rating=star)) for star, field in enumerate(STAR_FIELDS, 1)},
+            )
+            .order_by()
+        )
+
+        with transaction.atomic():
+            Product.objects.update(rating_count=0, rating_sum=0, rating_avg=0, **{field: 0 for field in STAR_FIELDS})
+            batch = []
+            for row in totals.iterator(chunk_size=batch_size):
+                product = Product(pk=row['product_id'], rating_count=row['count'], rating_sum=row['total'])
+                for field in STAR_FIELDS:
+                    setattr(product, field, row[field])
+                batch.append(product)
+                if len(batch) >= batch_size:
+                    Product.objects.bulk_update(batch, ['rating_count', 'rating_sum', *STAR_FIELDS])
+                    batch = []
+            if batch:
+                Product.objects.bulk_update(batch, ['rating_count', 'rating_sum', *STAR_FIELDS])
+            Product.objects.filter(rating_count__gt=0).update(rating_avg=RATING_AVG_EXPRESSION)
+
+        self.stdout.write(self.style.SUCCESS("Rating aggregates rebuilt."))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from grabit_app.models import Product
+from grabit_app.search import get_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product search index from the Product table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        products = Product.objects.only('id', 'name', 'brand', 'description').iterator(chunk_size=options['batch_size'])
+        get_backend().rebuild(products)
+        self.stdout.write(self.style.SUCCESS(f"Indexed {Product.objects.count()} products."))
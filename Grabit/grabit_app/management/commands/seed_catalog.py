@@ -0,0 +1,154 @@
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from grabit_app import caching, categories
+from grabit_app.catalog import attribute_rows, new_product
+from grabit_app.models import (
+    Category, CustomUser, Product, ProductAttribute, ProductCategory, ProductImage, ProductQuestion, ProductRating,
+    Stock, StoreAccount,
+)
+
+SEED_DOMAIN = 'seed.grabit.invalid'
+SEED_PASSWORD = 'seed-password'
+BRANDS = ['Acme', 'Zen', 'Nova', 'Orbit', 'Peak', 'Lumen', 'Terra', 'Vista', 'Echo', 'Flux', 'Apex', 'Nimbus']
+NOUNS = ['Lamp', 'Kettle', 'Toaster', 'Headphones', 'Backpack', 'Jacket', 'Sneakers', 'Blender', 'Monitor',
+         'Keyboard', 'Watch', 'Speaker', 'Camera', 'Chair', 'Desk', 'Bottle', 'Charger', 'Router']
+ADJECTIVES = ['Compact', 'Pro', 'Classic', 'Ultra', 'Smart', 'Portable', 'Deluxe', 'Eco', 'Mini', 'Max']
+ATTRIBUTES = {
+    'Color': ['Black', 'White', 'Red', 'Blue', 'Green', 'Grey', 'Silver'],
+    'Material': ['Plastic', 'Steel', 'Aluminium', 'Cotton', 'Leather', 'Wood'],
+    'Size': ['S', 'M', 'L', 'XL'],
+    'Warranty': ['6 months', '1 year', '2 years'],
+    'Power': ['5 W', '20 W', '60 W', '800 W', '1500 W'],
+}
+
+
+def seed_email(role, number):
+    return f"{role}{number}@{SEED_DOMAIN}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with a synthetic storefront for benchmarks: sellers with stores, shoppers, "
+        "a category tree and products with attributes, images, ratings and questions, inserted in "
+        f"batches. Every account's password is '{SEED_PASSWORD}'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10000)
+        parser.add_argument('--sellers', type=int, default=50)
+        parser.add_argument('--shoppers', type=int, default=500)
+        parser.add_argument('--categories', type=int, default=40)
+        parser.add_argument('--images', type=int, default=3, help="Images per product.")
+        parser.add_argument('--ratings', type=int, default=5, help="Average ratings per product.")
+        parser.add_argument('--questions', type=int, default=1, help="Average questions per product.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--flush', action='store_true', help="Delete a previous seed first.")
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        seeded = CustomUser.objects.filter(email__endswith=f"@{SEED_DOMAIN}")
+        if seeded.exists():
+            if not options['flush']:
+                raise CommandError("The database is already seeded; pass --flush to replace the seed.")
+            with transaction.atomic():
+                Product.objects.filter(user__in=seeded).delete()
+                seeded.delete()
+                # Category.parent is PROTECT, so the subcategories have to go before their roots.
+                seed_categories = Category.objects.filter(c_name__startswith='Seed ')
+                seed_categories.filter(parent__isnull=False).delete()
+                seed_categories.delete()
+
+        started = time.perf_counter()
+        sellers = self.create_users('seller', options['sellers'])
+        shoppers = self.create_users('shopper', options['shoppers'])
+        StoreAccount.objects.bulk_create([
+            StoreAccount(user_id=seller, store_name=f"Seed Store {i}", contact_no="9800000000",
+                         store_logo="Store_logo/logo.png", verified=True)
+            for i, seller in enumerate(sellers)
+        ])
+        leaves = self.create_categories(options['categories'])
+
+        created = 0
+        while created < options['products']:
+            size = min(options['batch_size'], options['products'] - created)
+            self.create_products(created, size, sellers, shoppers, leaves, options)
+            created += size
+            self.stdout.write(f"  {created} products")
+
+        # bulk_create skips the signals that keep these current; rebuild them once at the end.
+        categories.rebuild()
+        call_command('rebuild_rating_aggregates', stdout=self.stdout)
+        call_command('rebuild_search_index', stdout=self.stdout)
+        for name in (caching.CATALOG, caching.CATEGORY_TREE, *caching.HOME_DEAL_RAILS):
+            caching.invalidate(name)
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(sellers)} sellers, {len(shoppers)} shoppers and {created} products "
+            f"in {time.perf_counter() - started:.1f}s."
+        ))
+
+    def create_users(self, role, count):
+        password = make_password(SEED_PASSWORD)  # hashing once keeps seeding fast
+        users = CustomUser.objects.bulk_create([
+            CustomUser(email=seed_email(role, i), first_name=role.title(), last_name=str(i), password=password)
+            for i in range(1, count + 1)
+        ], batch_size=1000)
+        return [user.pk for user in users]
+
+    def create_categories(self, count):
+        roots = Category.objects.bulk_create(
+            [Category(c_name=f"Seed {noun}s") for noun in NOUNS[:max(1, count // 5)]]
+        )
+        children = Category.objects.bulk_create([
+            Category(c_name=f"Seed {ADJECTIVES[i % len(ADJECTIVES)]} {root.c_name[5:]} {i}", parent=root)
+            for i, root in enumerate(roots[i % len(roots)] for i in range(count - len(roots)))
+        ])
+        return [category.pk for category in children or roots]
+
+    def create_products(self, offset, size, sellers, shoppers, leaves, options):
+        rnd = self.random
+        batch = []
+        for i in range(offset, offset + size):
+            keys = rnd.sample(sorted(ATTRIBUTES), rnd.randint(2, 4))
+            product = new_product(
+                None,
+                name=f"{rnd.choice(ADJECTIVES)} {rnd.choice(NOUNS)} {i}",
+                price=rnd.choice([199, 499, 799, 1299, 2499, 4999, 9999]),
+                discount=rnd.choice([0, 0, 0, 5, 10, 15, 25, 40, 60]),
+                brand=rnd.choice(BRANDS),
+                description={key: rnd.choice(ATTRIBUTES[key]) for key in keys},
+            )
+            product.user_id = rnd.choice(sellers)
+            batch.append(product)
+
+        with transaction.atomic():
+            products = Product.objects.bulk_create(batch)
+            ProductAttribute.objects.bulk_create(
+                [row for product in products for row in attribute_rows(product, product.description)]
+            )
+            ProductImage.objects.bulk_create([
+                ProductImage(product=product, image=f"Product_images/seed-{product.pk}-{n}.jpg",
+                             position=n, is_primary=n == 0)
+                for product in products for n in range(options['images'])
+            ])
+            ProductCategory.objects.bulk_create(
+                [ProductCategory(product=product, category_id=rnd.choice(leaves), direct=True) for product in products]
+            )
+            Stock.objects.bulk_create([Stock(product=product, available=rnd.randint(0, 200)) for product in products])
+            ProductRating.objects.bulk_create([
+                ProductRating(product=product, user_id=user, rating=rnd.choices([1, 2, 3, 4, 5], [1, 1, 2, 4, 5])[0])
+                for product in products
+                for user in rnd.sample(shoppers, min(len(shoppers), rnd.randint(0, 2 * options['ratings'])))
+            ])
+            ProductQuestion.objects.bulk_create([
+                ProductQuestion(product=product, user_id=rnd.choice(shoppers),
+                                question=f"Does the {product.name} come with a {rnd.choice(ATTRIBUTES['Warranty'])} warranty?")
+                for product in products
+                for _ in range(rnd.randint(0, 2 * options['questions']))
+            ])
@@ -0,0 +1,135 @@
+import random
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections
+from django.db.models import Sum
+
+from grabit_app import orders
+from grabit_app.catalog import new_product
+from grabit_app.models import Cart, CartItem, CustomUser, Order, OrderItem, Stock
+
+LOCK_RETRIES = 5
+
+
+class Command(BaseCommand):
+    help = (
+        "Flash-sale stress test: many buyers check out a product with little stock at once, from "
+        "worker threads against the configured database. Fails if any unit is oversold or stock "
+        "and orders disagree afterwards. With --products > 1 each cart also holds a random other "
+        "product, so checkouts lock several stock rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buyers', type=int, default=2000)
+        parser.add_argument('--stock', type=int, default=500, help="Units of the flash-sale product.")
+        parser.add_argument('--quantity', type=int, default=1, help="Units of it in each cart.")
+        parser.add_argument('--products', type=int, default=1, help="Products on sale, the first one is the hot one.")
+        parser.add_argument('--workers', type=int, default=16)
+
+    def handle(self, *args, **options):
+        buyers, workers, quantity = options['buyers'], options['workers'], options['quantity']
+        run = uuid.uuid4().hex[:8]
+        seller = CustomUser.objects.create_user(email=f"stress-seller-{run}@grabit.invalid")
+        products = []
+        for i in range(options['products']):
+            product = new_product(seller, f"Flash sale {i}", 100)
+            product.save()
+            products.append(product)
+        hot, others = products[0], products[1:]
+        stock = {product.pk: options['stock'] if product is hot else buyers for product in products}
+        Stock.objects.bulk_create([Stock(product_id=pid, available=units) for pid, units in stock.items()])
+
+        users = CustomUser.objects.bulk_create([
+            CustomUser(email=f"stress-{run}-{i}@grabit.invalid") for i in range(buyers)
+        ])
+        carts = Cart.objects.bulk_create([Cart(user=user) for user in users])
+        items = [CartItem(cart=cart, product=hot, quantity=quantity) for cart in carts]
+        items += [CartItem(cart=cart, product=random.choice(others), quantity=1) for cart in carts if others]
+        CartItem.objects.bulk_create(items, batch_size=1000)
+
+        placed, rejected, retries, errors, latencies = [], [], [0], [], []
+        lock = threading.Lock()
+
+        def buy(user):
+            started = time.perf_counter()
+            for attempt in range(LOCK_RETRIES):
+                try:
+                    order = orders.checkout(user)
+                except orders.OutOfStock:
+                    with lock:
+                        rejected.append(user.pk)
+                    return
+                except OperationalError as e:
+                    # SQLite reports a busy database instead of queueing once its timeout runs out.
+                    with lock:
+                        retries[0] += 1
+                    if attempt == LOCK_RETRIES - 1:
+                        with lock:
+                            errors.append(str(e))
+                        return
+                    time.sleep(0.01 * 2 ** attempt)
+                else:
+                    with lock:
+                        placed.append(order.pk)
+                        latencies.append(time.perf_counter() - started)
+                    return
+
+        def work(chunk):
+            try:
+                for user in chunk:
+                    buy(user)
+            finally:
+                connections.close_all()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(work, [users[i::workers] for i in range(workers)]))
+        elapsed = time.perf_counter() - started
+
+        try:
+            problems = self.check(stock, hot, placed, errors, buyers * quantity, quantity)
+            self.stdout.write(f"{buyers} buyers, {workers} workers, {options['stock']} units of the hot product")
+            self.stdout.write(
+                f"placed {len(placed)}, out of stock {len(rejected)}, failed {len(errors)}, "
+                f"lock retries {retries[0]} in {elapsed:.2f}s ({buyers / elapsed:.0f} checkouts/s)"
+            )
+            if latencies:
+                latencies.sort()
+                p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+                self.stdout.write(
+                    f"latency ms: p50={statistics.median(latencies) * 1000:.1f} "
+                    f"p95={p95 * 1000:.1f} max={latencies[-1] * 1000:.1f}"
+                )
+            for error in sorted(set(errors)):
+                self.stdout.write(self.style.WARNING(f"  {errors.count(error)} x {error}"))
+        finally:
+            Order.objects.filter(user__in=users).delete()
+            CustomUser.objects.filter(pk__in=[user.pk for user in users]).delete()
+            seller.delete()
+
+        if problems:
+            raise CommandError("; ".join(problems))
+        self.stdout.write(self.style.SUCCESS("No overselling."))
+
+    def check(self, stock, hot, placed, errors, demand, quantity):
+        problems = []
+        sold = dict(
+            OrderItem.objects.filter(order_id__in=placed).values('product_id').annotate(n=Sum('quantity'))
+            .values_list('product_id', 'n')
+        )
+        left = dict(Stock.objects.filter(product_id__in=stock).values_list('product_id', 'available'))
+        for product_id, units in stock.items():
+            if sold.get(product_id, 0) > units:
+                problems.append(f"product {product_id}: sold {sold[product_id]} of {units} units")
+            if left[product_id] != units - sold.get(product_id, 0):
+                problems.append(f"product {product_id}: {left[product_id]} left after selling "
+                                f"{sold.get(product_id, 0)} of {units}")
+        if not errors and demand >= stock[hot.pk] and left[hot.pk] >= quantity:
+            # Every buyer got an answer and there were more of them than units: nothing may be left unsold.
+            problems.append(f"hot product not sold out: {left[hot.pk]} units left")
+        return problems
@@ -0,0 +1,27 @@
+import sqlite3
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from grabit_app.replicas import replica_aliases
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the SQLite primary onto each replica file in REPLICA_SQLITE_PATHS, standing in for "
+        "replication when trying replica routing locally. Run it again to let the replicas catch up."
+    )
+
+    def handle(self, *args, **options):
+        primary = connections['default']
+        if primary.vendor != 'sqlite':
+            raise CommandError("Only SQLite replicas are synced here; PostgreSQL replicas stream from the primary.")
+        primary.ensure_connection()
+        for alias in replica_aliases():
+            connections[alias].close()
+            target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+            try:
+                primary.connection.backup(target)
+            finally:
+                target.close()
+            self.stdout.write(f"{alias}: synced")
@@ -0,0 +1,176 @@
+"""
+Uploaded media: a content-addressed storage backend and the view that serves MEDIA_ROOT.
+
+ContentAddressedStorage names each file after the SHA-256 of its bytes, so the same image
+uploaded for many products is stored once and its URL never changes meaning. `serve` sends
+files with zero-copy `sendfile` where the WSGI server offers it, answers single `Range`
+requests and `If-None-Match`/`If-Modified-Since`, and with MEDIA_ACCEL hands the transfer to
+nginx (X-Accel-Redirect) or Apache/lighttpd (X-Sendfile) instead.
+"""
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+import uuid
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import FileSystemStorage
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+CONTENT_ADDRESSED_NAME = re.compile(r'(?:^|/)[0-9a-f]{2}/([0-9a-f]{64})\.\w+$')
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Saves `<upload_to>/<ab>/<sha256>.<ext>`; a file whose bytes are already stored is not
+    written again. Files may be shared between rows, so `delete` keeps them: unreferenced
+    files are removed by `manage.py prune_media`, which calls `purge`.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # _save replaces the name with the digest; an existing file at the upload name is irrelevant.
+        return name
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        name = posixpath.join(posixpath.dirname(name), digest[:2], digest + os.path.splitext(name)[1].lower())
+        if self.exists(name):
+            return name
+        # Write under a private name, then rename into place. FileSystemStorage._save would retry
+        # the digest name forever if a concurrent upload of the same bytes created it first. A
+        # rename replaces it with identical bytes instead, and readers never see a partial file.
+        temporary = super()._save(f"{name}.{uuid.uuid4().hex}.part", content)
+        os.replace(self.path(temporary), self.path(name))
+        return name
+
+    def delete(self, name):
+        pass
+
+    def purge(self, name):
+        super().delete(name)
+
+
+def _is_public(name):
+    return name.split('/', 1)[0] in settings.MEDIA_PUBLIC_DIRS
+
+
+def _validators(name, stat):
+    match = CONTENT_ADDRESSED_NAME.search(name)
+    if match:
+        # The name is the content: a strong validator that survives copies between servers.
+        return f'"{match.group(1)}"', IMMUTABLE
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"', f'public, max-age={settings.MEDIA_MAX_AGE}'
+
+
+def parse_range(header, size):
+    """
+    (start, end) inclusive for a single `bytes=` range, None to send the whole file (no header,
+    several ranges, or syntax we don't honour), or False when the range can't be satisfied.
+    """
+    match = RANGE.match(header.replace(' ', ''))
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes.
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start, end = int(first), int(last) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+class RangeFile:
+    """At most `length` bytes of `f` from its current position; no fileno, so servers copy it in chunks."""
+
+    def __init__(self, f, length):
+        self.f, self.remaining = f, length
+
+    def read(self, size=-1):
+        size = self.remaining if size < 0 else min(size, self.remaining)
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.f.close()
+
+
+def _send(request, path, name, stat, etag, content_type):
+    accel = settings.MEDIA_ACCEL
+    if accel == 'x-accel-redirect':
+        # nginx serves the internal location (and any Range) itself.
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX.rstrip('/') + '/' + name
+        return response
+    if accel == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = path
+        return response
+
+    size = stat.st_size
+    byte_range = None
+    if request.method in ('GET', 'HEAD') and 'Range' in request.headers:
+        if_range = request.headers.get('If-Range')
+        if if_range is None or if_range in (etag, http_date(stat.st_mtime)):
+            byte_range = parse_range(request.headers['Range'], size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    f = open(path, 'rb')
+    if byte_range is None:
+        response = FileResponse(f, content_type=content_type, filename=posixpath.basename(name))
+    else:
+        start, end = byte_range
+        f.seek(start)
+        if end == size - 1:
+            # Runs to the end of the file: stream the real file so sendfile still applies.
+            response = FileResponse(f, content_type=content_type, filename=posixpath.basename(name))
+        else:
+            response = FileResponse(RangeFile(f, end - start + 1), content_type=content_type,
+                                    filename=posixpath.basename(name))
+        response.status_code = 206
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def serve(request, path):
+    """Send `path` from MEDIA_ROOT. Only MEDIA_PUBLIC_DIRS are public; staff can fetch the rest."""
+    name = posixpath.normpath(path).lstrip('/')
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, name)
+    except SuspiciousFileOperation:
+        raise Http404("Invalid path")
+    if not os.path.isfile(full_path) or not (_is_public(name) or request.user.is_staff):
+        raise Http404(f"{name} not found")
+
+    stat = os.stat(full_path)
+    etag, cache_control = _validators(name, stat)
+    if not _is_public(name):
+        cache_control = 'private, no-cache'
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        response = _send(request, full_path, name, stat, etag, content_type)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = cache_control
+    return response
@@ -0,0 +1,194 @@
+"""
+Per-request performance metrics. MetricsMiddleware times each request and, through a query
+wrapper on every database connection and a timing template backend, its queries and template
+rendering. The totals go out as a Server-Timing header and into rolling per-view windows that
+`render_prometheus` exposes as Prometheus summaries. Queries slower than SLOW_QUERY_MS are
+logged with their SQL and the stack that ran them.
+"""
+import logging
+import threading
+import time
+import traceback
+from collections import deque
+
+from asgiref.local import Local
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates
+
+slow_query_logger = logging.getLogger('grabit_app.slow_queries')
+
+WINDOW = 1024
+QUANTILES = (0.5, 0.9, 0.95, 0.99)
+METRICS = (
+    ('request_seconds', 'total', "Time to produce the response."),
+    ('db_seconds', 'db', "Time spent in database queries."),
+    ('db_queries', 'queries', "Database queries issued."),
+    ('template_seconds', 'template', "Time spent rendering templates."),
+)
+
+_current = Local()
+_windows = {}
+_windows_lock = threading.Lock()
+
+
+class RequestStats:
+    __slots__ = ('view', 'queries', 'db', 'template', 'total')
+
+    def __init__(self):
+        self.view, self.queries, self.db, self.template, self.total = None, 0, 0.0, 0.0, 0.0
+
+
+class Rolling:
+    """The last WINDOW samples, for quantiles, plus running totals for _sum and _count."""
+
+    def __init__(self):
+        self.samples = deque(maxlen=WINDOW)
+        self.count = 0
+        self.sum = 0.0
+
+    def add(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else 0.0
+
+
+def _stack():
+    # Only our own frames: the ORM and Django internals below them say nothing about the caller.
+    frames = [frame for frame in traceback.extract_stack()[:-3] if str(settings.BASE_DIR) in frame.filename]
+    return ''.join(traceback.format_list(frames))
+
+
+def timed_query(execute, sql, params, many, context):
+    """Execute wrapper installed on every connection (see signals.py)."""
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        stats = getattr(_current, 'stats', None)
+        if stats is not None:
+            stats.queries += 1
+            stats.db += duration
+        if duration * 1000 >= getattr(settings, 'SLOW_QUERY_MS', 200):
+            slow_query_logger.warning(
+                "Slow query (%.1f ms) in %s: %s; params=%r\n%s",
+                duration * 1000, getattr(stats, 'view', None) or 'no request', sql, params, _stack(),
+            )
+
+
+def install(connection):
+    if timed_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(timed_query)
+
+
+class TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            stats = getattr(_current, 'stats', None)
+            if stats is not None:
+                stats.template += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing each top-level render for the current request."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+def record(stats):
+    with _windows_lock:
+        for metric, attr, _ in METRICS:
+            _windows.setdefault((metric, stats.view), Rolling()).add(getattr(stats, attr))
+
+
+def render_prometheus():
+    lines = []
+    with _windows_lock:
+        for metric, _, help_text in METRICS:
+            name = f"grabit_{metric}"
+            lines += [f"# HELP {name} {help_text} Quantiles over each view's last {WINDOW} requests.",
+                      f"# TYPE {name} summary"]
+            for (key, view), window in sorted(_windows.items()):
+                if key != metric:
+                    continue
+                for q in QUANTILES:
+                    lines.append(f'{name}{{view="{view}",quantile="{q}"}} {window.quantile(q):.6g}')
+                lines.append(f'{name}_sum{{view="{view}"}} {window.sum:.6g}')
+                lines.append(f'{name}_count{{view="{view}"}} {window.count}')
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    with _windows_lock:
+        _windows.clear()
+
+
+class MetricsMiddleware:
+    """Outermost middleware: measures each request and adds its Server-Timing header."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.stats = None
+        return self.finish(request, response, stats)
+
+    async def __acall__(self, request):
+        stats = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.stats = None
+        return self.finish(request, response, stats)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Named now so slow queries logged during the view can say which view ran them.
+        stats = getattr(_current, 'stats', None)
+        if stats is not None:
+            stats.view = request.resolver_match.url_name or request.resolver_match.view_name
+
+    def start(self):
+        stats = RequestStats()
+        stats.total = time.perf_counter()
+        _current.stats = stats
+        return stats
+
+    def finish(self, request, response, stats):
+        stats.total = time.perf_counter() - stats.total
+        stats.view = stats.view or 'unmatched'
+        if stats.view != 'metrics':
+            record(stats)
+        if getattr(settings, 'SERVER_TIMING', True):
+            response['Server-Timing'] = (
+                f'db;dur={stats.db * 1000:.1f};desc="{stats.queries} queries", '
+                f'tpl;dur={stats.template * 1000:.1f}, total;dur={stats.total * 1000:.1f}'
+            )
+        return response
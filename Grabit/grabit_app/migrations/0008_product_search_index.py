@@ -0,0 +1,32 @@
+from django.db import migrations
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS grabit_app_product_fts "
+        "USING fts5(name, brand, description, prefix='2 3', tokenize='unicode61 remove_diacritics 2')"
+    )
+    # The unicode61 tokenizer drops JSON punctuation, so the raw column is enough for the backfill.
+    schema_editor.execute(
+        "INSERT INTO grabit_app_product_fts (rowid, name, brand, description) "
+        "SELECT id, name, brand, COALESCE(description, '') FROM grabit_app_product"
+    )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS grabit_app_product_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('grabit_app', '0007_product_old_price'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
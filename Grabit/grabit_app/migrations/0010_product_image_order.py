@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:43
+
+from django.db import migrations, models
+
+
+def number_existing_images(apps, schema_editor):
+    ProductImage = apps.get_model('grabit_app', 'ProductImage')
+    batch, product_id, position = [], None, 0
+    for image in ProductImage.objects.order_by('product_id', 'id').only('id', 'product_id').iterator():
+        position = position + 1 if image.product_id == product_id else 0
+        product_id = image.product_id
+        image.position = position
+        image.is_primary = position == 0
+        batch.append(image)
+    ProductImage.objects.bulk_update(batch, ['position', 'is_primary'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('grabit_app', '0009_product_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='productimage',
+            options={'ordering': ['position', 'id']},
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='is_primary',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='position',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.RunPython(number_existing_images, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='productimage',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_primary', True)), fields=('product',), name='unique_primary_product_image'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:47
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def move_cart_products_to_items(apps, schema_editor):
+    Cart = apps.get_model('grabit_app', 'Cart')
+    CartItem = apps.get_model('grabit_app', 'CartItem')
+    CartItem.objects.bulk_create(
+        [CartItem(cart_id=cart.id, product_id=cart.product_id, quantity=cart.quantity) for cart in Cart.objects.all()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('grabit_app', '0010_product_image_order'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CartItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)])),
+                ('cart', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='grabit_app.cart')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='grabit_app.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('cart', 'product'), name='unique_cart_product')],
+            },
+        ),
+        migrations.RunPython(move_cart_products_to_items, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='cart',
+            name='product',
+        ),
+        migrations.RemoveField(
+            model_name='cart',
+            name='quantity',
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('grabit_app', '0014_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductAnswer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('answer', models.TextField()),
+                ('is_seller', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='productquestion',
+            name='question_product_date_idx',
+        ),
+        migrations.AddField(
+            model_name='productquestion',
+            name='answer_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='productquestion',
+            index=models.Index(fields=['product', '-created_at', '-id'], name='question_product_date_idx'),
+        ),
+        migrations.AddField(
+            model_name='productanswer',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='grabit_app.productanswer'),
+        ),
+        migrations.AddField(
+            model_name='productanswer',
+            name='question',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='answers', to='grabit_app.productquestion'),
+        ),
+        migrations.AddField(
+            model_name='productanswer',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='productanswer',
+            index=models.Index(fields=['question', 'created_at'], name='answer_question_date_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_attributes(apps, schema_editor):
+    Product = apps.get_model('grabit_app', 'Product')
+    ProductAttribute = apps.get_model('grabit_app', 'ProductAttribute')
+    batch = []
+    for product_id, description in Product.objects.values_list('id', 'description').iterator(chunk_size=1000):
+        if not isinstance(description, dict):
+            continue
+        for key, value in description.items():
+            key, value = str(key).strip()[:100], str(value if value is not None else '').strip()[:255]
+            if key and value:
+                batch.append(ProductAttribute(product_id=product_id, key=key, value=value))
+        if len(batch) >= 1000:
+            ProductAttribute.objects.bulk_create(batch)
+            batch = []
+    ProductAttribute.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('grabit_app', '0016_category_tree'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductAttribute',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100)),
+                ('value', models.CharField(max_length=255)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['brand'], name='product_brand_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price'], name='product_price_idx'),
+        ),
+        migrations.AddField(
+            model_name='productattribute',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attributes', to='grabit_app.product'),
+        ),
+        migrations.AddIndex(
+            model_name='productattribute',
+            index=models.Index(fields=['key', 'value', 'product'], name='attribute_key_value_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='productattribute',
+            constraint=models.UniqueConstraint(fields=('product', 'key'), name='unique_product_attribute'),
+        ),
+        migrations.RunPython(backfill_attributes, migrations.RunPython.noop),
+    ]
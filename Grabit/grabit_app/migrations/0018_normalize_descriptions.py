@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:05
+
+from django.db import migrations, models
+
+
+def normalize_descriptions(apps, schema_editor):
+    """
+    Rebuild every product's attribute rows, with positions, from its description, then rewrite the
+    description as the exact copy of those rows. Plain-text descriptions (the old "<name> at <price>"
+    fallback) carry no specifications and become NULL.
+    """
+    Product = apps.get_model('grabit_app', 'Product')
+    ProductAttribute = apps.get_model('grabit_app', 'ProductAttribute')
+    ProductAttribute.objects.all().delete()
+    rows, products = [], []
+    for product in Product.objects.only('id', 'description').iterator(chunk_size=1000):
+        attributes = {}
+        if isinstance(product.description, dict):
+            for key, value in product.description.items():
+                key, value = str(key).strip()[:100], str(value if value is not None else '').strip()[:255]
+                if key and value:
+                    attributes[key] = value
+        rows += [
+            ProductAttribute(product_id=product.id, key=key, value=value, position=position)
+            for position, (key, value) in enumerate(attributes.items())
+        ]
+        if product.description != (attributes or None):
+            product.description = attributes or None
+            products.append(product)
+        if len(rows) >= 1000 or len(products) >= 1000:
+            ProductAttribute.objects.bulk_create(rows)
+            Product.objects.bulk_update(products, ['description'])
+            rows, products = [], []
+    ProductAttribute.objects.bulk_create(rows)
+    Product.objects.bulk_update(products, ['description'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('grabit_app', '0017_product_attributes'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='productattribute',
+            options={'ordering': ['position', 'id']},
+        ),
+        migrations.AddField(
+            model_name='productattribute',
+            name='position',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.RunPython(normalize_descriptions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.db import migrations
+
+
+def backfill_stock(apps, schema_editor):
+    """Give every product without a Stock row STOCK_BACKFILL units, so products from before 0019 stay orderable."""
+    Product = apps.get_model('grabit_app', 'Product')
+    Stock = apps.get_model('grabit_app', 'Stock')
+    missing = list(Product.objects.filter(stock__isnull=True).values_list('id', flat=True))
+    Stock.objects.bulk_create(
+        [Stock(product_id=product_id, available=settings.STOCK_BACKFILL) for product_id in missing], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('grabit_app', '0019_orders_and_stock'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_stock, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,12 @@
 from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db.models import UniqueConstraint
+from django.db.models import UniqueConstraint, F, Case, When, Value, FloatField
+from django.db.models.functions import Cast
 from django.utils import timezone
 from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils.functional import cached_property
 
 class CustomUserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
@@ -42,10 +45,27 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     def __str__(self):
         return self.email
 
+RATING_AVG_EXPRESSION = Case(
+    When(rating_count=0, then=Value(0.0)),
+    default=Cast('rating_sum', FloatField()) / Cast('rating_count', FloatField()),
+    output_field=FloatField(),
+)
+
+class ProductQuerySet(models.QuerySet):
+    def with_primary_image(self):
+        """Fetch each product's primary image in one extra query instead of one per product."""
+        return self.prefetch_related(models.Prefetch(
+            'productimage_set',
+            # At most one primary per product, so skip the Meta ordering and its sort.
+            queryset=ProductImage.objects.filter(is_primary=True).order_by(),
+            to_attr='primary_images',
+        ))
+
 class Product(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     name = models.CharField(max_length=255)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     price = models.DecimalField(
         default=0,
         decimal_places=2,
@@ -58,6 +78,7 @@ class Product(models.Model):
         max_digits=10,
         validators=[MinValueValidator(0)],
         )
+    # Read-only copy of the ProductAttribute rows, in order, for rendering; write via catalog.set_attributes.
     description = models.JSONField(null=True, blank=True)
     discount_percent = models.DecimalField(
         validators=[MinValueValidator(0.0), MaxValueValidator(100.0)],
@@ -66,45 +87,192 @@ class Product(models.Model):
         default=0.0
         )
     brand = models.CharField(max_length=100, default="No Brand")
+    categories = models.ManyToManyField('Category', through='ProductCategory', related_name='products', blank=True)
+
+    objects = ProductQuerySet.as_manager()
+
+    # One index per view ordering; `manage.py explain_queries` checks they are used.
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='product_newest_idx'),
+            models.Index(fields=['-discount_percent', '-id'], name='product_discount_idx'),
+            models.Index(fields=['-rating_avg', '-rating_count', '-id'], name='product_rating_idx'),
+            models.Index(fields=['user', '-created_at', '-id'], name='product_seller_newest_idx'),
+            # Facet counts and filters (grabit_app.facets).
+            models.Index(fields=['brand'], name='product_brand_idx'),
+            models.Index(fields=['price'], name='product_price_idx'),
+        ]
+
+    # Denormalized from ProductRating by signals; rebuild with `manage.py rebuild_rating_aggregates`.
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_avg = models.FloatField(default=0)
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
 
     def average_rating(self):
-        ratings = self.ratings.all()
-        if ratings.exists():
-            avg = sum(r.rating for r in ratings) / ratings.count()
-            return round(avg, 1)
+        if self.rating_count:
+            return round(self.rating_sum / self.rating_count, 1)
         return 0
 
-    def save(self, *args, **kwargs):
-        if not self.description:
-            self.description = f"{self.name} at {self.price}"
+    @property
+    def rating_histogram(self):
+        return {star: getattr(self, f"rating_{star}") for star in range(5, 0, -1)}
 
-        super().save(*args, **kwargs)
+    @classmethod
+    def adjust_ratings(cls, product_id, removed=None, added=None):
+        """Apply a rating change to the aggregate columns with F() expressions, no read needed."""
+        changes = {}
+        count = sum_delta = 0
+        if removed is not None:
+            count -= 1
+            sum_delta -= removed
+            changes[f"rating_{removed}"] = F(f"rating_{removed}") - 1
+        if added is not None:
+            count += 1
+            sum_delta += added
+            key = f"rating_{added}"
+            changes[key] = changes[key] + 1 if key in changes else F(key) + 1
+        if not changes:
+            return
+        cls.objects.filter(pk=product_id).update(
+            rating_count=F('rating_count') + count,
+            rating_sum=F('rating_sum') + sum_delta,
+            **changes,
+        )
+        cls.objects.filter(pk=product_id).update(rating_avg=RATING_AVG_EXPRESSION)
 
     def __str__(self):
         return f"{self.user.email} {self.name}"
     
+    @cached_property
+    def primary_image(self):
+        if hasattr(self, 'primary_images'):
+            return self.primary_images[0] if self.primary_images else None
+        prefetched = getattr(self, '_prefetched_objects_cache', {}).get('productimage_set')
+        if prefetched is not None:
+            return min(prefetched, key=lambda img: (not img.is_primary, img.position, img.id), default=None)
+        return self.productimage_set.order_by('-is_primary', 'position', 'id').first()
+
     @property
     def first_image(self):
-        first_img = self.productimage_set.first()  
+        first_img = self.primary_image
         if first_img:
             return first_img.image.url  
         return None
     
+class ProductAttribute(models.Model):
+    """One specification of a product. These rows are the source of truth; Product.description mirrors them."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='attributes')
+    key = models.CharField(max_length=100)
+    value = models.CharField(max_length=255)
+    position = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        ordering = ['position', 'id']
+        constraints = [
+            UniqueConstraint(fields=['product', 'key'], name='unique_product_attribute'),
+        ]
+        indexes = [
+            models.Index(fields=['key', 'value', 'product'], name='attribute_key_value_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.key}: {self.value}"
+
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     image = models.ImageField(upload_to='Product_images')
+    position = models.PositiveSmallIntegerField(default=0)
+    is_primary = models.BooleanField(default=False)
+
+    # Filled in by the background image pipeline (grabit_app/images.py).
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    renditions = models.JSONField(default=list, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['position', 'id']
+        constraints = [
+            UniqueConstraint(
+                fields=['product'], condition=models.Q(is_primary=True), name='unique_primary_product_image'
+            )
+        ]
 
     def __str__(self):
         return f"{self.product.name} - {self.image.name}"
+
+    def srcset(self, fmt):
+        return ", ".join(
+            f"{default_storage.url(r['name'])} {r['width']}w" for r in self.renditions if r['format'] == fmt
+        )
+
+    @property
+    def webp_srcset(self):
+        return self.srcset('webp')
+
+    @property
+    def jpeg_srcset(self):
+        return self.srcset('jpeg')
+
+class ImageJob(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    image = models.ForeignKey(ProductImage, on_delete=models.CASCADE, related_name='jobs')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='imagejob_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.image} [{self.status}]"
     
 class ProductQuestion(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     question = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # Kept up to date by the ProductAnswer signals so listing pages never count answers.
+    answer_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', '-created_at', '-id'], name='question_product_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.email} {self.question[:10]}..."
+
+class ProductAnswer(models.Model):
+    question = models.ForeignKey(ProductQuestion, on_delete=models.CASCADE, related_name='answers')
+    # Replies to another answer on the same question; top-level answers have no parent.
+    parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    answer = models.TextField()
+    is_seller = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['question', 'created_at'], name='answer_question_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.email} {self.answer[:10]}..."
     
 class ProductRating(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -114,6 +282,13 @@ class ProductRating(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what is stored so signals can apply the difference on update/delete.
+        instance._stored_rating = (instance.__dict__.get('product_id'), instance.__dict__.get('rating'))
+        return instance
+
     #Limit one user to rate a product only once
     class Meta:
         constraints = [
@@ -125,9 +300,39 @@ class ProductRating(models.Model):
     
 class Category(models.Model):
     c_name = models.CharField(max_length=77, unique=True)
+    # Move or delete the subcategories first; the tree is never cut implicitly.
+    parent = models.ForeignKey('self', on_delete=models.PROTECT, null=True, blank=True, related_name='children')
+    # Distinct products in this category or any category below it, kept current by grabit_app.categories.
+    product_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['parent', 'c_name'], name='category_parent_name_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets the post_save signal tell when the category moved within the tree.
+        instance._stored_parent_id = instance.parent_id
+        return instance
 
     def __str__(self):
         return self.c_name
+
+class ProductCategory(models.Model):
+    """
+    A product's membership of a category. Assigning a product to a category also stores a row for
+    every ancestor (direct=False), so any level of the tree is browsed with one indexed lookup.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    direct = models.BooleanField(default=True)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=['category', 'product'], name='unique_category_product'),
+        ]
     
 class StoreAccount(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -144,11 +349,65 @@ class StoreAccount(models.Model):
     
 class Cart(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+
+    def __str__(self):
+        return f"{self.user.email} cart"
+
+class CartItem(models.Model):
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.IntegerField(
         validators=[MinValueValidator(1)],
         default=1
     )
 
+    #One row per product in a cart, quantity is incremented in place
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=['cart', 'product'], name='unique_cart_product')
+        ]
+
+    def __str__(self):
+        return f"{self.cart.user.email} {self.product.name[:10]}... x{self.quantity}"
+
+class Stock(models.Model):
+    """
+    Units of a product available to order; no row means none. Kept out of Product so checkouts
+    lock only this row, never the product that rating updates and seller edits write to.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='stock')
+    # PositiveIntegerField is a CHECK (available >= 0) in the database: a backstop against overselling.
+    available = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.product.name} ({self.available} available)"
+
+class Order(models.Model):
+    PLACED = 'placed'
+    CANCELLED = 'cancelled'
+    STATUS_CHOICES = [(PLACED, 'Placed'), (CANCELLED, 'Cancelled')]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='orders')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PLACED)
+    total = models.DecimalField(decimal_places=2, max_digits=12, default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_newest_idx'),
+        ]
+
+    def __str__(self):
+        return f"Order #{self.pk} ({self.status})"
+
+class OrderItem(models.Model):
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
+    # Name and unit price as they were at checkout; the product may change or go away later.
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True)
+    name = models.CharField(max_length=255)
+    price = models.DecimalField(decimal_places=2, max_digits=10)
+    quantity = models.PositiveIntegerField(validators=[MinValueValidator(1)])
+
     def __str__(self):
-        return f"{self.user.email} {self.product.name[:10]}..."
\ No newline at end of file
+        return f"{self.name[:10]}... x{self.quantity}"
@@ -0,0 +1,81 @@
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import CartItem, Order, OrderItem, Product, Stock
+from . import caching
+
+
+class OutOfStock(ValueError):
+    def __init__(self, product_ids):
+        self.product_ids = product_ids
+        names = Product.objects.filter(id__in=product_ids).order_by('id').values_list('name', flat=True)
+        super().__init__(f"Not enough stock for {', '.join(names)}.")
+
+
+def reserve(items):
+    """
+    Take {product_id: quantity} out of stock, all or nothing; call inside a transaction.
+
+    Each product is one conditional UPDATE, `available = available - n WHERE available >= n`,
+    so the check and the decrement are a single statement that locks only that product's row:
+    concurrent checkouts of the same product queue on its row and see each other's decrements,
+    checkouts of other products don't wait at all. Rows are taken in product id order, so two
+    multi-item checkouts can never wait on each other in a cycle.
+    """
+    short = [
+        product_id for product_id in sorted(items)
+        if not Stock.objects.filter(product_id=product_id, available__gte=items[product_id]).update(
+            available=F('available') - items[product_id]
+        )
+    ]
+    if short:
+        # Raising rolls back the decrements already made in the caller's transaction.
+        raise OutOfStock(short)
+
+
+def release(items):
+    """Put {product_id: quantity} back into stock."""
+    for product_id in sorted(items):
+        Stock.objects.filter(product_id=product_id).update(available=F('available') + items[product_id])
+
+
+def checkout(user):
+    """Turn the user's cart into a placed order, reserving its stock. Raises ValueError when it can't."""
+    with transaction.atomic():
+        lines = list(CartItem.objects.filter(cart__user=user).select_related('product').order_by('product_id'))
+        if not lines:
+            raise ValueError("Your cart is empty.")
+        order = Order.objects.create(
+            user=user, total=sum(line.product.price * line.quantity for line in lines),
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=line.product, name=line.product.name, price=line.product.price,
+                      quantity=line.quantity)
+            for line in lines
+        ])
+        # Stock rows are the contended ones, so they are locked last and held only until the commit below.
+        reserve({line.product_id: line.quantity for line in lines})
+        # The delete is the guard against a double submit: the lines were read without a lock, so
+        # a concurrent checkout of the same cart may have read them too. Only one can delete them.
+        deleted, _ = CartItem.objects.filter(pk__in=[line.pk for line in lines]).delete()
+        if deleted != len(lines):
+            raise ValueError("Your cart changed during checkout. Please try again.")
+        transaction.on_commit(lambda: caching.invalidate_cart_count(user.pk))
+    return order
+
+
+def cancel(order):
+    """Cancel a placed order and return its items to stock. Returns False if it was no longer placed."""
+    with transaction.atomic():
+        # The status change is the guard: of two concurrent cancels only one releases the stock.
+        if not Order.objects.filter(pk=order.pk, status=Order.PLACED).update(
+            status=Order.CANCELLED, updated_at=timezone.now()
+        ):
+            return False
+        items = {}
+        for product_id, quantity in order.items.exclude(product=None).values_list('product_id', 'quantity'):
+            items[product_id] = items.get(product_id, 0) + quantity
+        release(items)
+    order.status = Order.CANCELLED
+    return True
@@ -0,0 +1,103 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 50
+
+
+def encode_cursor(key):
+    """Turn a sort key (tuple of JSON-serialisable values) into an opaque URL-safe token."""
+    raw = json.dumps(list(key), separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Inverse of encode_cursor; returns None for a missing or tampered cursor."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        key = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    return tuple(key) if isinstance(key, list) else None
+
+
+def page_size(request):
+    try:
+        size = int(request.GET.get('size', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return DEFAULT_PAGE_SIZE
+    return min(max(size, 1), MAX_PAGE_SIZE)
+
+
+NEWEST_FIRST = ('-created_at', '-id')
+
+
+def keyset_key(obj, ordering):
+    """Cursor key of `obj` under `ordering`: the string form of each ordering field."""
+    return tuple(obj._meta.get_field(name.lstrip('-')).value_to_string(obj) for name in ordering)
+
+
+def keyset_filter(model, ordering, after):
+    """
+    Q object selecting rows strictly after `after` under `ordering`, i.e. the expansion of
+    (a, b, c) > (x, y, z) honouring each field's direction. Returns None for an unusable key.
+    """
+    if not after or len(after) != len(ordering):
+        return None
+    try:
+        values = [model._meta.get_field(name.lstrip('-')).to_python(value) for name, value in zip(ordering, after)]
+    except (ValidationError, TypeError, ValueError):
+        # Tampered keys: wrong types (e.g. objects for dates) fail in to_python.
+        return None
+    if any(value is None for value in values):
+        return None
+
+    # The redundant bound on the leading field lets the database seek the index to the cursor
+    # instead of walking it from the start (SQLite can't use an index for the OR chain alone).
+    first = ordering[0]
+    bound = Q(**{f"{first.lstrip('-')}__{'lte' if first.startswith('-') else 'gte'}": values[0]})
+
+    condition = Q()
+    for i, name in enumerate(ordering):
+        field = name.lstrip('-')
+        lookup = 'lt' if name.startswith('-') else 'gt'
+        step = Q(**{f"{field}__{lookup}": values[i]})
+        for prev_name, prev_value in zip(ordering[:i], values[:i]):
+            step &= Q(**{prev_name.lstrip('-'): prev_value})
+        condition |= step
+    return bound & condition
+
+
+def keyset_queryset(queryset, ordering, after, size):
+    """The query keyset_page runs: ordered, positioned after `after`, one row more than a page."""
+    queryset = queryset.order_by(*ordering)
+    condition = keyset_filter(queryset.model, ordering, after)
+    if condition is not None:
+        queryset = queryset.filter(condition)
+    # One extra row tells us whether a next page exists without a COUNT query.
+    return queryset[:size + 1]
+
+
+def keyset_page(queryset, ordering, after, size):
+    """
+    One page of `queryset` under `ordering` (which must end in a unique field) starting right
+    after `after`, a decoded cursor key. Each page is a range scan from the previous page's
+    last row, so deep pages cost the same as the first.
+    Returns (items, next_cursor); next_cursor is None on the last page.
+    """
+    return _page(list(keyset_queryset(queryset, ordering, after, size)), ordering, size)
+
+
+async def akeyset_page(queryset, ordering, after, size):
+    """keyset_page for async views, through the async ORM."""
+    return _page([item async for item in keyset_queryset(queryset, ordering, after, size)], ordering, size)
+
+
+def _page(items, ordering, size):
+    next_cursor = encode_cursor(keyset_key(items[size - 1], ordering)) if len(items) > size else None
+    return items[:size], next_cursor
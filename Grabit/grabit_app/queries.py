@@ -0,0 +1,147 @@
+"""
+The database queries behind each view. Views build their querysets here so that
+`manage.py explain_queries` can EXPLAIN exactly what they run.
+"""
+from django.db.models import Count, Max, OuterRef, Subquery, Sum
+from django.utils import timezone
+
+from .models import (
+    CartItem, Category, ImageJob, Product, ProductAnswer, ProductAttribute, ProductCategory, ProductImage,
+    ProductQuestion,
+)
+from .pagination import NEWEST_FIRST
+
+REGISTRY = {}
+
+DISCOUNT_FIRST = ('-discount_percent', '-id')
+RATING_FIRST = ('-rating_avg', '-rating_count', '-id')
+LISTING_ORDERINGS = {'newest': NEWEST_FIRST, 'rating': RATING_FIRST}
+OLDEST_FIRST = ('created_at', 'id')
+CATEGORY_ORDER = ('-product_id',)
+
+
+def audited(ordering=None, name=None, **sample_kwargs):
+    """
+    Register a query builder for the plan audit. `sample_kwargs` are the arguments used to build
+    it; `ordering` marks builders whose queryset is paged with keyset_page under that ordering.
+    Stack the decorator with a `name` to audit the same builder under another ordering.
+    """
+    def decorator(func):
+        REGISTRY[name or func.__name__] = (func, sample_kwargs, ordering)
+        return func
+    return decorator
+
+
+@audited()
+def all_categories():
+    return Category.objects.order_by('c_name')
+
+
+@audited(parent_id=1)
+def subcategories(parent_id):
+    return Category.objects.filter(parent_id=parent_id).order_by('c_name')
+
+
+@audited(ordering=CATEGORY_ORDER, category_id=1)
+def category_memberships(category_id):
+    """A category's products, newest id first, read off the (category, product) unique index."""
+    return ProductCategory.objects.filter(category_id=category_id)
+
+
+@audited()
+def home_discount_deals():
+    return Product.objects.with_primary_image().order_by(*DISCOUNT_FIRST)[:5]
+
+
+@audited()
+def home_latest_deals():
+    return Product.objects.with_primary_image().order_by(*NEWEST_FIRST)[:5]
+
+
+@audited(product_ids=[1, 2, 3])
+def primary_images(product_ids):
+    """What Product.objects.with_primary_image() prefetches."""
+    return ProductImage.objects.filter(is_primary=True, product_id__in=product_ids).order_by()
+
+
+@audited(ordering=RATING_FIRST, name='product_listing_by_rating', min_rating=4)
+@audited(ordering=NEWEST_FIRST, name='product_listing_by_date_with_rating', min_rating=4)
+@audited(ordering=NEWEST_FIRST)
+def product_listing(min_rating=0):
+    products = Product.objects.with_primary_image()
+    if min_rating:
+        products = products.filter(rating_avg__gte=min_rating)
+    return products
+
+
+@audited(products=Product.objects.all())
+def brand_counts(products):
+    return products.order_by().values('brand').annotate(count=Count('id')).order_by()
+
+
+@audited(products=Product.objects.all())
+def attribute_counts(products):
+    """Products per (key, value) among `products`; unfiltered, it reads only the attribute index."""
+    attributes = ProductAttribute.objects.all()
+    if products.query.where:
+        attributes = attributes.filter(product__in=products.values('id'))
+    return attributes.values('key', 'value').annotate(count=Count('product_id')).order_by()
+
+
+@audited(ordering=NEWEST_FIRST, user_id=1)
+def seller_products(user_id):
+    return Product.objects.with_primary_image().filter(user_id=user_id)
+
+
+@audited(product_id=1)
+def product_detail(product_id):
+    """The product with its seller and store in one query, plus one for its images."""
+    return Product.objects.filter(pk=product_id).select_related('user__storeaccount').prefetch_related(
+        'productimage_set'
+    )
+
+
+@audited(product_id=1)
+def product_version(product_id):
+    """
+    Everything the product page's ETag/Last-Modified depend on, in one query: the product's own
+    timestamp and rating totals plus the count and newest timestamp of its images, questions and answers.
+    """
+    images = ProductImage.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    questions = ProductQuestion.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    answers = ProductAnswer.objects.filter(question__product=OuterRef('pk')).order_by().values('question__product')
+    return Product.objects.filter(pk=product_id).values('updated_at', 'rating_count', 'rating_sum').annotate(
+        image_count=Subquery(images.annotate(n=Count('id')).values('n')),
+        image_updated=Subquery(images.annotate(last=Max('updated_at')).values('last')),
+        question_count=Subquery(questions.annotate(n=Count('id')).values('n')),
+        question_created=Subquery(questions.annotate(last=Max('created_at')).values('last')),
+        answer_count=Subquery(questions.annotate(n=Sum('answer_count')).values('n')),
+        answer_created=Subquery(answers.annotate(last=Max('created_at')).values('last')),
+    )
+
+
+@audited(ordering=NEWEST_FIRST, product_id=1)
+def product_questions(product_id):
+    return ProductQuestion.objects.filter(product_id=product_id).select_related('user')
+
+
+@audited(ordering=OLDEST_FIRST, question_id=1)
+def question_answers(question_id):
+    """Answers in the order they were given, so a reply always comes after the answer it replies to."""
+    return ProductAnswer.objects.filter(question_id=question_id).select_related('user')
+
+
+@audited(user_id=1)
+def cart_items(user_id):
+    return CartItem.objects.filter(cart__user_id=user_id)
+
+
+@audited()
+def pending_image_jobs():
+    return ImageJob.objects.filter(status=ImageJob.PENDING).order_by('id')
+
+
+@audited(stale_before=timezone.now())
+def stale_image_jobs(stale_before):
+    """Running jobs whose worker stopped updating them before `stale_before`."""
+    return ImageJob.objects.filter(status=ImageJob.RUNNING, updated_at__lt=stale_before).order_by('id')
@@ -0,0 +1,83 @@
+"""
+Failed-login counters in the shared cache, per client IP and per email, each in a fixed window.
+Once either is over its limit, logins are refused before a password is hashed.
+"""
+import hashlib
+import ipaddress
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+
+# (max failures, window in seconds)
+IP_LIMIT = (30, 60 * 10)
+EMAIL_LIMIT = (5, 60 * 15)
+
+
+@lru_cache(maxsize=4)
+def _networks(proxies):
+    return tuple(ipaddress.ip_network(proxy, strict=False) for proxy in proxies)
+
+
+def _trusted(address, networks):
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(address in network for network in networks)
+
+
+def client_ip(request):
+    """
+    The address of the client that sent `request`. X-Forwarded-For is whatever the client sends,
+    so it is read only when REMOTE_ADDR is one of TRUSTED_PROXIES, and then from the right: the
+    first hop that isn't a trusted proxy is the client.
+    """
+    if request is None:
+        return ''
+    address = request.META.get('REMOTE_ADDR', '')
+    networks = _networks(tuple(settings.TRUSTED_PROXIES))
+    if not _trusted(address, networks):
+        return address
+    for hop in reversed(request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')):
+        hop = hop.strip()
+        if not hop:
+            continue
+        address = hop
+        if not _trusted(hop, networks):
+            break
+    return address
+
+
+def _digest(value):
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+def _counters(request, email):
+    counters = {}
+    if request is not None:
+        counters[f"login-failures:ip:{_digest(client_ip(request))}"] = IP_LIMIT
+    if email:
+        counters[f"login-failures:email:{_digest(email.strip().lower())}"] = EMAIL_LIMIT
+    return counters
+
+
+def login_blocked(request, email):
+    counters = _counters(request, email)
+    counts = cache.get_many(counters)
+    return any(counts.get(key, 0) >= limit for key, (limit, _) in counters.items())
+
+
+def record_login_failure(request, email):
+    for key, (_, window) in _counters(request, email).items():
+        # add() opens the window; incr() leaves its expiry alone.
+        cache.add(key, 0, window)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, window)
+
+
+def reset_login_failures(email):
+    """A successful login clears the email's failures; the IP's stay until its window ends."""
+    cache.delete_many(list(_counters(None, email)))
@@ -0,0 +1,155 @@
+"""
+Read replicas for catalog browsing. Views wrapped in `read_only` send their reads to one of
+settings.DATABASE_REPLICAS, picked round-robin among the healthy ones; everything else, every
+write and any read made after a write, goes to the primary. A visitor who just POSTed is pinned
+to the primary for a few seconds so they never miss their own change on a lagging replica.
+"""
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from asgiref.local import Local
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+PIN_COOKIE = 'primary_pin'
+PIN_SECONDS = 10
+RETRY_AFTER = 30
+ROUTED_APPS = ('grabit_app',)
+
+_state = Local()
+_turn = itertools.count()
+_down = {}
+_down_lock = threading.Lock()
+
+
+def replica_aliases():
+    return list(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+def _healthy(alias):
+    """A replica is usable unless it failed to connect within the last RETRY_AFTER seconds."""
+    with _down_lock:
+        if time.monotonic() < _down.get(alias, 0):
+            return False
+    connection = connections[alias]
+    if connection.connection is None:
+        try:
+            connection.ensure_connection()
+        except DatabaseError:
+            with _down_lock:
+                _down[alias] = time.monotonic() + RETRY_AFTER
+            return False
+    return True
+
+
+def choose_replica():
+    aliases = replica_aliases()
+    start = next(_turn)
+    for i in range(len(aliases)):
+        alias = aliases[(start + i) % len(aliases)]
+        if _healthy(alias):
+            return alias
+    return DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def use_replicas():
+    """Route reads in this block to a single replica, chosen on the first read."""
+    previous = getattr(_state, 'replica', None), getattr(_state, 'active', False)
+    _state.replica, _state.active = None, True
+    try:
+        yield
+    finally:
+        _state.replica, _state.active = previous
+
+
+@contextmanager
+def use_primary():
+    """
+    Route reads in this block to the primary. For anything stored under a cache generation: a
+    write bumps the generation at once, and a copy rebuilt from a lagging replica would be kept
+    under the new generation for its whole timeout.
+    """
+    previous = getattr(_state, 'replica', None), getattr(_state, 'active', False)
+    _state.replica, _state.active = None, False
+    try:
+        yield
+    finally:
+        _state.replica, _state.active = previous
+
+
+def is_pinned(request):
+    return PIN_COOKIE in request.COOKIES
+
+
+def read_only(view):
+    """Serve GET/HEAD requests of `view` from a replica unless the visitor is pinned to the primary."""
+    def routed(request):
+        return request.method in ('GET', 'HEAD') and not is_pinned(request) and replica_aliases()
+
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            if not routed(request):
+                return await view(request, *args, **kwargs)
+            with use_replicas():
+                return await view(request, *args, **kwargs)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not routed(request):
+            return view(request, *args, **kwargs)
+        with use_replicas():
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not getattr(_state, 'active', False) or model._meta.app_label not in ROUTED_APPS:
+            return None
+        if _state.replica is None:
+            _state.replica = choose_replica()
+        return _state.replica
+
+    def db_for_write(self, model, **hints):
+        if getattr(_state, 'active', False):
+            # Whatever the view reads next must see this write.
+            _state.replica = DEFAULT_DB_ALIAS
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary.
+        return False if db in replica_aliases() else None
+
+
+class PinToPrimaryMiddleware:
+    """After a POST (or any unsafe request), read from the primary for PIN_SECONDS."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.pin(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.pin(request, await self.get_response(request))
+
+    def pin(self, request, response):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and replica_aliases():
+            response.set_cookie(PIN_COOKIE, '1', max_age=PIN_SECONDS, httponly=True, samesite='Lax')
+        return response
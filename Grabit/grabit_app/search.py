@@ -0,0 +1,158 @@
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+FTS_TABLE = 'grabit_app_product_fts'
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def description_text(description):
+    """Flatten a product description (dict of feature/value or plain text) into searchable text."""
+    if isinstance(description, dict):
+        return ' '.join(f"{key} {value}" for key, value in description.items())
+    return str(description or '')
+
+
+def _is_score_key(key):
+    """A (score, rowid) keyset position as SQLiteFTSBackend.search_page hands them out."""
+    return (
+        isinstance(key, (list, tuple)) and len(key) == 2
+        and all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in key)
+        and isinstance(key[1], int)
+    )
+
+
+class BaseSearchBackend:
+    """Interface every search backend implements."""
+
+    def index(self, product):
+        raise NotImplementedError
+
+    def remove(self, product_id):
+        raise NotImplementedError
+
+    def search_page(self, query, limit=20, after=None):
+        """
+        Return up to `limit` (product_id, key) pairs in relevance order. `key` is the
+        keyset position of the row; pass the last one back as `after` to get the next page.
+        """
+        raise NotImplementedError
+
+    def search(self, query, limit=20):
+        return [product_id for product_id, _ in self.search_page(query, limit)]
+
+    def index_many(self, products):
+        for product in products:
+            self.index(product)
+
+    def rebuild(self, products):
+        self.index_many(products)
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """
+    Fallback for databases without a full-text engine: no index of its own, each search scans
+    the Product table for terms in the name, brand or description, newest first.
+    """
+
+    def index(self, product):
+        pass
+
+    def remove(self, product_id):
+        pass
+
+    def search_page(self, query, limit=20, after=None):
+        from .models import Product
+        from .pagination import NEWEST_FIRST, keyset_key, keyset_page
+
+        terms = TOKEN_RE.findall(query)
+        if not terms:
+            return []
+        condition = Q()
+        for term in terms:
+            # description is JSON; icontains matches its serialised feature names and values.
+            condition &= Q(name__icontains=term) | Q(brand__icontains=term) | Q(description__icontains=term)
+        queryset = Product.objects.filter(condition).only('id', 'created_at')
+        items, _ = keyset_page(queryset, NEWEST_FIRST, after, limit)
+        return [(p.pk, keyset_key(p, NEWEST_FIRST)) for p in items]
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """SQLite FTS5 inverted index over name, brand and description, ranked with bm25."""
+
+    # Column weights for bm25(): a hit in the name counts more than one in the brand or description.
+    weights = (10.0, 5.0, 1.0)
+
+    def index(self, product):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [product.pk])
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, name, brand, description) VALUES (%s, %s, %s, %s)",
+                [product.pk, product.name, product.brand, description_text(product.description)],
+            )
+
+    def index_many(self, products):
+        rows = [(p.pk, p.name, p.brand, description_text(p.description)) for p in products]
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(row[0],) for row in rows])
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE} (rowid, name, brand, description) VALUES (%s, %s, %s, %s)", rows
+            )
+
+    def remove(self, product_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [product_id])
+
+    def match_expression(self, query):
+        # Every term must match, each as a prefix so partially typed words still hit.
+        terms = [term.replace('"', '') for term in TOKEN_RE.findall(query)]
+        if not terms:
+            return None
+        return ' AND '.join(f'"{term}"*' for term in terms)
+
+    def search_page(self, query, limit=20, after=None):
+        match = self.match_expression(query)
+        if match is None:
+            return []
+        weights = ', '.join(str(w) for w in self.weights)
+        sql = f"SELECT rowid, bm25({FTS_TABLE}, {weights}) AS score FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s"
+        params = [match]
+        if not _is_score_key(after):
+            # A tampered cursor starts from the first page, like decode_cursor's None.
+            after = None
+        if after:
+            # Keyset on (score, rowid): continue right after the last row of the previous page.
+            sql += " AND (score > %s OR (score = %s AND rowid > %s))"
+            params += [after[0], after[0], after[1]]
+        sql += " ORDER BY score, rowid LIMIT %s"
+        params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [(rowid, (score, rowid)) for rowid, score in cursor.fetchall()]
+
+    def rebuild(self, products, batch_size=2000):
+        insert = f"INSERT INTO {FTS_TABLE} (rowid, name, brand, description) VALUES (%s, %s, %s, %s)"
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+            batch = []
+            for p in products:
+                batch.append((p.pk, p.name, p.brand, description_text(p.description)))
+                if len(batch) >= batch_size:
+                    cursor.executemany(insert, batch)
+                    batch = []
+            if batch:
+                cursor.executemany(insert, batch)
+
+
+@lru_cache(maxsize=None)
+def get_backend():
+    path = getattr(settings, 'SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    if connection.vendor == 'sqlite':
+        return SQLiteFTSBackend()
+    return DatabaseSearchBackend()
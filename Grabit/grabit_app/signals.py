@@ -0,0 +1,240 @@
+from django.db import IntegrityError, transaction
+from django.db.backends.signals import connection_created
+from django.contrib.auth.signals import user_logged_in, user_login_failed
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
+from django.db.models import F
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import (
+    Cart, CartItem, Category, Product, ProductAnswer, ProductImage, ProductQuestion, ProductRating, StoreAccount,
+)
+from .search import get_backend
+from . import caching, cart, categories, metrics, ratelimit
+
+
+@receiver(connection_created)
+def time_queries(sender, connection, **kwargs):
+    metrics.install(connection)
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not {'name', 'brand', 'description'} & set(update_fields):
+        return
+    get_backend().index(instance)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    get_backend().remove(instance.pk)
+
+
+@receiver(post_save, sender=ProductRating)
+def add_rating_to_aggregates(sender, instance, **kwargs):
+    old_product_id, old_rating = getattr(instance, '_stored_rating', (None, None))
+    with transaction.atomic():
+        if old_product_id == instance.product_id:
+            if old_rating != instance.rating:
+                Product.adjust_ratings(instance.product_id, removed=old_rating, added=instance.rating)
+        else:
+            if old_product_id is not None:
+                Product.adjust_ratings(old_product_id, removed=old_rating)
+            Product.adjust_ratings(instance.product_id, added=instance.rating)
+    instance._stored_rating = (instance.product_id, instance.rating)
+
+
+@receiver(post_delete, sender=ProductRating)
+def remove_rating_from_aggregates(sender, instance, **kwargs):
+    product_id, rating = getattr(instance, '_stored_rating', (instance.product_id, instance.rating))
+    with transaction.atomic():
+        Product.adjust_ratings(product_id, removed=rating)
+
+
+@receiver(post_save, sender=ProductAnswer)
+def count_new_answer(sender, instance, created, **kwargs):
+    if created:
+        ProductQuestion.objects.filter(pk=instance.question_id).update(answer_count=F('answer_count') + 1)
+
+
+@receiver(post_delete, sender=ProductAnswer)
+def count_removed_answer(sender, instance, **kwargs):
+    ProductQuestion.objects.filter(pk=instance.question_id).update(answer_count=F('answer_count') - 1)
+
+
+def promote_primary_image(product_id):
+    """
+    Make the product's first image by position its primary one, so listings have an image to
+    show. Returns the promoted image's pk, or None.
+    """
+    first = ProductImage.objects.filter(product_id=product_id).order_by('position', 'id').values_list('pk', flat=True).first()
+    if first is None:
+        return None
+    try:
+        with transaction.atomic():
+            # Another image may have become primary meanwhile; then it stays the primary.
+            promoted = ProductImage.objects.filter(pk=first).exclude(
+                product__productimage__is_primary=True
+            ).update(is_primary=True, updated_at=timezone.now())
+    except IntegrityError:
+        return None
+    return first if promoted else None
+
+
+@receiver(pre_save, sender=ProductImage)
+def demote_previous_primary_image(sender, instance, update_fields=None, **kwargs):
+    # Ticking is_primary on another image (e.g. in the admin) moves the flag instead of breaking the constraint.
+    if instance.is_primary and not (update_fields and 'is_primary' not in update_fields):
+        ProductImage.objects.filter(product_id=instance.product_id, is_primary=True).exclude(pk=instance.pk).update(
+            is_primary=False, updated_at=timezone.now()
+        )
+
+
+@receiver(post_save, sender=ProductImage)
+def ensure_primary_image(sender, instance, update_fields=None, **kwargs):
+    # Images added in the admin aren't primary by default; the pipeline's saves don't touch the flag.
+    if instance.is_primary or (update_fields and 'is_primary' not in update_fields):
+        return
+    if not ProductImage.objects.filter(product_id=instance.product_id, is_primary=True).exists():
+        instance.is_primary = promote_primary_image(instance.product_id) == instance.pk
+
+
+@receiver(post_delete, sender=ProductImage)
+def replace_deleted_primary_image(sender, instance, origin=None, **kwargs):
+    if instance.is_primary and not isinstance(origin, Product):
+        promote_primary_image(instance.product_id)
+
+
+def invalidate_on_commit(*names):
+    # Wait for the commit so a concurrent rebuild can't cache the pre-commit rows under the new generation.
+    def run():
+        for name in names:
+            caching.invalidate(name)
+    transaction.on_commit(run)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_home_deals(sender, instance, **kwargs):
+    invalidate_on_commit(*caching.HOME_DEAL_RAILS)
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def invalidate_home_deal_images(sender, instance, **kwargs):
+    # Only the rails that actually show this product need rebuilding.
+    names = [name for name in caching.HOME_DEAL_RAILS if instance.product_id in caching.cached_ids(name)]
+    if names:
+        invalidate_on_commit(*names)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_tree(sender, instance, **kwargs):
+    invalidate_on_commit(caching.CATEGORY_TREE)
+
+
+@receiver(post_save, sender=Category)
+def rebuild_memberships_on_move(sender, instance, created, **kwargs):
+    if not created and instance.parent_id != getattr(instance, '_stored_parent_id', instance.parent_id):
+        categories.rebuild_products(categories.member_ids(instance))
+    instance._stored_parent_id = instance.parent_id
+
+
+@receiver(pre_delete, sender=Category)
+def remember_members_before_delete(sender, instance, **kwargs):
+    # The cascade takes the category's own rows; read its products while they are still there.
+    instance._member_ids = categories.member_ids(instance) if instance.parent_id is not None else []
+
+
+@receiver(post_delete, sender=Category)
+def rebuild_memberships_on_delete(sender, instance, **kwargs):
+    # Ancestors may still hold implied memberships that only this category justified.
+    categories.rebuild_products(getattr(instance, '_member_ids', []))
+
+
+@receiver(pre_delete, sender=Product)
+def remove_product_from_category_counts(sender, instance, **kwargs):
+    categories.remove_product(instance)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_pages(sender, instance, **kwargs):
+    invalidate_on_commit(caching.CATALOG, caching.product_page(instance.pk))
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=ProductRating)
+@receiver(post_delete, sender=ProductRating)
+def invalidate_product_pages_for_related(sender, instance, **kwargs):
+    # Images and ratings show in listings as well as on the product page.
+    invalidate_on_commit(caching.CATALOG, caching.product_page(instance.product_id))
+
+
+@receiver(post_save, sender=ProductQuestion)
+@receiver(post_delete, sender=ProductQuestion)
+def invalidate_product_page_for_question(sender, instance, **kwargs):
+    invalidate_on_commit(caching.product_page(instance.product_id))
+
+
+@receiver(post_save, sender=ProductAnswer)
+@receiver(post_delete, sender=ProductAnswer)
+def invalidate_product_page_for_answer(sender, instance, **kwargs):
+    if ProductAnswer.question.is_cached(instance):
+        product_id = instance.question.product_id
+    else:
+        # A cascade from a deleted question, which invalidates the page itself, may already have removed it.
+        product_id = ProductQuestion.objects.filter(pk=instance.question_id).values_list('product_id', flat=True).first()
+    if product_id is not None:
+        invalidate_on_commit(caching.product_page(product_id))
+
+
+@receiver(post_save, sender=StoreAccount)
+@receiver(post_delete, sender=StoreAccount)
+def invalidate_store_product_pages(sender, instance, **kwargs):
+    product_ids = Product.objects.filter(user_id=instance.user_id).values_list('id', flat=True)
+    invalidate_on_commit(*[caching.product_page(pk) for pk in product_ids])
+
+
+def invalidate_cart_counts_on_commit(user_ids):
+    def run():
+        for user_id in user_ids:
+            caching.invalidate_cart_count(user_id)
+    transaction.on_commit(run)
+
+
+# The cart module invalidates counts itself; these cover writes made outside it (admin, cascades).
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def invalidate_cart_count(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Product):
+        # Handled in one query for all the product's carts by invalidate_cart_counts_for_product.
+        return
+    invalidate_cart_counts_on_commit(Cart.objects.filter(pk=instance.cart_id).values_list('user_id', flat=True))
+
+
+@receiver(pre_delete, sender=Product)
+def invalidate_cart_counts_for_product(sender, instance, **kwargs):
+    invalidate_cart_counts_on_commit(
+        list(CartItem.objects.filter(product=instance).values_list('cart__user_id', flat=True))
+    )
+
+
+@receiver(user_logged_in)
+def merge_guest_cart(sender, request, user, **kwargs):
+    if request is not None and hasattr(request, 'session'):
+        cart.merge_session_cart(request, user)
+
+
+@receiver(user_logged_in)
+def reset_login_failures(sender, request, user, **kwargs):
+    ratelimit.reset_login_failures(user.email)
+
+
+@receiver(user_login_failed)
+def record_login_failure(sender, credentials, request=None, **kwargs):
+    # Refusals while throttled don't count, or an attacker could keep an account locked forever.
+    if not getattr(request, 'login_throttled', False):
+        ratelimit.record_login_failure(request, credentials.get('email') or credentials.get('username'))
@@ -0,0 +1,11 @@
+from django import template
+
+from grabit_app import caching
+
+register = template.Library()
+
+
+@register.simple_tag
+def cache_version(*names):
+    """Use as a {% cache %} vary-on value so the fragment is rebuilt when any of `names` is invalidated."""
+    return caching.version(*names)
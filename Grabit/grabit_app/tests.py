@@ -1,3 +1,1305 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import re
+import tempfile
+import threading
+from unittest import mock
+from decimal import Decimal
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from PIL import Image
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages.storage import default_storage
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.contrib.sessions.models import Session
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import Http404, QueryDict
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from . import caching
+from .context_processors import cart_count
+from . import async_views, categories, facets, metrics, orders, ratelimit, replicas, views
+from .cart import MAX_QUANTITY, add_items
+from .catalog import import_products, set_attributes
+from .hashers import ScryptPasswordHasher
+from .images import drain, enqueue
+from .models import (
+    CartItem, Category, CustomUser, ImageJob, Order, Product, ProductAnswer, ProductCategory, ProductImage,
+    ProductQuestion, ProductRating, Stock, StoreAccount,
+)
+from .search import DatabaseSearchBackend, get_backend
+from .pagination import NEWEST_FIRST, decode_cursor, encode_cursor, keyset_page
+
+
+class ProductSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = CustomUser.objects.create_user(email="seller@grabit.com", password="pass12345")
+        cls.phone = Product.objects.create(
+            user=cls.seller, name="Galaxy Phone", brand="Samsung", description={"Color": "Midnight Blue"}
+        )
+        cls.case = Product.objects.create(
+            user=cls.seller, name="Phone Case", brand="Spigen", description={"Material": "Silicone"}
+        )
+
+    def test_search_matches_name_brand_and_description(self):
+        backend = get_backend()
+        self.assertEqual(backend.search("samsung"), [self.phone.id])
+        self.assertEqual(backend.search("midnight"), [self.phone.id])
+        self.assertCountEqual(backend.search("phone"), [self.phone.id, self.case.id])
+
+    def test_search_prefix_and_all_terms(self):
+        self.assertEqual(get_backend().search("gal"), [self.phone.id])
+        self.assertEqual(get_backend().search("silicone phone"), [self.case.id])
+
+    def test_name_hit_outranks_description_hit(self):
+        charger = Product.objects.create(
+            user=self.seller, name="Charger", brand="Anker", description={"Works with": "Spigen"}
+        )
+        self.assertEqual(get_backend().search("spigen"), [self.case.id, charger.id])
+
+    def test_index_follows_save_and_delete(self):
+        self.case.name = "Rugged Cover"
+        self.case.save()
+        self.assertEqual(get_backend().search("rugged"), [self.case.id])
+        self.case.delete()
+        self.assertEqual(get_backend().search("rugged"), [])
+
+    def test_database_backend_matches_description(self):
+        backend = DatabaseSearchBackend()
+        self.assertEqual(backend.search("midnight"), [self.phone.id])
+        self.assertEqual(backend.search("silicone phone"), [self.case.id])
+
+    def test_product_list_view(self):
+        response = self.client.get(reverse("product-list"), {"q": "samsung"})
+        self.assertEqual(list(response.context["products"]), [self.phone])
+        self.assertIsNone(response.context["next_cursor"])
+
+    def test_search_cursor_walks_every_hit_once(self):
+        response = self.client.get(reverse("product-list"), {"q": "phone", "size": 1})
+        first = response.context["products"]
+        response = self.client.get(
+            reverse("product-list"), {"q": "phone", "size": 1, "cursor": response.context["next_cursor"]}
+        )
+        self.assertCountEqual(first + response.context["products"], [self.phone, self.case])
+        self.assertIsNone(response.context["next_cursor"])
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = CustomUser.objects.create_user(email="seller@grabit.com", password="pass12345")
+        cls.products = [Product.objects.create(user=cls.seller, name=f"Item {i}") for i in range(5)]
+
+    def test_pages_are_stable_and_complete(self):
+        seen, cursor = [], None
+        while True:
+            page, cursor = keyset_page(Product.objects.all(), NEWEST_FIRST, decode_cursor(cursor), 2)
+            seen += page
+            if cursor is None:
+                break
+        self.assertEqual(seen, sorted(self.products, key=lambda p: (p.created_at, p.id), reverse=True))
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        self.assertIsNone(decode_cursor("not-a-cursor"))
+        response = self.client.get(reverse("product-list"), {"cursor": "not-a-cursor", "size": 500})
+        self.assertEqual(response.context["size"], 50)
+        self.assertEqual(len(response.context["products"]), 5)
+
+    def test_tampered_cursors_fall_back_to_first_page(self):
+        for key in ([1], [[1], [2]], [{"a": 1}, 5], [None, None], ["x", True]):
+            for params in ({}, {"q": "item"}):
+                with self.subTest(key=key, **params):
+                    response = self.client.get(reverse("product-list"), {**params, "cursor": encode_cursor(key)})
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(len(response.context["products"]), 5)
+
+
+class RatingAggregateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = CustomUser.objects.create_user(email="seller@grabit.com", password="pass12345")
+        cls.buyers = [CustomUser.objects.create_user(email=f"buyer{i}@grabit.com") for i in range(3)]
+        cls.product = Product.objects.create(user=cls.seller, name="Kettle")
+
+    def assertAggregates(self, count, total, histogram):
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_count, self.product.rating_sum), (count, total))
+        self.assertEqual(self.product.rating_histogram, histogram)
+        self.assertAlmostEqual(self.product.rating_avg, total / count if count else 0)
+
+    def test_create_update_delete_keep_aggregates_in_sync(self):
+        first = ProductRating.objects.create(user=self.buyers[0], product=self.product, rating=5)
+        ProductRating.objects.create(user=self.buyers[1], product=self.product, rating=2)
+        self.assertAggregates(2, 7, {5: 1, 4: 0, 3: 0, 2: 1, 1: 0})
+
+        first.rating = 4
+        first.save()
+        self.assertAggregates(2, 6, {5: 0, 4: 1, 3: 0, 2: 1, 1: 0})
+
+        reloaded = ProductRating.objects.get(pk=first.pk)
+        reloaded.rating = 1
+        reloaded.save()
+        self.assertAggregates(2, 3, {5: 0, 4: 0, 3: 0, 2: 1, 1: 1})
+
+        ProductRating.objects.filter(product=self.product).delete()
+        self.assertAggregates(0, 0, {5: 0, 4: 0, 3: 0, 2: 0, 1: 0})
+
+    def test_rebuild_command_matches_signals(self):
+        for buyer, rating in zip(self.buyers, (5, 3, 3)):
+            ProductRating.objects.create(user=buyer, product=self.product, rating=rating)
+        Product.objects.update(rating_count=0, rating_sum=0, rating_avg=0, rating_3=0, rating_5=0)
+        call_command("rebuild_rating_aggregates", stdout=StringIO())
+        self.assertAggregates(3, 11, {5: 1, 4: 0, 3: 2, 2: 0, 1: 0})
+        self.assertEqual(self.product.average_rating(), 3.7)
+
+    def test_product_list_filters_and_sorts_by_rating(self):
+        other = Product.objects.create(user=self.seller, name="Toaster")
+        ProductRating.objects.create(user=self.buyers[0], product=self.product, rating=3)
+        ProductRating.objects.create(user=self.buyers[0], product=other, rating=5)
+        response = self.client.get(reverse("product-list"), {"sort": "rating"})
+        self.assertEqual(response.context["products"], [other, self.product])
+        response = self.client.get(reverse("product-list"), {"rating": "4"})
+        self.assertEqual(response.context["products"], [other])
+
+
+class ImageQueryCountTests(TestCase):
+    """Views listing products must fetch images in one batch, however many products there are."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = CustomUser.objects.create_user(email="seller@grabit.com", password="pass12345")
+        StoreAccount.objects.create(user=cls.seller, store_name="Seller Store", contact_no="9800000000")
+        for i in range(8):
+            product = Product.objects.create(user=cls.seller, name=f"Item {i}", brand="Acme")
+            ProductImage.objects.create(product=product, image=f"Product_images/{i}-b.png", position=1)
+            ProductImage.objects.create(product=product, image=f"Product_images/{i}-a.png", position=0, is_primary=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_first_image_uses_prefetched_primary(self):
+        product = Product.objects.with_primary_image().get(name="Item 0")
+        with self.assertNumQueries(0):
+            self.assertEqual(product.first_image, "/media/Product_images/0-a.png")
+
+    def test_listings_always_have_a_primary_image(self):
+        product = Product.objects.create(user=self.seller, name="Added in the admin")
+        second = ProductImage.objects.create(product=product, image="Product_images/admin-b.png", position=1)
+        self.assertTrue(second.is_primary)
+        first = ProductImage.objects.create(product=product, image="Product_images/admin-a.png", position=0)
+        self.assertFalse(first.is_primary)
+
+        second.delete()
+        listed = Product.objects.with_primary_image().get(pk=product.pk)
+        self.assertEqual(listed.first_image, "/media/Product_images/admin-a.png")
+
+        second = ProductImage.objects.create(product=product, image="Product_images/admin-b.png", is_primary=True)
+        self.assertEqual(list(ProductImage.objects.filter(product=product, is_primary=True)), [second])
+
+    def test_home_query_count(self):
+        # categories + two rails, each with one image prefetch
+        with self.assertNumQueries(5):
+            self.client.get(reverse("home"))
+
+    def test_product_list_query_count(self):
+        # products, images, then brand, numeric and attribute facet counts
+        with self.assertNumQueries(5):
+            self.client.get(reverse("product-list"))
+        # search index lookup, products, images; the facet counts are cached
+        with self.assertNumQueries(3):
+            self.client.get(reverse("product-list"), {"q": "acme"})
+
+    def test_seller_account_query_count(self):
+        self.client.force_login(self.seller)
+        # session + user + cart_count, then store account, products and their images
+        with self.assertNumQueries(6):
+            self.client.get(reverse("seller-account", args=[self.seller.id]))
+
+
+class HomeCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = CustomUser.objects.create_user(email="seller@grabit.com", password="pass12345")
+        cls.product = Product.objects.create(user=cls.seller, name="Lamp")
+        cls.image = ProductImage.objects.create(product=cls.product, image="Product_images/lamp.png", is_primary=True)
+        Category.objects.create(c_name="Home")
+
+    def setUp(self):
+        cache.clear()
+
+    def test_warm_home_page_runs_no_queries(self):
+        self.client.get(reverse("home"))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("home"))
+        self.assertContains(response, reverse("product", args=[self.product.id]))
+
+    def test_product_save_invalidates_deal_rails_only(self):
+        self.client.get(reverse("home"))
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(user=self.seller, name="Desk")
+        # categories still cached; both rails and their image prefetches rebuilt
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse("home"))
+        self.assertEqual(len(response.context["latest_deals"]), 2)
+
+    def test_image_change_invalidates_rails_showing_the_product(self):
+        self.client.get(reverse("home"))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.image.image = "Product_images/lamp-2.png"
+            self.image.save()
+        response = self.client.get(reverse("home"))
+        self.assertEqual(response.context["latest_deals"][0].first_image, "/media/Product_images/lamp-2.png")
+
+    def test_variants_of_one_name_build_in_parallel(self):
+        building, release = threading.Event(), threading.Event()
+
+        def slow_build():
+            building.set()
+            # Times out rather than hanging the suite if the other variant waits on this one.
+            release.wait(5)
+            return "a"
+
+        thread = threading.Thread(target=caching.get_or_build, args=("lock-test", slow_build), kwargs={"variant": "a"})
+        thread.start()
+        building.wait(5)
+        self.assertEqual(caching.get_or_build("lock-test", lambda: "b", variant="b"), "b")
+        self.assertTrue(thread.is_alive())
+        release.set()
+        thread.join()
+        self.assertEqual(caching._local_locks, {})
+
+    def test_category_save_invalidates_categories(self):
+        self.client.get(reverse("home"))
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(c_name="Garden")
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("home"))
+        self.assertEqual([c.c_name for c in response.context["category"]], ["Garden", "Home"])
+
+
+class CartCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(email="buyer@grabit.com", password="pass12345")
+        cls.product = Product.objects.create(user=cls.user, name="Mug")
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_count_is_cached_between_requests(self):
+        self.client.get(reverse("product-list"))
+        # session + user + products + images; the badge comes from the cache
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse("product-list"))
+        self.assertContains(response, '<span class="badge">0</span>')
+
+    def test_cart_change_refreshes_count(self):
+        self.client.get(reverse("product-list"))
+        with self.captureOnCommitCallbacks(execute=True):
+            add_items(self.user, {self.product.id: 2})
+        response = self.client.get(reverse("product-list"))
+        self.assertContains(response, '<span class="badge">1</span>')
+
+    def test_deleting_a_line_outside_the_cart_module_refreshes_count(self):
+        add_items(self.user, {self.product.id: 2})
+        self.client.get(reverse("product-list"))
+        with self.captureOnCommitCallbacks(execute=True):
+            CartItem.objects.get().delete()
+        response = self.client.get(reverse("product-list"))
+        self.assertContains(response, '<span class="badge">0</span>')
+
+    def test_count_not_queried_when_template_skips_it(self):
+        request = RequestFactory().get("/")
+        request.user = self.user
+        with self.assertNumQueries(0):
+            cart_count(request)
+
+
+class CartTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(email="buyer@grabit.com", password="pass12345")
+        cls.products = [Product.objects.create(user=cls.user, name=f"Item {i}") for i in range(6)]
+
+    def setUp(self):
+        cache.clear()
+
+    def cart_items(self):
+        return dict(CartItem.objects.filter(cart__user=self.user).values_list("product_id", "quantity"))
+
+    def post_json(self, name, items):
+        payload = {"items": [{"product": pid, "quantity": qty} for pid, qty in items.items()]}
+        return self.client.post(reverse(name), payload, content_type="application/json")
+
+    def test_bulk_add_increments_in_bounded_queries(self):
+        self.client.force_login(self.user)
+        ids = [p.id for p in self.products]
+        self.post_json("cart-add", {ids[0]: 1})
+        # session + user + product check + cart + savepoint/insert/update/release + reading the cart back
+        with self.assertNumQueries(9):
+            response = self.post_json("cart-add", {pid: 2 for pid in ids})
+        self.assertEqual(response.json()["cart_count"], 6)
+        self.assertEqual(self.cart_items()[ids[0]], 3)
+        self.assertEqual(self.cart_items()[ids[5]], 2)
+
+    def test_update_and_remove(self):
+        self.client.force_login(self.user)
+        a, b, c = (p.id for p in self.products[:3])
+        self.post_json("cart-add", {a: 1, b: 1, c: 1})
+        self.post_json("cart-update", {a: 5, b: 0})
+        self.assertEqual(self.cart_items(), {a: 5, c: 1})
+        self.client.post(reverse("cart-remove"), {"product[]": [c]})
+        self.assertEqual(self.cart_items(), {a: 5})
+
+    def test_unknown_products_and_bad_payloads(self):
+        self.client.force_login(self.user)
+        self.post_json("cart-add", {999999: 1})
+        self.assertEqual(self.cart_items(), {})
+        response = self.client.post(reverse("cart-add"), {"items": [{"product": "x"}]}, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_quantities_are_capped(self):
+        self.client.force_login(self.user)
+        a = self.products[0].id
+        response = self.post_json("cart-add", {a: 10 ** 30})
+        self.assertEqual(response.status_code, 200)
+        self.post_json("cart-add", {a: 5})
+        self.assertEqual(self.cart_items(), {a: MAX_QUANTITY})
+
+    def test_guest_cart_merges_on_login(self):
+        a, b = self.products[0].id, self.products[1].id
+        add_items(self.user, {a: 1})
+        self.post_json("cart-add", {a: 2, b: 1})
+        self.assertEqual(self.client.session["cart"], {str(a): 2, str(b): 1})
+        self.client.post(reverse("login"), {"email": "buyer@grabit.com", "password": "pass12345"})
+        self.assertEqual(self.cart_items(), {a: 3, b: 1})
+        self.assertNotIn("cart", self.client.session)
+
+
+class CheckoutTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(email="buyer@grabit.com", password="pass12345")
+        cls.lamp = Product.objects.create(user=cls.user, name="Lamp", price=Decimal("40.00"))
+        cls.desk = Product.objects.create(user=cls.user, name="Desk", price=Decimal("250.00"))
+        Stock.objects.bulk_create([Stock(product=cls.lamp, available=3), Stock(product=cls.desk, available=1)])
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def stock(self):
+        return dict(Stock.objects.values_list("product_id", "available"))
+
+    def test_checkout_reserves_stock_and_empties_the_cart(self):
+        add_items(self.user, {self.lamp.id: 2, self.desk.id: 1})
+        response = self.client.post(reverse("checkout"), {}, content_type="application/json")
+        order = Order.objects.get()
+        self.assertEqual(response.json()["order"], order.id)
+        self.assertEqual(order.total, Decimal("330.00"))
+        self.assertEqual(
+            sorted(order.items.values_list("name", "price", "quantity")),
+            [("Desk", Decimal("250.00"), 1), ("Lamp", Decimal("40.00"), 2)],
+        )
+        self.assertEqual(self.stock(), {self.lamp.id: 1, self.desk.id: 0})
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_short_stock_places_nothing(self):
+        add_items(self.user, {self.lamp.id: 1, self.desk.id: 2})
+        with self.assertRaisesMessage(orders.OutOfStock, "Not enough stock for Desk."):
+            orders.checkout(self.user)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.stock(), {self.lamp.id: 3, self.desk.id: 1})
+        self.assertEqual(CartItem.objects.count(), 2)
+
+    def test_products_without_stock_cannot_be_ordered(self):
+        chair = Product.objects.create(user=self.user, name="Chair")
+        add_items(self.user, {chair.id: 1})
+        response = self.client.post(reverse("checkout"), {}, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_double_submit_places_one_order(self):
+        add_items(self.user, {self.lamp.id: 1})
+        reserve = orders.reserve
+
+        def other_checkout_wins(items):
+            # The concurrent checkout read the same lines and commits first.
+            reserve(items)
+            CartItem.objects.all().delete()
+
+        with mock.patch.object(orders, "reserve", side_effect=other_checkout_wins):
+            with self.assertRaisesMessage(ValueError, "Your cart changed"):
+                orders.checkout(self.user)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.stock()[self.lamp.id], 3)
+
+    def test_non_numeric_order_id_is_404(self):
+        self.assertEqual(self.client.post("/orders/abc/cancel/").status_code, 404)
+
+    def test_cancel_returns_stock_once(self):
+        add_items(self.user, {self.lamp.id: 2})
+        order = orders.checkout(self.user)
+        self.client.post(reverse("order-cancel", args=[order.id]))
+        self.client.post(reverse("order-cancel", args=[order.id]))
+        order.refresh_from_db()
+        self.assertEqual(order.status, Order.CANCELLED)
+        self.assertEqual(self.stock()[self.lamp.id], 3)
+
+
+class CheckoutConcurrencyTests(TransactionTestCase):
+    def test_parallel_checkouts_never_oversell(self):
+        out = StringIO()
+        call_command("stress_checkout", buyers=60, stock=25, products=3, workers=6, stdout=out)
+        self.assertIn("No overselling.", out.getvalue())
+        self.assertFalse(Order.objects.exists())
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), IMAGE_PIPELINE_IN_PROCESS=False)
+class ImagePipelineTests(TestCase):
+    def setUp(self):
+        self.seller = CustomUser.objects.create_user(email="seller@grabit.com", password="pass12345")
+        self.product = Product.objects.create(user=self.seller, name="Poster")
+        buffer = BytesIO()
+        Image.new("RGB", (900, 600), "red").save(buffer, "PNG")
+        self.image = ProductImage.objects.create(
+            product=self.product, image=SimpleUploadedFile("poster.png", buffer.getvalue()), is_primary=True
+        )
+
+    def test_renditions_change_the_product_etag(self):
+        url = reverse("product", args=[self.product.id])
+        etag = self.client.get(url)["ETag"]
+        enqueue([self.image])
+        with self.captureOnCommitCallbacks(execute=True):
+            drain()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_enqueue_then_drain_writes_renditions(self):
+        enqueue([self.image])
+        self.assertEqual(drain(), 1)
+        self.image.refresh_from_db()
+        self.assertEqual((self.image.width, self.image.height), (900, 600))
+        self.assertEqual(
+            sorted((r["format"], r["width"], r["height"]) for r in self.image.renditions),
+            [("jpeg", 320, 213), ("jpeg", 640, 427), ("webp", 320, 213), ("webp", 640, 427)],
+        )
+        self.assertIn("640w", self.image.webp_srcset)
+        self.assertEqual(ImageJob.objects.get().status, ImageJob.DONE)
+        self.assertEqual(drain(), 0)
+
+    def test_broken_image_is_retried_then_failed(self):
+        self.image.image.name = self.image.image.storage.save("Product_images/broken.png", SimpleUploadedFile("x", b"nope"))
+        self.image.save()
+        enqueue([self.image])
+        with self.assertLogs("grabit_app.images", "ERROR"):
+            drain()
+        job = ImageJob.objects.get()
+        self.assertEqual((job.status, job.attempts), (ImageJob.FAILED, 3))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), IMAGE_PIPELINE_IN_PROCESS=False)
+class ProductCreationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = CustomUser.objects.create_user(email="seller@grabit.com", password="pass12345")
+
+    def setUp(self):
+        self.client.force_login(self.seller)
+
+    def upload(self, name):
+        buffer = BytesIO()
+        Image.new("RGB", (10, 10)).save(buffer, "PNG")
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/png")
+
+    def test_product_and_images_created_together(self):
+        response = self.client.post(reverse("product-form"), {
+            "p_name": "Backpack", "price": "200", "discount": "10", "brand": "Osprey",
+            "feature[]": ["Volume"], "value[]": ["30L"], "images": [self.upload("a.png"), self.upload("b.png")],
+        })
+        self.assertRedirects(response, reverse("home"))
+        product = Product.objects.get()
+        self.assertEqual((product.price, product.old_price), (Decimal("180.00"), Decimal("200.00")))
+        self.assertEqual(product.description, {"Volume": "30L"})
+        self.assertEqual([(i.position, i.is_primary) for i in product.productimage_set.all()], [(0, True), (1, False)])
+        self.assertEqual(ImageJob.objects.count(), 2)
+
+    def test_no_images_leaves_no_product(self):
+        self.client.post(reverse("product-form"), {"p_name": "Backpack", "price": "200", "discount": "0"})
+        self.assertFalse(Product.objects.exists())
+
+    def test_csv_import_batches_and_reports_bad_rows(self):
+        data = (
+            "name,price,discount,brand,stock,Color\nLamp,100,0,Ikea,4,White\n,5,0,,,\nChair,50,200,,,\n"
+            "Desk,300,10,,,Oak\nStool,20,0,,lots,\n"
+        )
+        upload = SimpleUploadedFile("catalog.csv", data.encode())
+        response = self.client.post(reverse("product-import"), {"file": upload}, follow=True)
+        self.assertEqual(sorted(Product.objects.values_list("name", flat=True)), ["Desk", "Lamp"])
+        self.assertEqual(Product.objects.get(name="Lamp").description, {"Color": "White"})
+        self.assertContains(response, "Imported 2 products.")
+        self.assertContains(response, "Skipped 3 rows")
+        self.assertEqual(
+            dict(Stock.objects.values_list("product__name", "available")), {"Lamp": 4, "Desk": 0}
+        )
+        self.assertEqual(get_backend().search("oak"), [Product.objects.get(name="Desk").id])
+
+    def test_jsonl_import_command(self):
+        path = os.path.join(tempfile.mkdtemp(), "catalog.jsonl")
+        with open(path, "w") as f:
+            for i in range(5):
+                f.write(json.dumps({"name": f"Book {i}", "price": 10 + i, "description": {"Pages": "100"}}) + "\n")
+        call_command("import_products", "seller@grabit.com", path, "--batch-size", "2", stdout=StringIO())
+        self.assertEqual(Product.objects.filter(user=self.seller).count(), 5)
+
+    def test_malformed_import_rows_are_skipped(self):
+        rows = [
+            {"name": 5, "price": 10, "brand": 7}, {"name": "NaN", "price": "NaN"}, {"name": "Inf", "price": "-Infinity"},
+            {"name": "Huge", "price": "1e30"}, {"name": "Fine", "price": "12.50"},
+        ]
+        created, errors = import_products(self.seller, rows)
+        self.assertEqual(created, 2)
+        self.assertEqual([line for line, _ in errors], [2, 3, 4])
+        self.assertEqual(Product.objects.get(name="5").brand, "7")
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), IMAGE_PIPELINE_IN_PROCESS=False)
+class MediaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = CustomUser.objects.create_user(email="seller@grabit.com", password="pass12345")
+        buffer = BytesIO()
+        Image.frombytes("RGB", (64, 64), os.urandom(64 * 64 * 3)).save(buffer, "PNG")
+        cls.content = buffer.getvalue()
+        cls.images = [
+            ProductImage.objects.create(
+                product=Product.objects.create(user=cls.seller, name=f"Poster {i}"),
+                image=SimpleUploadedFile(f"poster-{i}.png", cls.content), is_primary=True,
+            )
+            for i in range(2)
+        ]
+        cls.url = cls.images[0].image.url
+
+    def test_identical_uploads_are_stored_once(self):
+        first, second = self.images
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r"^Product_images/[0-9a-f]{2}/[0-9a-f]{64}\.png$")
+
+    def test_saving_over_an_existing_digest_name_reuses_it(self):
+        storage = self.images[0].image.storage
+        # What a concurrent upload of the same bytes sees: the digest file appears after its exists() check.
+        with mock.patch.object(storage, "exists", return_value=False):
+            name = storage.save("Product_images/again.png", SimpleUploadedFile("again.png", self.content))
+        self.assertEqual(name, self.images[0].image.name)
+        self.assertEqual(sorted(os.listdir(os.path.dirname(storage.path(name)))), [os.path.basename(name)])
+
+    def test_full_file_is_immutable_and_revalidates(self):
+        response = self.client.get(self.url)
+        self.assertEqual(b"".join(response.streaming_content), self.content)
+        self.assertEqual((response["Content-Type"], response["Accept-Ranges"]), ("image/png", "bytes"))
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertEqual(self.client.get(self.url, headers={"If-None-Match": response["ETag"]}).status_code, 304)
+
+    def test_range_requests(self):
+        response = self.client.get(self.url, headers={"Range": "bytes=10-19"})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], f"bytes 10-19/{len(self.content)}")
+        self.assertEqual(b"".join(response.streaming_content), self.content[10:20])
+
+        tail = self.client.get(self.url, headers={"Range": "bytes=-5"})
+        self.assertEqual(b"".join(tail.streaming_content), self.content[-5:])
+
+        stale = self.client.get(self.url, headers={"Range": "bytes=0-9", "If-Range": '"other"'})
+        self.assertEqual(stale.status_code, 200)
+
+        beyond = self.client.get(self.url, headers={"Range": f"bytes={len(self.content)}-"})
+        self.assertEqual((beyond.status_code, beyond["Content-Range"]), (416, f"bytes */{len(self.content)}"))
+
+    @override_settings(MEDIA_ACCEL="x-accel-redirect")
+    def test_transfer_can_be_delegated_to_nginx(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response["X-Accel-Redirect"], "/protected-media/" + self.images[0].image.name)
+        self.assertEqual(response.content, b"")
+
+    def test_verification_documents_are_staff_only(self):
+        name = self.images[0].image.storage.save("Store/licence.png", SimpleUploadedFile("licence.png", b"private"))
+        self.assertEqual(self.client.get("/media/" + name).status_code, 404)
+        self.client.force_login(CustomUser.objects.create_user(email="staff@grabit.com", password="x", is_staff=True))
+        self.assertEqual(self.client.get("/media/" + name).status_code, 200)
+
+    def test_prune_removes_only_unreferenced_files(self):
+        storage = self.images[0].image.storage
+        orphan = storage.save("Product_images/orphan.png", SimpleUploadedFile("orphan.png", b"orphan"))
+        storage.delete(orphan)
+        self.assertTrue(storage.exists(orphan))
+        call_command("prune_media", grace_hours=0, stdout=StringIO())
+        self.assertFalse(storage.exists(orphan))
+        self.assertTrue(storage.exists(self.images[0].image.name))
+
+
+class ProductDetailTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = CustomUser.objects.create_user(email="seller@grabit.com", password="pass12345")
+        StoreAccount.objects.create(
+            user=cls.seller, store_name="Seller Store", contact_no="9800000000", store_logo="Store_logo/logo.png"
+        )
+        cls.product = Product.objects.create(user=cls.seller, name="Lamp", brand="Acme")
+        for i in range(3):
+            ProductImage.objects.create(product=cls.product, image=f"Product_images/lamp-{i}.png", position=i)
+            ProductQuestion.objects.create(user=cls.seller, product=cls.product, question=f"Question {i}?")
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse("product", args=[self.product.id])
+
+    def test_query_count_does_not_grow_with_images_or_questions(self):
+        # version, product + seller + store, images, questions + askers
+        with self.assertNumQueries(4):
+            response = self.client.get(self.url)
+        self.assertContains(response, "Question 2?")
+        self.assertEqual(len(response.context["product_imgs"]), 3)
+
+    def test_conditional_get(self):
+        response = self.client.get(self.url)
+        self.assertIn("ETag", response)
+        self.assertIn("Last-Modified", response)
+        with self.assertNumQueries(1):
+            cached = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(cached.status_code, 304)
+        cached = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(cached.status_code, 304)
+
+    def test_new_question_changes_etag(self):
+        etag = self.client.get(self.url)["ETag"]
+        ProductQuestion.objects.create(user=self.seller, product=self.product, question="Is it bright?")
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_cart_change_changes_etag(self):
+        self.client.force_login(self.seller)
+        etag = self.client.get(self.url)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            add_items(self.seller, {self.product.id: 1})
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_pending_messages_send_no_validators(self):
+        self.client.force_login(self.seller)
+        last_modified = self.client.get(self.url)["Last-Modified"]
+        self.client.post(reverse("cart-add"), {"product[]": [self.product.id], "quantity[]": [1]})
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("ETag", response)
+        self.assertNotIn("Last-Modified", response)
+
+    def test_missing_product_is_404(self):
+        self.assertEqual(self.client.get(reverse("product", args=[0])).status_code, 404)
+
+
+class ProductQuestionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = CustomUser.objects.create_user(email="seller@grabit.com", password="pass12345")
+        cls.buyer = CustomUser.objects.create_user(email="buyer@grabit.com", password="pass12345")
+        StoreAccount.objects.create(
+            user=cls.seller, store_name="Seller Store", contact_no="9800000000", store_logo="Store_logo/logo.png"
+        )
+        cls.product = Product.objects.create(user=cls.seller, name="Lamp", brand="Acme")
+        cls.questions = [
+            ProductQuestion.objects.create(user=cls.buyer, product=cls.product, question=f"Question {i}?")
+            for i in range(25)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_product_page_renders_only_first_page(self):
+        response = self.client.get(reverse("product", args=[self.product.id]))
+        self.assertEqual(len(response.context["questions"]), 20)
+        self.assertContains(response, "Question 24?")
+        self.assertNotContains(response, "Question 0?")
+        self.assertTrue(response.context["next_questions"])
+
+    def test_questions_endpoint_pages_with_cursor(self):
+        url = reverse("product-questions", args=[self.product.id])
+        first = self.client.get(url, {"size": 10}).json()
+        second = self.client.get(url, {"size": 10, "cursor": first["next"]}).json()
+        third = self.client.get(url, {"size": 10, "cursor": second["next"]}).json()
+        questions = [q["question"] for q in first["questions"] + second["questions"] + third["questions"]]
+        self.assertEqual(questions, [f"Question {i}?" for i in reversed(range(25))])
+        self.assertIsNone(third["next"])
+
+    def test_answers_are_threaded_and_counted(self):
+        question = self.questions[-1]
+        self.client.force_login(self.seller)
+        url = reverse("question-answers", args=[question.id])
+        answer = self.client.post(url, {"answer": "About 40cm."}, HTTP_ACCEPT="application/json").json()
+        self.assertTrue(answer["is_seller"])
+        self.client.force_login(self.buyer)
+        reply = self.client.post(
+            url, {"answer": "Thanks!", "parent": answer["id"]}, HTTP_ACCEPT="application/json"
+        ).json()
+        self.assertFalse(reply["is_seller"])
+
+        question.refresh_from_db()
+        self.assertEqual(question.answer_count, 2)
+        listed = self.client.get(reverse("product-questions", args=[self.product.id])).json()["questions"][0]
+        self.assertEqual(listed["answer_count"], 2)
+        answers = self.client.get(url).json()["answers"]
+        self.assertEqual([(a["id"], a["parent"]) for a in answers], [(answer["id"], None), (reply["id"], answer["id"])])
+
+        ProductAnswer.objects.get(id=answer["id"]).delete()
+        question.refresh_from_db()
+        self.assertEqual(question.answer_count, 0)
+
+    def test_reply_must_belong_to_the_same_question(self):
+        other = ProductAnswer.objects.create(question=self.questions[0], user=self.buyer, answer="Yes")
+        self.client.force_login(self.buyer)
+        response = self.client.post(
+            reverse("question-answers", args=[self.questions[1].id]),
+            {"answer": "No", "parent": other.id},
+            HTTP_ACCEPT="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_non_numeric_ids_are_404(self):
+        self.assertEqual(self.client.get("/product-abc/questions/").status_code, 404)
+        self.assertEqual(self.client.get("/questions/abc/answers/").status_code, 404)
+
+    def test_malformed_parent_is_rejected(self):
+        self.client.force_login(self.buyer)
+        url = reverse("question-answers", args=[self.questions[0].id])
+        response = self.client.post(url, {"answer": "No", "parent": "abc"}, HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ProductAnswer.objects.exists())
+
+    def test_json_clients_are_recognised_by_preference(self):
+        self.client.force_login(self.buyer)
+        url = reverse("question-answers", args=[self.questions[0].id])
+        response = self.client.post(url, {"answer": "Yes"}, HTTP_ACCEPT="application/json, text/plain, */*")
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post(url, {"answer": "Yes"}, HTTP_ACCEPT="text/html,application/xhtml+xml,*/*;q=0.8")
+        self.assertRedirects(response, reverse("product", args=[self.product.id]), fetch_redirect_response=False)
+
+    def test_new_answer_changes_product_etag(self):
+        url = reverse("product", args=[self.product.id])
+        etag = self.client.get(url)["ETag"]
+        ProductAnswer.objects.create(question=self.questions[0], user=self.buyer, answer="Yes")
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class PageCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = CustomUser.objects.create_user(email="seller@grabit.com", password="pass12345")
+        StoreAccount.objects.create(
+            user=cls.seller, store_name="Seller Store", contact_no="9800000000", store_logo="Store_logo/logo.png"
+        )
+        cls.product = Product.objects.create(user=cls.seller, name="Lamp", brand="Acme")
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_pages_are_served_from_cache(self):
+        self.client.get(reverse("product-list"))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("product-list"))
+        self.assertContains(response, "Lamp")
+        self.assertIsNone(response.context)
+
+    def test_cached_page_gets_a_fresh_csrf_token(self):
+        url = reverse("product", args=[self.product.id])
+        self.client.get(url)
+        client = self.client_class(enforce_csrf_checks=True)
+        response = client.get(url)
+        self.assertIsNone(response.context)
+        token = re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', response.content.decode()).group(1)
+        response = client.post(reverse("cart-add"), {"product[]": [self.product.id], "csrfmiddlewaretoken": token})
+        self.assertEqual(response.status_code, 302)
+
+    def test_logged_in_users_get_a_fresh_render(self):
+        self.client.get(reverse("product-list"))
+        self.client.force_login(self.seller)
+        self.assertIsNotNone(self.client.get(reverse("product-list")).context)
+
+    def test_model_changes_invalidate_cached_pages(self):
+        self.client.get(reverse("product-list"))
+        self.client.get(reverse("product", args=[self.product.id]))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = "Desk Lamp"
+            self.product.save()
+        self.assertContains(self.client.get(reverse("product-list")), "Desk Lamp")
+        self.assertContains(self.client.get(reverse("product", args=[self.product.id])), "Desk Lamp")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductQuestion.objects.create(user=self.seller, product=self.product, question="Does it dim?")
+        self.assertContains(self.client.get(reverse("product", args=[self.product.id])), "Does it dim?")
+
+
+class CategoryTreeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = CustomUser.objects.create_user(email="seller@grabit.com", password="pass12345")
+        cls.electronics = Category.objects.create(c_name="Electronics")
+        cls.phones = Category.objects.create(c_name="Phones", parent=cls.electronics)
+        cls.android = Category.objects.create(c_name="Android", parent=cls.phones)
+        cls.garden = Category.objects.create(c_name="Garden")
+        cls.pixel = Product.objects.create(user=cls.seller, name="Pixel")
+        cls.nokia = Product.objects.create(user=cls.seller, name="Nokia")
+
+    def setUp(self):
+        cache.clear()
+
+    def counts(self):
+        return dict(Category.objects.values_list('c_name', 'product_count'))
+
+    def test_tree_is_built_once(self):
+        with self.assertNumQueries(1):
+            roots = categories.tree()
+        with self.assertNumQueries(0):
+            categories.tree()
+        self.assertEqual([c.c_name for c in roots], ["Electronics", "Garden"])
+        self.assertEqual(roots[0].subcategories[0].subcategories, [self.android])
+
+    def test_membership_implies_ancestors_and_counts_are_distinct(self):
+        categories.set_categories(self.pixel, [self.android.id])
+        categories.set_categories(self.nokia, [self.phones.id, self.android.id])
+        self.assertEqual(self.counts(), {"Electronics": 2, "Phones": 2, "Android": 2, "Garden": 0})
+        self.assertCountEqual(self.electronics.products.all(), [self.pixel, self.nokia])
+
+        categories.set_categories(self.nokia, [self.phones.id])
+        self.assertEqual(self.counts(), {"Electronics": 2, "Phones": 2, "Android": 1, "Garden": 0})
+        self.assertTrue(ProductCategory.objects.get(product=self.nokia, category=self.phones).direct)
+
+        self.pixel.delete()
+        self.assertEqual(self.counts(), {"Electronics": 1, "Phones": 1, "Android": 0, "Garden": 0})
+
+    def test_moving_a_category_rebuilds_memberships(self):
+        categories.set_categories(self.pixel, [self.android.id])
+        self.android.parent = self.garden
+        self.android.save()
+        self.assertEqual(self.counts(), {"Electronics": 0, "Phones": 0, "Android": 1, "Garden": 1})
+        self.assertEqual(list(self.garden.products.all()), [self.pixel])
+
+    def test_move_rebuilds_only_the_moved_subtree(self):
+        categories.set_categories(self.pixel, [self.android.id])
+        categories.set_categories(self.nokia, [self.garden.id])
+        self.phones.parent = self.garden
+        with mock.patch.object(categories, "rebuild_products", wraps=categories.rebuild_products) as rebuild:
+            self.phones.save()
+        rebuild.assert_called_once_with([self.pixel.id])
+        self.assertEqual(self.counts(), {"Electronics": 0, "Phones": 1, "Android": 1, "Garden": 2})
+
+    def test_deleting_a_category_drops_the_memberships_it_implied(self):
+        categories.set_categories(self.pixel, [self.android.id])
+        categories.set_categories(self.nokia, [self.phones.id])
+        self.android.delete()
+        self.assertEqual(self.counts(), {"Electronics": 1, "Phones": 1, "Garden": 0})
+        self.assertEqual(list(self.electronics.products.all()), [self.nokia])
+
+    def test_non_numeric_category_id_is_404(self):
+        self.assertEqual(self.client.get("/category-abc/").status_code, 404)
+
+    def test_category_page_shows_products_and_facet_counts(self):
+        categories.set_categories(self.pixel, [self.android.id])
+        categories.set_categories(self.nokia, [self.phones.id])
+        categories.tree()
+        # category, memberships, products, images, subcategories
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse("category", args=[self.electronics.id]))
+        self.assertEqual(response.context["products"], [self.nokia, self.pixel])
+        self.assertContains(response, "Phones</a> <span>(2)</span>", html=False)
+
+
+class FacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = CustomUser.objects.create_user(email="seller@grabit.com", password="pass12345")
+        cls.red_acme = Product.objects.create(
+            user=cls.seller, name="Red Kettle", brand="Acme", price=400, discount_percent=20
+        )
+        cls.blue_acme = Product.objects.create(user=cls.seller, name="Blue Kettle", brand="Acme", price=1500)
+        cls.red_zen = Product.objects.create(user=cls.seller, name="Red Toaster", brand="Zen", price=800)
+        set_attributes(cls.red_acme, {"Color": "Red", "Capacity": "1L"})
+        set_attributes(cls.blue_acme, {"Color": "Blue"})
+        set_attributes(cls.red_zen, {"Color": "Red"})
+
+    def setUp(self):
+        cache.clear()
+
+    def listing(self, **params):
+        return self.client.get(reverse("product-list"), params)
+
+    def test_non_finite_numbers_are_ignored(self):
+        for params in ({"min_price": "NaN"}, {"min_price": "Infinity"}, {"max_price": "-Infinity"},
+                       {"discount": "sNaN"}, {"rating": "nan"}):
+            with self.subTest(**params):
+                response = self.listing(**params)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.context["products"]), 3)
+
+    def test_filtered_search_pages_are_full(self):
+        for i in range(4):
+            Product.objects.create(user=self.seller, name=f"Kettle {i}", brand="Zen")
+        seen, cursor = [], None
+        while True:
+            params = {"q": "kettle", "brand": "Acme", "size": 1, **({"cursor": cursor} if cursor else {})}
+            response = self.listing(**params)
+            self.assertEqual(len(response.context["products"]), 1)
+            seen += response.context["products"]
+            cursor = response.context["next_cursor"]
+            if cursor is None:
+                break
+        self.assertEqual(sorted(p.id for p in seen), [self.red_acme.id, self.blue_acme.id])
+
+    def test_attribute_rows_are_the_source_of_the_description(self):
+        set_attributes(self.red_acme, {" Capacity ": "2L", "Color": "", "Finish": "Matte"})
+        self.assertEqual(
+            list(self.red_acme.attributes.values_list("key", "value")), [("Capacity", "2L"), ("Finish", "Matte")]
+        )
+        self.red_acme.refresh_from_db()
+        self.assertEqual(self.red_acme.description, {"Capacity": "2L", "Finish": "Matte"})
+        self.assertEqual(get_backend().search("matte"), [self.red_acme.id])
+
+    def test_empty_description_stays_empty(self):
+        product = Product.objects.create(user=self.seller, name="Plain")
+        product.refresh_from_db()
+        self.assertIsNone(product.description)
+
+    def test_filters(self):
+        names = lambda response: sorted(p.name for p in response.context["products"])
+        self.assertEqual(names(self.listing(brand="Acme")), ["Blue Kettle", "Red Kettle"])
+        self.assertEqual(names(self.listing(attr="Color:Red")), ["Red Kettle", "Red Toaster"])
+        self.assertEqual(names(self.listing(attr="Color:Red", brand="Zen")), ["Red Toaster"])
+        self.assertEqual(names(self.listing(min_price=500, max_price=1000)), ["Red Toaster"])
+        self.assertEqual(names(self.listing(price_range="1000-5000")), ["Blue Kettle"])
+        self.assertEqual(names(self.listing(discount="true")), ["Red Kettle"])
+
+    def test_facet_counts_ignore_their_own_filter(self):
+        counts = self.listing(brand="Acme", attr="Color:Red").context["facets"]
+        # brands are counted with only the colour filter, colours with only the brand filter
+        self.assertEqual([(b["value"], b["count"], b["selected"]) for b in counts["brands"]],
+                         [("Acme", 1, True), ("Zen", 1, False)])
+        color = next(a for a in counts["attributes"] if a["key"] == "Color")
+        self.assertEqual([(v["value"], v["count"]) for v in color["values"]], [("Blue", 1), ("Red", 1)])
+        self.assertEqual([p["count"] for p in counts["prices"]], [1, 0, 0, 0])
+
+    def test_facet_counts_are_cached_until_the_catalog_changes(self):
+        filters = facets.parse_filters(QueryDict("brand=Acme"))
+        facets.counts(filters)
+        with self.assertNumQueries(0):
+            facets.counts(filters)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(user=self.seller, name="Pot", brand="Acme")
+        self.assertEqual(facets.counts(filters)["brands"][0], {"value": "Acme", "count": 3, "selected": True})
+
+
+class DatabaseProfileTests(TestCase):
+    def test_sqlite_connections_are_tuned_for_concurrent_writers(self):
+        if connection.vendor != "sqlite" or not connection.settings_dict["OPTIONS"]:
+            self.skipTest("SQLite tuning is off")
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], 20000)
+
+
+@override_settings(DATABASE_REPLICAS=["replica_1", "replica_2", "replica_3"])
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        self.router = replicas.ReplicaRouter()
+        healthy = mock.patch.object(replicas, "_healthy", side_effect=lambda alias: alias != "replica_2")
+        healthy.start()
+        self.addCleanup(healthy.stop)
+
+    def read_alias(self, request):
+        return replicas.read_only(lambda request: self.router.db_for_read(Product))(request)
+
+    def test_reads_rotate_over_healthy_replicas(self):
+        aliases = {self.read_alias(RequestFactory().get("/")) for _ in range(6)}
+        self.assertEqual(aliases, {"replica_1", "replica_3"})
+        self.assertIsNone(self.router.db_for_read(Product))  # outside a read-only view
+
+    def test_one_replica_per_request_until_it_writes(self):
+        with replicas.use_replicas():
+            first = self.router.db_for_read(Product)
+            self.assertEqual(self.router.db_for_read(Product), first)
+            self.assertIsNone(self.router.db_for_read(Session))
+            self.assertEqual(self.router.db_for_write(Product), "default")
+            self.assertEqual(self.router.db_for_read(Product), "default")
+
+    def test_cache_builders_read_from_the_primary(self):
+        def view(request):
+            return caching.get_or_build("replica-test", lambda: self.router.db_for_read(Product) or "default")
+        self.assertEqual(replicas.read_only(view)(RequestFactory().get("/")), "default")
+        self.assertIn(self.read_alias(RequestFactory().get("/")), {"replica_1", "replica_3"})
+
+    def test_visitor_is_pinned_to_the_primary_after_a_post(self):
+        response = self.client.post(reverse("cart-add"), {"product": "1"})
+        self.assertIn(replicas.PIN_COOKIE, response.cookies)
+        request = RequestFactory().get("/")
+        request.COOKIES[replicas.PIN_COOKIE] = "1"
+        self.assertIsNone(self.read_alias(request))
+        self.assertIsNone(self.read_alias(RequestFactory().post("/")))
+
+
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = CustomUser.objects.create_user(email="seller@grabit.com", password="pass12345")
+        StoreAccount.objects.create(
+            user=cls.seller, store_name="Seller Store", contact_no="9800000000", store_logo="Store_logo/logo.png"
+        )
+        cls.lamp = Product.objects.create(user=cls.seller, name="Lamp", brand="Acme", price=Decimal("800"))
+        cls.kettle = Product.objects.create(user=cls.seller, name="Kettle", brand="Zen", price=Decimal("300"))
+        ProductQuestion.objects.create(user=cls.seller, product=cls.lamp, question="Is it bright?")
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, view, path, *args, **headers):
+        request = RequestFactory().get(path, headers=headers)
+        request.user = AnonymousUser()
+        request.session = SessionStore()
+        request._messages = default_storage(request)
+        return async_to_sync(view)(request, *args) if iscoroutinefunction(view) else view(request, *args)
+
+    def test_pages_match_the_sync_views(self):
+        for name, args in (("home", ()), ("product", (self.lamp.id,)), ("productList", ())):
+            with self.subTest(name):
+                sync = self.get(getattr(views, name), "/", *args)
+                cache.clear()
+                response = self.get(getattr(async_views, name), "/", *args)
+                self.assertEqual(response.status_code, 200)
+                strip = lambda content: caching.CSRF_INPUT.sub(rb"\1\2", content)
+                self.assertEqual(strip(response.content), strip(sync.content))
+
+    def test_product_conditional_get_and_page_cache(self):
+        response = self.get(async_views.product, "/", self.lamp.id)
+        self.assertContains(response, "Is it bright?")
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                self.get(async_views.product, "/", self.lamp.id, if_none_match=response["ETag"]).status_code, 304
+            )
+        # version query, then the rendered page from the cache
+        with self.assertNumQueries(1):
+            self.assertContains(self.get(async_views.product, "/", self.lamp.id), "Is it bright?")
+        with self.assertRaises(Http404):
+            self.get(async_views.product, "/", 0)
+
+    def test_product_list_filters(self):
+        response = self.get(async_views.productList, "/?brand=Zen")
+        self.assertContains(response, "Kettle")
+        self.assertNotContains(response, "Lamp")
+
+
+class LoginTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(email="shopper@grabit.com", password="right-pass")
+
+    def login(self, email="shopper@grabit.com", password="wrong-pass", ip="10.0.0.1"):
+        return self.client.post(reverse("login"), {"email": email, "password": password}, REMOTE_ADDR=ip)
+
+    def test_old_hashes_are_upgraded_at_login(self):
+        self.user.password = make_password("right-pass", hasher="pbkdf2_sha256")
+        self.user.save(update_fields=["password"])
+        self.assertRedirects(self.login(password="right-pass"), reverse("home"), fetch_redirect_response=False)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith("scrypt$"))
+        self.assertFalse(get_hasher("scrypt").must_update(self.user.password))
+
+    def test_email_is_throttled_before_the_password_is_checked(self):
+        for _ in range(ratelimit.EMAIL_LIMIT[0]):
+            self.assertEqual(self.login().status_code, 200)
+        with mock.patch.object(ScryptPasswordHasher, "verify") as verify:
+            response = self.login(password="right-pass", ip="10.0.0.2")
+        self.assertEqual(response.status_code, 429)
+        verify.assert_not_called()
+        self.assertNotIn("_auth_user_id", self.client.session)
+
+    def test_ip_is_throttled_across_emails(self):
+        for i in range(ratelimit.IP_LIMIT[0]):
+            self.login(email=f"nobody{i}@grabit.com")
+        self.assertEqual(self.login(password="right-pass").status_code, 429)
+        self.assertEqual(self.login(password="right-pass", ip="10.0.0.2").status_code, 302)
+
+    @override_settings(TRUSTED_PROXIES=["10.0.0.0/8"])
+    def test_clients_behind_a_trusted_proxy_are_throttled_separately(self):
+        def login(client_ip, password="wrong-pass", email="shopper@grabit.com"):
+            return self.client.post(
+                reverse("login"), {"email": email, "password": password},
+                REMOTE_ADDR="10.0.0.1", HTTP_X_FORWARDED_FOR=f"{client_ip}, 10.0.0.5",
+            )
+
+        for i in range(ratelimit.IP_LIMIT[0]):
+            login("203.0.113.9", email=f"nobody{i}@grabit.com")
+        self.assertEqual(login("203.0.113.9", password="right-pass").status_code, 429)
+        self.assertEqual(login("198.51.100.7", password="right-pass").status_code, 302)
+
+    def test_forwarded_for_is_ignored_from_untrusted_peers(self):
+        request = RequestFactory().get("/", REMOTE_ADDR="203.0.113.9", HTTP_X_FORWARDED_FOR="198.51.100.7")
+        self.assertEqual(ratelimit.client_ip(request), "203.0.113.9")
+
+    def test_successful_login_clears_the_email_failures(self):
+        for _ in range(ratelimit.EMAIL_LIMIT[0] - 1):
+            self.login()
+        self.assertEqual(self.login(password="right-pass").status_code, 302)
+        self.client.logout()
+        for _ in range(ratelimit.EMAIL_LIMIT[0] - 1):
+            self.login()
+        self.assertEqual(self.login(password="right-pass").status_code, 302)
+
+
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = CustomUser.objects.create_user(email="seller@grabit.com", password="pass12345")
+        Product.objects.create(user=cls.seller, name="Lamp", brand="Acme")
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+
+    def test_server_timing_counts_the_requests_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("product-list"))
+        timing = response["Server-Timing"]
+        self.assertIn(f'desc="{len(queries)} queries"', timing)
+        self.assertRegex(timing, r"^db;dur=[\d.]+;desc=\"\d+ queries\", tpl;dur=[\d.]+, total;dur=[\d.]+$")
+
+    def test_prometheus_summaries_per_view(self):
+        for _ in range(3):
+            self.client.get(reverse("home"))
+        self.client.get(reverse("product-list"))
+        body = self.client.get(reverse("metrics")).content.decode()
+        self.assertIn("# TYPE grabit_request_seconds summary", body)
+        self.assertIn('grabit_request_seconds_count{view="home"} 3', body)
+        self.assertIn('grabit_db_queries_count{view="product-list"} 1', body)
+        self.assertIn('grabit_template_seconds{view="home",quantile="0.95"}', body)
+        self.assertNotIn('view="metrics"', body)
+
+    def test_metrics_are_private(self):
+        self.assertEqual(self.client.get(reverse("metrics"), REMOTE_ADDR="203.0.113.9").status_code, 403)
+
+    @override_settings(TRUSTED_PROXIES=["127.0.0.1"])
+    def test_metrics_stay_private_behind_a_local_proxy(self):
+        url = reverse("metrics")
+        self.assertEqual(self.client.get(url, HTTP_X_FORWARDED_FOR="203.0.113.9").status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_X_FORWARDED_FOR="127.0.0.1").status_code, 200)
+
+    @override_settings(SLOW_QUERY_MS=0)
+    def test_slow_queries_are_logged_with_sql_and_stack(self):
+        with self.assertLogs("grabit_app.slow_queries", "WARNING") as logs:
+            self.client.get(reverse("product-list"))
+        self.assertIn("in product-list", logs.output[0])
+        self.assertTrue(any("grabit_app_product" in line and "views.py" in line for line in logs.output))
+
+
+class BenchmarkTests(TestCase):
+    def test_seed_then_benchmark_against_a_baseline(self):
+        call_command("seed_catalog", products=40, sellers=3, shoppers=60, categories=6, batch_size=15, stdout=StringIO())
+        self.assertEqual(Product.objects.count(), 40)
+        self.assertEqual(ProductImage.objects.filter(is_primary=True).count(), 40)
+        self.assertTrue(Product.objects.filter(rating_count__gt=0).exists())
+
+        baseline = os.path.join(tempfile.mkdtemp(), "baseline.json")
+        bench = dict(requests=3, concurrency=1, warmup=0, stdout=StringIO())
+        call_command("benchmark_storefront", save_baseline=baseline, **bench)
+        with open(baseline) as f:
+            recorded = json.load(f)["scenarios"]
+        self.assertEqual(recorded["productForm"]["errors"], 0)
+        self.assertGreater(recorded["login"]["queries"], 0)
+
+        recorded["product"]["queries"] = 0
+        with open(baseline, "w") as f:
+            json.dump({"meta": {}, "scenarios": recorded}, f)
+        with self.assertRaisesMessage(CommandError, "product:"):
+            call_command("benchmark_storefront", compare=baseline, tolerance=100, **bench)
+
+    def test_reseeding_with_flush_replaces_the_seed(self):
+        seed = dict(products=20, sellers=3, shoppers=10, categories=10, stdout=StringIO())
+        call_command("seed_catalog", **seed)
+        with self.assertRaisesMessage(CommandError, "already seeded"):
+            call_command("seed_catalog", **seed)
+        call_command("seed_catalog", flush=True, **seed)
+        self.assertEqual(Product.objects.count(), 20)
+        self.assertEqual(CustomUser.objects.count(), 13)
+        self.assertEqual(Category.objects.count(), 10)
+
+
+STATIC_SOURCE = tempfile.mkdtemp()
+
+
+@override_settings(
+    SERVE_STATIC=True, STATIC_ROOT=tempfile.mkdtemp(), STATICFILES_DIRS=[STATIC_SOURCE],
+    STATICFILES_FINDERS=["django.contrib.staticfiles.finders.FileSystemFinder"],
+)
+class StaticAssetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        os.makedirs(os.path.join(STATIC_SOURCE, "styles"), exist_ok=True)
+        os.makedirs(os.path.join(STATIC_SOURCE, "images"), exist_ok=True)
+        with open(os.path.join(STATIC_SOURCE, "styles", "site.css"), "w") as f:
+            f.write(".deal { color: #e44; }\n" * 200)
+        Image.frombytes("RGB", (128, 128), os.urandom(128 * 128 * 3)).save(
+            os.path.join(STATIC_SOURCE, "images", "banner.png")
+        )
+        call_command("collectstatic", interactive=False, verbosity=0)
+
+    def get(self, name, **headers):
+        from django.contrib.staticfiles.storage import staticfiles_storage
+        return self.client.get("/static/" + staticfiles_storage.url(name).split("/static/", 1)[1], headers=headers)
+
+    def test_hashed_css_is_compressed_and_immutable(self):
+        response = self.get("styles/site.css", accept_encoding="gzip, deflate")
+        self.assertRegex(response["Content-Type"], "^text/css")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertIn(b".deal", gzip.decompress(b"".join(response.streaming_content)))
+
+        plain = self.get("styles/site.css", accept_encoding="identity")
+        self.assertFalse(plain.has_header("Content-Encoding"))
+
+    def test_conditional_requests_get_304(self):
+        etag = self.get("styles/site.css")["ETag"]
+        response = self.get("styles/site.css", if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertIn("immutable", response["Cache-Control"])
+
+    def test_png_is_negotiated_to_webp(self):
+        response = self.get("images/banner.png", accept="image/webp,image/*;q=0.8")
+        self.assertEqual(response["Content-Type"], "image/webp")
+        self.assertIn("Accept", response["Vary"])
+        self.assertEqual(self.get("images/banner.png", accept="image/png")["Content-Type"], "image/png")
+
+    def test_unhashed_names_are_revalidated_and_paths_stay_inside_static_root(self):
+        response = self.client.get("/static/styles/site.css")
+        self.assertNotIn("immutable", response["Cache-Control"])
+        self.assertEqual(self.client.get("/static/../settings.py").status_code, 404)
+
+    @override_settings(SERVE_STATIC=False)
+    def test_nothing_is_served_when_the_front_end_serves_static_files(self):
+        self.assertEqual(self.get("styles/site.css").status_code, 404)
+
+
+class QueryPlanTests(TestCase):
+    def test_every_view_query_uses_an_index(self):
+        out = StringIO()
+        call_command("explain_queries", stdout=out)
+        self.assertNotIn("FAIL", out.getvalue())
@@ -1,17 +1,33 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# The catalog pages have async versions for ASGI deployments (see Grabit/asgi.py).
+catalog = async_views if settings.ASYNC_CATALOG_VIEWS else views
 
 urlpatterns = [
-    path('', views.home, name='home'),
+    path('', catalog.home, name='home'),
 
     path('login/', views.loginPage, name="login"),
     path('register/', views.registerPage, name="register"),
     path('logout/', views.logoutPage, name="logout"),
 
     path('add-new-product/', views.productForm, name="product-form"),
+    path('import-products/', views.productImport, name="product-import"),
 
     path('seller-account-<str:pk>', views.sellerAccount, name="seller-account"),
 
-    path('product-<str:pk>', views.product, name="product"),
-    path('product-list/', views.productList, name="product-list"),
+    path('product-<str:pk>', catalog.product, name="product"),
+    path('product-<int:pk>/questions/', views.productQuestions, name="product-questions"),
+    path('questions/<int:pk>/answers/', views.questionAnswers, name="question-answers"),
+    path('product-list/', catalog.productList, name="product-list"),
+    path('category-<int:pk>/', views.categoryProducts, name="category"),
+
+    path('cart/add/', views.cartAdd, name="cart-add"),
+    path('cart/update/', views.cartUpdate, name="cart-update"),
+    path('cart/remove/', views.cartRemove, name="cart-remove"),
+    path('checkout/', views.checkout, name="checkout"),
+    path('orders/<int:pk>/cancel/', views.orderCancel, name="order-cancel"),
+
+    path('metrics/', views.prometheusMetrics, name="metrics"),
 ]
\ No newline at end of file
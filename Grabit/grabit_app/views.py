@@ -3,16 +3,41 @@ from .models import *
 from django.contrib.auth import login, authenticate, logout, get_user_model
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q
-from decimal import Decimal
 from django.urls import reverse
+from .search import get_backend
+from . import caching
+from . import cart
+from . import catalog
+from . import categories
+from . import facets
+from . import metrics
+from . import orders
+from . import queries
+from . import ratelimit
+from . import replicas
+import hashlib
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse
+from django.views.decorators.http import condition, require_POST
+from .pagination import page_size, decode_cursor, encode_cursor, keyset_page
 
 User = get_user_model()
 
+SEARCH_FILTER_ROUNDS = 5
+MAX_SEARCH_BATCH = 500
+
+@replicas.read_only
+@caching.anonymous_page((caching.CATEGORY_TREE,) + caching.HOME_DEAL_RAILS)
 def home(request):
-    category = Category.objects.all().order_by('c_name')
-    discount_deals = Product.objects.all().order_by('discount_percent')[:5]
-    latest_deals = Product.objects.all().order_by('created_at')[:5]
+    category = categories.tree()
+    discount_deals = caching.get_or_build(
+        caching.HOME_DISCOUNT_DEALS,
+        lambda: list(queries.home_discount_deals()),
+    )
+    latest_deals = caching.get_or_build(
+        caching.HOME_LATEST_DEALS,
+        lambda: list(queries.home_latest_deals()),
+    )
 
     context = {'discount_deals': discount_deals, 'latest_deals': latest_deals, 'category': category}
     return render(request, "main/home.html", context)
@@ -31,6 +56,9 @@ def loginPage(request):
             login(request, user)
             messages.success(request, 'Login Successful!')
             return redirect('home')
+        elif getattr(request, 'login_throttled', False):
+            messages.error(request, 'Too many failed logins. Please try again in a few minutes.')
+            return render(request, 'main/login.html', {}, status=429)
         else: 
             messages.error(request, 'Email or Password is incorrect! Please try again.')
     
@@ -81,62 +109,95 @@ def logoutPage(request):
     return redirect('home')
 
 @login_required(login_url='login')
+@replicas.read_only
 def sellerAccount(request, pk):
-    seller_act = StoreAccount.objects.filter(user__id = pk).first()
-    product = Product.objects.filter(user = seller_act.user)
-    return render(request, "main/seller-account.html", {"seller_act": seller_act, "prodect": product})
+    seller_act = StoreAccount.objects.select_related('user').filter(user__id = pk).first()
+    products, next_cursor = keyset_page(
+        queries.seller_products(seller_act.user_id),
+        queries.NEWEST_FIRST,
+        decode_cursor(request.GET.get('cursor')),
+        page_size(request),
+    )
+    context = {"seller_act": seller_act, "products": products, "next_cursor": next_cursor}
+    return render(request, "main/seller-account.html", context)
 
 @login_required(login_url='login')
 def productForm(request):
     if request.method == 'POST':
         try:
-            discount_percent = Decimal(request.POST.get('discount') or 0)
-            price = Decimal(request.POST.get('price') or 0)
-
-            if discount_percent > 0:
-                old_price = price
-                discount_amt = (old_price * discount_percent) / Decimal(100)
-                price = old_price - discount_amt
-            else:
-                old_price = price
-
-            features = request.POST.getlist("feature[]")
-            values = request.POST.getlist("value[]")
-
-            desc = dict(zip(features, values))
-
-            product = Product.objects.create(
-                user=request.user,
+            catalog.create_product(
+                request.user,
+                request.FILES.getlist('images'),
                 name=request.POST.get('p_name'),
-                price = price,
-                old_price = old_price,
-                description=desc,
-                discount_percent = discount_percent,
-                brand=request.POST.get('brand')
+                price=request.POST.get('price'),
+                discount=request.POST.get('discount'),
+                brand=request.POST.get('brand'),
+                description=dict(zip(request.POST.getlist("feature[]"), request.POST.getlist("value[]"))),
+                category_ids=request.POST.getlist("categories"),
+                stock=request.POST.get('stock'),
             )
-
-            files = request.FILES.getlist('images')
-            if not files:
-                messages.warning(request, "Upload at least 1 image")
-                return render(request, 'main/product-form.html')
-
-            for image in files:
-                ProductImage.objects.create(product=product, image=image)
             messages.success(request, "Product added successfully.")
             return redirect('home')
 
         except Exception as e:
-            messages.error(request, "Error while adding product: {e}")
-            return render(request, 'main/product-form.html')
+            messages.error(request, f"Error while adding product: {e}")
+            return render(request, 'main/product-form.html', {'category': categories.tree()})
+
+    return render(request, 'main/product-form.html', {'category': categories.tree()})
+
+@login_required(login_url='login')
+def productImport(request):
+    if request.method == 'POST':
+        upload = request.FILES.get('file')
+        fmt = catalog.import_format(upload.name) if upload else None
+        if fmt is None:
+            messages.error(request, "Upload a .csv or .jsonl file.")
+            return redirect('product-form')
 
-    return render(request, 'main/product-form.html')
+        created, errors = catalog.import_products(request.user, catalog.read_rows(upload, fmt))
+        messages.success(request, f"Imported {created} products.")
+        if errors:
+            shown = "; ".join(f"row {row}: {error}" for row, error in errors[:5])
+            messages.warning(request, f"Skipped {len(errors)} rows ({shown}{'; ...' if len(errors) > 5 else ''})")
+    return redirect('product-form')
 
+def _product_version(request, pk):
+    # Memoised on the request: the ETag and Last-Modified functions both need it.
+    if not hasattr(request, '_product_version'):
+        request._product_version = queries.product_version(pk).first()
+    return request._product_version
+
+def _product_last_modified(request, pk):
+    version = _product_version(request, pk)
+    if version is None or messages.get_messages(request):
+        # As for the ETag: an If-Modified-Since alone must not 304 over pending messages. The
+        # viewer and cart badge aren't in this date, so the ETag is what catches their changes.
+        return None
+    return max(filter(None, [
+        version['updated_at'], version['image_updated'], version['question_created'], version['answer_created'],
+    ]))
+
+def _product_etag(request, pk):
+    version = _product_version(request, pk)
+    if version is None or messages.get_messages(request):
+        # Pending flash messages have to be rendered, so never answer 304 over them.
+        return None
+    # The page also shows who is logged in and their cart badge.
+    if request.user.is_authenticated:
+        viewer = f"{request.user.pk}:{caching.cart_count(request.user.pk)}"
+    else:
+        viewer = f"anon:{len(cart.session_items(request.session))}"
+    raw = "|".join(str(value) for value in version.values()) + "|" + viewer
+    return hashlib.md5(raw.encode()).hexdigest()
+
+@replicas.read_only
+@condition(etag_func=_product_etag, last_modified_func=_product_last_modified)
+@caching.anonymous_page(lambda request, pk: (caching.product_page(pk),))
 def product(request, pk):
-    product = Product.objects.get(id=pk)
-    product_imgs = ProductImage.objects.filter(product=product)
-    store = StoreAccount.objects.get(user = product.user)
-    questions = ProductQuestion.objects.filter(product = product)
-    
+    product = queries.product_detail(pk).first()
+    if product is None:
+        raise Http404("Product not found")
+
     if request.method == "POST":
         if request.user.is_authenticated:
             try:
@@ -146,19 +207,232 @@ def product(request, pk):
                     question = request.POST.get('question')
                 )
             except Exception as e:
-                messages.error(request, "Error while adding question: {e}")
-                return render(request, "main/product.html")
+                messages.error(request, f"Error while adding question: {e}")
         else:
             messages.error(request, "You must be logged in to ask a question.")
             return redirect('login')
         return redirect(reverse("product", args=[pk]))
-    context = {'product': product, 'product_imgs': product_imgs, 'store': store, 'questions': questions}
+
+    # Only the newest page is rendered; the rest load from productQuestions on demand.
+    questions, next_questions = keyset_page(
+        queries.product_questions(pk), queries.NEWEST_FIRST, None, page_size(request)
+    )
+    context = {
+        'product': product,
+        'product_imgs': product.productimage_set.all(),
+        'store': product.user.storeaccount,
+        'questions': questions,
+        'next_questions': next_questions,
+    }
     return render(request, "main/product.html", context)
 
-def productList(request):
+def _question_json(question):
+    return {
+        'id': question.id,
+        'user': question.user.first_name,
+        'question': question.question,
+        'created_at': question.created_at.isoformat(),
+        'answer_count': question.answer_count,
+    }
+
+def _answer_json(answer):
+    return {
+        'id': answer.id,
+        'parent': answer.parent_id,
+        'user': answer.user.first_name,
+        'answer': answer.answer,
+        'is_seller': answer.is_seller,
+        'created_at': answer.created_at.isoformat(),
+    }
+
+def productQuestions(request, pk):
+    questions, next_cursor = keyset_page(
+        queries.product_questions(pk), queries.NEWEST_FIRST, decode_cursor(request.GET.get('cursor')), page_size(request)
+    )
+    return JsonResponse({'questions': [_question_json(q) for q in questions], 'next': next_cursor})
+
+def questionAnswers(request, pk):
+    """
+    GET: the answers to a question, oldest first, as a flat list; each answer names its `parent`
+    so the client can nest replies. POST: answer the question, or reply to one of its answers.
+    """
+    question = ProductQuestion.objects.select_related('product').filter(id=pk).first()
+    if question is None:
+        raise Http404("Question not found")
+
+    if request.method == "POST":
+        if not request.user.is_authenticated:
+            return _json_or_redirect_error(request, question, "You must be logged in to answer.", status=403)
+        parent_id = request.POST.get('parent') or None
+        text = (request.POST.get('answer') or '').strip()
+        if not text:
+            return _json_or_redirect_error(request, question, "Answer can't be empty.")
+        if parent_id is not None and not parent_id.isdigit():
+            return _json_or_redirect_error(request, question, "Can only reply to an answer on the same question.")
+        if parent_id and not ProductAnswer.objects.filter(id=parent_id, question=question).exists():
+            return _json_or_redirect_error(request, question, "Can only reply to an answer on the same question.")
+        answer = ProductAnswer.objects.create(
+            question=question,
+            parent_id=parent_id,
+            user=request.user,
+            answer=text,
+            is_seller=question.product.user_id == request.user.pk,
+        )
+        if _wants_json(request):
+            return JsonResponse(_answer_json(answer), status=201)
+        return redirect(reverse("product", args=[question.product_id]))
+
+    answers, next_cursor = keyset_page(
+        queries.question_answers(pk), queries.OLDEST_FIRST, decode_cursor(request.GET.get('cursor')), page_size(request)
+    )
+    return JsonResponse({'answers': [_answer_json(a) for a in answers], 'next': next_cursor})
+
+def _wants_json(request):
+    # Browsers send */* too, so ask which one the client prefers rather than whether JSON is acceptable.
+    return request.get_preferred_type(['text/html', 'application/json']) == 'application/json'
+
+def _json_or_redirect_error(request, question, error, status=400):
+    if _wants_json(request):
+        return JsonResponse({'error': error}, status=status)
+    messages.error(request, error)
+    return redirect(reverse("product", args=[question.product_id]))
+
+def _listing_params(request):
     q = request.GET.get('q') if request.GET.get('q') else ''
-    products = Product.objects.filter(
-        Q(name__icontains=q) | 
-        Q(description__icontains=q)
+    sort = request.GET.get('sort') if request.GET.get('sort') in queries.LISTING_ORDERINGS else 'newest'
+    return q, sort, page_size(request), decode_cursor(request.GET.get('cursor')), facets.parse_filters(request.GET)
+
+def _search_results(listing, q, after, size):
+    """
+    One page of search hits that are also in `listing` (the facet-filtered products). Hits come
+    in rank order, so the cursor carries the (score, id) of the last one. Filtered-out hits are
+    skipped by reading further batches until the page is full, up to SEARCH_FILTER_ROUNDS
+    batches; a page cut short there still gets a cursor to resume from.
+    """
+    backend, found, batch = get_backend(), [], size + 1
+    for _ in range(SEARCH_FILTER_ROUNDS):
+        hits = backend.search_page(q, limit=batch, after=after)
+        in_listing = listing.in_bulk([product_id for product_id, _ in hits])
+        found += [(in_listing[product_id], key) for product_id, key in hits if product_id in in_listing]
+        if len(found) > size or len(hits) < batch:
+            break
+        after = hits[-1][1]
+        batch = min(batch * 2, MAX_SEARCH_BATCH)
+    else:
+        return [product for product, _ in found], encode_cursor(after)
+    next_cursor = encode_cursor(found[size - 1][1]) if len(found) > size else None
+    return [product for product, _ in found[:size]], next_cursor
+
+def _listing_context(request, q, sort, size, filters, products, next_cursor, facet_counts):
+    filter_query = request.GET.copy()
+    filter_query.pop('cursor', None)
+    return {
+        "products": products, "query": q, "next_cursor": next_cursor, "size": size,
+        "sort": sort, "filters": filters, "facets": facet_counts, "filter_query": filter_query.urlencode(),
+    }
+
+@replicas.read_only
+@caching.anonymous_page((caching.CATALOG,))
+def productList(request):
+    q, sort, size, after, filters = _listing_params(request)
+    listing = facets.apply(queries.product_listing(), filters)
+
+    if q:
+        products, next_cursor = _search_results(listing, q, after, size)
+    else:
+        products, next_cursor = keyset_page(listing, queries.LISTING_ORDERINGS[sort], after, size)
+
+    context = _listing_context(request, q, sort, size, filters, products, next_cursor, facets.counts(filters))
+    return render(request, "main/product-list.html", context)
+
+@caching.anonymous_page((caching.CATALOG, caching.CATEGORY_TREE))
+def categoryProducts(request, pk):
+    category = Category.objects.filter(id=pk).first()
+    if category is None:
+        raise Http404("Category not found")
+    size = page_size(request)
+    memberships, next_cursor = keyset_page(
+        queries.category_memberships(category.id), queries.CATEGORY_ORDER,
+        decode_cursor(request.GET.get('cursor')), size,
     )
-    return render(request, "main/product-list.html", {"products": products, "query": q})
\ No newline at end of file
+    ids = [membership.product_id for membership in memberships]
+    found = queries.product_listing().in_bulk(ids)
+
+    context = {
+        "products": [found[i] for i in ids if i in found], "next_cursor": next_cursor, "size": size,
+        "category": category, "breadcrumbs": categories.breadcrumbs(category.id),
+        # product_count is maintained on write, so these facet counts cost no COUNT query.
+        "subcategories": queries.subcategories(category.id),
+    }
+    return render(request, "main/product-list.html", context)
+
+def _cart_response(request, message):
+    if request.content_type == 'application/json':
+        if request.user.is_authenticated:
+            items = dict(queries.cart_items(request.user.pk).values_list('product_id', 'quantity'))
+        else:
+            items = cart.session_items(request.session)
+        return JsonResponse({'items': {str(pid): qty for pid, qty in items.items()}, 'cart_count': len(items)})
+    messages.success(request, message)
+    return redirect(request.META.get('HTTP_REFERER') or 'home')
+
+def _cart_error(request, error):
+    if request.content_type == 'application/json':
+        return JsonResponse({'error': str(error)}, status=400)
+    messages.error(request, str(error))
+    return redirect(request.META.get('HTTP_REFERER') or 'home')
+
+@require_POST
+def cartAdd(request):
+    try:
+        cart.add(request, cart.parse_items(request))
+    except ValueError as e:
+        return _cart_error(request, e)
+    return _cart_response(request, "Added to cart.")
+
+@require_POST
+def cartUpdate(request):
+    try:
+        cart.update(request, cart.parse_items(request))
+    except ValueError as e:
+        return _cart_error(request, e)
+    return _cart_response(request, "Cart updated.")
+
+@require_POST
+def cartRemove(request):
+    try:
+        product_ids = list(cart.parse_items(request))
+    except ValueError as e:
+        return _cart_error(request, e)
+    cart.remove(request, product_ids)
+    return _cart_response(request, "Removed from cart.")
+
+@require_POST
+@login_required(login_url='login')
+def checkout(request):
+    try:
+        order = orders.checkout(request.user)
+    except ValueError as e:
+        return _cart_error(request, e)
+    if request.content_type == 'application/json':
+        return JsonResponse({'order': order.pk, 'total': str(order.total), 'cart_count': 0})
+    messages.success(request, f"Order #{order.pk} placed.")
+    return redirect('home')
+
+@require_POST
+@login_required(login_url='login')
+def orderCancel(request, pk):
+    order = Order.objects.filter(pk=pk, user=request.user).first()
+    if order is None:
+        raise Http404("Order not found")
+    if orders.cancel(order):
+        messages.success(request, f"Order #{order.pk} cancelled.")
+    else:
+        messages.error(request, f"Order #{order.pk} can no longer be cancelled.")
+    return redirect(request.META.get('HTTP_REFERER') or 'home')
+
+def prometheusMetrics(request):
+    """Per-view request metrics in the Prometheus text format, for the scraper or staff."""
+    if not (request.user.is_staff or ratelimit.client_ip(request) in settings.METRICS_ALLOWED_IPS):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render_prometheus(), content_type='text/plain; version=0.0.4')